@@ -24,11 +24,106 @@ ALLOWED_HOSTS = ["*"]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "mini.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "mini.throttling.TokenBucketThrottle",
+    ],
+    # Число доверенных прокси перед приложением: адрес клиента для троттлинга
+    # берется из X-Forwarded-For только за ними, при 0 - из REMOTE_ADDR
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
+}
+
+# Троттлинг (token bucket) по throttle_scope представления: бакеты "user", "ip" и
+# "phone" (телефон из тела запроса вместе с адресом), лимит "N/период" - емкость N,
+# пополнение N токенов за период. ALIAS - алиас из CACHES для общих лимитов
+# нескольких воркеров, None - бакеты в памяти процесса. За прокси без NUM_PROXIES
+# все клиенты делят один адрес, поэтому лимит входа по IP - только защита от перебора
+THROTTLING = {
+    "ENABLED": True,
+    "ALIAS": None,
+    "MAX_KEYS": 100000,
+    "RATES": {
+        "login": {"phone": "10/min", "ip": "600/min"},
+        "submit": {"user": "30/min", "ip": "300/min"},
+        "submit-batch": {"user": "20/min"},
+        "purchase": {"user": "10/min", "ip": "120/min"},
+    },
+}
+
+# Буфер просмотров мероприятий: сброс в БД по интервалу (сек) или порогу;
+# BACKGROUND_FLUSH - интервал отслеживает фоновый поток, а не только новые просмотры
+VIEW_COUNTER = {
+    "FLUSH_INTERVAL": 5,
+    "FLUSH_THRESHOLD": 500,
+    "BACKGROUND_FLUSH": True,
+}
+
+# Рейтинг студентов: период перестроения индекса процесса и TTL оконных рейтингов (сек)
+LEADERBOARD = {
+    "REFRESH_INTERVAL": 300,
+    "WINDOW_TTL": 60,
+}
+
+# Покупка мерча: direct - каждый запрос сам списывает остаток, queued - очередь
+# в порядке поступления, auto - очередь при CONTENTION_THRESHOLD одновременных заказах
+MERCH_ALLOCATION = {
+    "MODE": "auto",
+    "CONTENTION_THRESHOLD": 8,
+    "TIMEOUT": 10,
+}
+
+# Кеш содержимого StartEventView: алиас из CACHES (locmem по умолчанию,
+# для нескольких воркеров - общий бэкенд) и TTL записей (сек)
+START_PAYLOAD_CACHE = {
+    "ALIAS": "default",
+    "TIMEOUT": 3600,
+}
+
+# Условные GET каталогов (мероприятия, мерч): алиас из CACHES для версий таблиц
+# и готовых ответов (для нескольких воркеров - общий бэкенд) и TTL ответов (сек)
+CATALOG_CACHE = {
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+}
+
+# Быстрые сериализаторы списков (строки .values() вместо моделей DRF);
+# False - вернуться к обычным сериализаторам
+FAST_SERIALIZERS = {
+    "ENABLED": True,
+}
+
+# Замеры запросов: заголовок Server-Timing и токен для /api/metrics/
+# (без токена эндпоинт отвечает 404)
+INSTRUMENTATION = {
+    "SERVER_TIMING": True,
+    "METRICS_TOKEN": os.getenv("METRICS_TOKEN"),
+}
+
+# Аутентификация по claims токена: TTL (сек) и размер кеша строк пользователей процесса,
+# алиас из CACHES для текущих claims пользователей (отзыв токенов). TTL действует и
+# на claims: с locmem отзыв доходит до других воркеров не позже чем через него,
+# для мгновенного отзыва на нескольких воркерах нужен общий бэкенд
+CLAIMS_AUTH = {
+    "USER_CACHE_TTL": 30,
+    "USER_CACHE_SIZE": 10000,
+    "STATE_ALIAS": "default",
+}
+
+# QR-чекин: срок жизни токена по умолчанию и максимальный (сек)
+CHECKIN = {
+    "TOKEN_TTL": 300,
+    "MAX_TOKEN_TTL": 7 * 24 * 3600,
+}
+
+# Ключи Idempotency-Key: сколько хранится ответ и через сколько секунд
+# незавершенный запрос считается брошенным
+IDEMPOTENCY = {
+    "TTL": 24 * 3600,
+    "IN_PROGRESS_TIMEOUT": 60,
 }
 
 SIMPLE_JWT = {
@@ -51,6 +146,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mini.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,11 +181,67 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Постоянные соединения: CONN_MAX_AGE держит соединение потока воркера открытым
+# между запросами, CONN_HEALTH_CHECKS проверяет его перед повторным использованием
+CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+if os.getenv('DB_ENGINE') == 'postgresql':
+    def postgres(host, port):
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'shorthack'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': port,
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+
+    DATABASES = {
+        'default': postgres(os.getenv('DB_HOST', 'localhost'), os.getenv('DB_PORT', '5432')),
+    }
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = postgres(os.getenv('DB_REPLICA_HOST'), os.getenv('DB_REPLICA_PORT', '5432'))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # IMMEDIATE-транзакции и ожидание блокировки вместо "database is locked"
+            # при конкурентных начислениях/списаниях баллов
+            'OPTIONS': {
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Файловая тестовая БД, чтобы стресс-тесты могли работать из нескольких потоков
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
     }
+    # Локальная "реплика" - копия файла БД (manage.py sync_sqlite_replica)
+    if os.getenv('DB_REPLICA_PATH'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_REPLICA_PATH'),
+            'OPTIONS': {'timeout': 20},
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+
+if 'replica' in DATABASES:
+    # В тестах реплика указывает на тестовую основную БД
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Чтения аналитики и других эндпоинтов только для чтения - с реплики, пока она доступна
+DATABASE_ROUTERS = ['mini.db_router.ReadReplicaRouter']
+READ_REPLICA = {
+    "ALIAS": "replica",
+    "HEALTH_CHECK_INTERVAL": 5,
+    "RETRY_INTERVAL": 30,
 }
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -0,0 +1,48 @@
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import CustomUser
+
+
+def normalize_phone(raw):
+    """Оставляет только цифры и убирает 7 / 8 в начале; None, если номер короче 10 цифр"""
+    digits = ''.join(filter(str.isdigit, raw or ''))
+    if len(digits) < 10:
+        return None
+    if digits[0] in '78':
+        digits = digits[1:]
+    return digits
+
+
+def get_or_create_student(phone):
+    """
+    Вход по телефону: существующий пользователь читается одним запросом по
+    уникальному индексу phone, новый создается одним INSERT (пароль сразу
+    неиспользуемый, без второго save). При гонке двух входов с одним номером
+    проигравший INSERT падает на уникальности phone, и пользователь
+    перечитывается тем же индексным запросом. Возвращает (user, created).
+    """
+    # Профиль нужен для claims токена, поэтому читаем его тем же запросом
+    user = CustomUser.objects.select_related('student_profile').filter(phone=phone).first()
+    if user is not None:
+        return user, False
+
+    usernames = (f"user_{phone}", f"user_{phone}_{int(timezone.now().timestamp())}")
+    for username in usernames:
+        try:
+            with transaction.atomic():
+                user = CustomUser.objects.create(
+                    username=username,
+                    email=f"{username}@x5.ru",
+                    password=make_password(None),
+                    phone=phone,
+                    user_type='STUDENT'
+                )
+            return user, True
+        except IntegrityError:
+            user = CustomUser.objects.filter(phone=phone).first()
+            if user is not None:
+                return user, False
+            # Номер свободен, значит занят username - пробуем запасной
+    raise IntegrityError(f"Не удалось создать пользователя с телефоном {phone}")
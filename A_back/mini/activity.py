@@ -0,0 +1,77 @@
+import base64
+import binascii
+import heapq
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import EventParticipation, Feedback, PointTransaction
+
+# (тип записи, модель, поле времени, отдаваемые поля). Порядок задает
+# очередность записей с одинаковым временем.
+SOURCES = (
+    ('participation', EventParticipation, 'first_viewed',
+     ('id', 'event_id', 'event__title', 'completed', 'score', 'completed_at')),
+    ('feedback', Feedback, 'created_at',
+     ('id', 'event_id', 'event__title', 'rating', 'comment')),
+    ('transaction', PointTransaction, 'timestamp',
+     ('id', 'event_id', 'points', 'transaction_type', 'description', 'balance_after')),
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position):
+    timestamp, rank, record_id = position
+    raw = f"{timestamp.isoformat()}|{rank}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, rank, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        position = (parse_datetime(timestamp), int(rank), int(record_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    if position[0] is None:
+        raise InvalidCursor('Invalid cursor')
+    return position
+
+
+def _older_than(rank, time_field, position):
+    """Условие "запись источника rank идет после позиции курсора" (лента - новые сначала)"""
+    timestamp, cursor_rank, record_id = position
+    if rank < cursor_rank:
+        return Q(**{f'{time_field}__lte': timestamp})
+    if rank > cursor_rank:
+        return Q(**{f'{time_field}__lt': timestamp})
+    return Q(**{f'{time_field}__lt': timestamp}) | Q(**{time_field: timestamp, 'id__lt': record_id})
+
+
+def get_page(student_id, cursor=None, limit=50):
+    """
+    Страница ленты активности студента: участия, отзывы и операции с баллами
+    вперемешку по времени. Из каждого источника берется не больше limit + 1
+    записей по индексу (student, время, id) после курсора, поэтому стоимость
+    страницы - три коротких запроса независимо от длины истории.
+    Возвращает (записи, курсор следующей страницы или None).
+    """
+    position = decode_cursor(cursor) if cursor else None
+    streams = []
+    for rank, (kind, model, time_field, fields) in enumerate(SOURCES):
+        queryset = model.objects.filter(student_id=student_id)
+        if position is not None:
+            queryset = queryset.filter(_older_than(rank, time_field, position))
+        rows = queryset.order_by(f'-{time_field}', '-id').values(time_field, *fields)[:limit + 1]
+        stream = []
+        for row in rows:
+            timestamp = row.pop(time_field)
+            stream.append(((timestamp, rank, row['id']), {'type': kind, 'timestamp': timestamp, **row}))
+        streams.append(stream)
+
+    merged = list(heapq.merge(*streams, key=lambda item: item[0], reverse=True))
+    page = merged[:limit]
+    next_cursor = encode_cursor(page[-1][0]) if len(merged) > limit else None
+    return [item for _, item in page], next_cursor
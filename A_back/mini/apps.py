@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class MiniConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'mini'
\ No newline at end of file
+    name = 'mini'
+
+    def ready(self):
+        # Подключаем обработчики сигналов сервисных модулей
+        from . import grading, rollups, content_cache, catalog_cache, authentication  # noqa: F401
@@ -0,0 +1,139 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .authentication import ClaimsJWTAuthentication
+from .content_cache import start_payload_cache
+from .counters import view_counter
+from .db_router import replica_reads
+from .idempotency import idempotent
+from .models import Event, EventParticipation, Quiz
+from .pagination import EventCursorPagination
+from .serializers import EventSerializer, EventListSerializer
+from .throttling import TokenBucketThrottle
+from .submissions import grade_and_record
+from .views import StartEventView
+
+
+class AsyncAPIView(View):
+    """
+    Базовый класс асинхронных эндпоинтов под ASGI (DRF не поддерживает
+    async-обработчики). Аутентификация и троттлинг - теми же ClaimsJWTAuthentication
+    и TokenBucketThrottle, тело запроса - JSON или форма, ответ рендерится
+    JSONRenderer DRF, поэтому формат совпадает с синхронными представлениями байт в байт.
+    """
+
+    authentication = ClaimsJWTAuthentication()
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как и в APIView: аутентификация по токену, а не по сессии, CSRF не нужен
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return await self.http_method_not_allowed(request, *args, **kwargs)
+        try:
+            request.user = await self.authenticate(request)
+        except AuthenticationFailed as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return self.respond(detail, status=401)
+        if request.user is None:
+            return self.respond({'detail': 'Authentication credentials were not provided.'}, status=401)
+        throttle = TokenBucketThrottle()
+        if not throttle.allow_request(request, self):
+            wait = math.ceil(throttle.wait())
+            response = self.respond({'detail': f'Request was throttled. Expected available in {wait} seconds.'}, status=429)
+            response['Retry-After'] = str(wait)
+            return response
+        if request.content_type == 'application/json' and request.body:
+            try:
+                request.data = json.loads(request.body)
+            except ValueError as e:
+                return self.respond({'detail': f'JSON parse error - {e}'}, status=400)
+        else:
+            request.data = request.POST
+        return await handler(request, *args, **kwargs)
+
+    async def authenticate(self, request):
+        header = self.authentication.get_header(request)
+        raw_token = self.authentication.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        validated_token = self.authentication.get_validated_token(raw_token)
+        return await self.authentication.aget_user(validated_token)
+
+    def respond(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), status=status, content_type='application/json')
+
+
+class AsyncEventListView(AsyncAPIView):
+    http_method_names = ['get']
+
+    async def get(self, request):
+        paginator = EventCursorPagination()
+        # Пагинатор DRF сам выполняет запрос страницы, поэтому вызывается в потоке
+        with replica_reads():
+            page = await sync_to_async(paginator.paginate_queryset)(
+                Event.objects.filter(is_active=True), Request(request)
+            )
+        return self.respond(paginator.get_paginated_response(EventListSerializer(page, many=True).data).data)
+
+
+class AsyncEventDetailView(AsyncAPIView):
+    http_method_names = ['get']
+
+    async def get(self, request, pk):
+        try:
+            event = await EventSerializer.setup_eager_loading(Event.objects.all()).aget(pk=pk)
+        except Event.DoesNotExist:
+            return self.respond({'detail': 'No Event matches the given query.'}, status=404)
+        await view_counter.arecord(event.id, request.user.id)
+        event.views_count += view_counter.pending_views(event.id)
+        return self.respond(EventSerializer(event).data)
+
+
+class AsyncStartEventView(AsyncAPIView):
+    http_method_names = ['post']
+
+    async def post(self, request, event_id):
+        try:
+            event = await Event.objects.aget(id=event_id)
+        except Event.DoesNotExist:
+            return self.respond({'error': 'Event not found'}, status=404)
+
+        await EventParticipation.objects.aget_or_create(
+            event=event,
+            student=request.user,
+            defaults={'first_viewed': timezone.now()}
+        )
+        payload = await start_payload_cache.aget_or_build(event.id, lambda: StartEventView.build_payload(event))
+        if payload is None:
+            return self.respond({'error': 'Invalid event type'}, status=400)
+        return self.respond(payload)
+
+
+class AsyncSubmitQuizView(AsyncAPIView):
+    http_method_names = ['post']
+    throttle_scope = 'submit'
+
+    @idempotent
+    async def post(self, request, event_id):
+        try:
+            quiz = await Quiz.objects.select_related('event').aget(event_id=event_id, event__event_type='QUIZ')
+        except Quiz.DoesNotExist:
+            return self.respond({'error': 'Quiz not found'}, status=404)
+        if not isinstance(request.data, dict):
+            return self.respond({'error': 'Тело запроса должно быть объектом'}, status=400)
+        # Запись результата - транзакции, а они в async-коде Django не поддерживаются
+        return self.respond(await sync_to_async(grade_and_record)(request.user, quiz.event, request.data.get('answers', [])))
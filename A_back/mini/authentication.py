@@ -0,0 +1,205 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import CustomUser, StudentProfile, TokenUser
+
+# Поля пользователя, которые переносятся в токен и доступны без запроса к БД
+CLAIM_FIELDS = ('username', 'user_type', 'is_active')
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh-токен с данными пользователя, нужными представлениям (копируются и в access)"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        claims_state.set(user)
+        for field in CLAIM_FIELDS:
+            token[field] = getattr(user, field)
+        # Профиль берем только из уже загруженного кеша связи, без лишнего запроса
+        profile = user._state.fields_cache.get('student_profile')
+        if profile is None and user.user_type == 'STUDENT':
+            profile_id = StudentProfile.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+        else:
+            profile_id = profile.pk if profile is not None else None
+        token['profile_id'] = profile_id
+        return token
+
+
+class UserCache:
+    """
+    Кеш полных строк CustomUser в памяти процесса с коротким TTL.
+
+    Используется TokenUser, когда представлению нужно поле, которого нет в
+    токене. Сохранение и удаление пользователя сбрасывают запись в этом
+    процессе; в остальных процессах она устаревает не позже чем через TTL.
+    """
+
+    def __init__(self, ttl=30, max_size=10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.fields = [field.attname for field in CustomUser._meta.concrete_fields]
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'CLAIMS_AUTH', {})
+        return cls(ttl=options.get('USER_CACHE_TTL', 30), max_size=options.get('USER_CACHE_SIZE', 10_000))
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._rows.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        row = CustomUser.objects.filter(pk=user_id).values(*self.fields).first()
+        if row is not None:
+            with self._lock:
+                if len(self._rows) >= self.max_size:
+                    # Вытесняем самую старую запись (dict хранит порядок вставки)
+                    self._rows.pop(next(iter(self._rows)))
+                self._rows.pop(user_id, None)
+                self._rows[user_id] = (now + self.ttl, row)
+        return row
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._rows.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+user_cache = UserCache.from_settings()
+
+
+class ClaimsStateCache:
+    """
+    Текущие значения CLAIM_FIELDS пользователей в кеше из CACHES.
+
+    Токен принимается, только пока его claims совпадают с записью: смена роли,
+    имени или деактивация (сигнал сохранения пользователя) сразу отзывают уже
+    выданные токены, при этом обычные сохранения пользователя их не трогают.
+    При промахе запись читается из БД. Записи живут ttl секунд, поэтому с
+    кешем процесса (locmem) изменение доходит до остальных воркеров не позже
+    чем через ttl; мгновенный отзыв на всех воркерах требует общего бэкенда.
+    Изменения через QuerySet.update() сигналов не вызывают - после них нужен
+    invalidate().
+    """
+
+    def __init__(self, alias='default', ttl=30):
+        self.alias = alias
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'CLAIMS_AUTH', {})
+        return cls(alias=options.get('STATE_ALIAS', 'default'), ttl=options.get('USER_CACHE_TTL', 30))
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, user_id):
+        return f"claims_state:{user_id}"
+
+    def get(self, user_id):
+        """Кортеж значений CLAIM_FIELDS или None, если пользователя нет"""
+        state = self.backend.get(self._key(user_id))
+        if state is None:
+            state = self.reload(user_id)
+        return state
+
+    def reload(self, user_id):
+        """Читает состояние из БД и перезаписывает запись кеша"""
+        state = CustomUser.objects.filter(pk=user_id).values_list(*CLAIM_FIELDS).first()
+        if state is not None:
+            self.backend.set(self._key(user_id), state, self.ttl)
+        else:
+            self.backend.delete(self._key(user_id))
+        return state
+
+    def is_cached(self, user_id):
+        return self.backend.get(self._key(user_id)) is not None
+
+    def set(self, user):
+        self.backend.set(self._key(user.pk), tuple(getattr(user, field) for field in CLAIM_FIELDS), self.ttl)
+
+    def invalidate(self, user_id):
+        self.backend.delete(self._key(user_id))
+
+
+claims_state = ClaimsStateCache.from_settings()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без запроса пользователя на каждый вызов API.
+
+    request.user - TokenUser, собранный из claims токена (id, username,
+    user_type, профиль студента). Остальные поля подгружаются из user_cache
+    при первом обращении. Токены без claims (выпущенные до включения режима)
+    обрабатываются как раньше - загрузкой пользователя из БД.
+    Claims сверяются с claims_state, так что деактивация и смена роли
+    действуют сразу, не дожидаясь истечения access-токена.
+    """
+
+    def get_user(self, validated_token):
+        if any(field not in validated_token for field in CLAIM_FIELDS):
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        claims = {field: validated_token[field] for field in CLAIM_FIELDS}
+        state = claims_state.get(user_id)
+        if state is not None and state != tuple(claims.values()):
+            # Запись могла устареть в кеше этого воркера (изменение пришло в
+            # другой процесс) - решение о расхождении принимаем по БД
+            state = claims_state.reload(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not state[CLAIM_FIELDS.index('is_active')]:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if state != tuple(claims.values()):
+            raise InvalidToken('Token claims are outdated, log in again')
+        claims['id'] = user_id
+        user = TokenUser.from_claims(claims)
+
+        profile_id = validated_token.get('profile_id')
+        if profile_id is not None:
+            profile = StudentProfile.from_db(None, ['id', 'user_id'], [profile_id, user_id])
+            profile._state.fields_cache['user'] = user
+            user._state.fields_cache['student_profile'] = profile
+        return user
+
+    async def aget_user(self, validated_token):
+        # Токены без claims и промах claims_state требуют запроса к БД,
+        # он выполняется в потоке
+        if all(field in validated_token for field in CLAIM_FIELDS):
+            if claims_state.is_cached(validated_token.get(api_settings.USER_ID_CLAIM)):
+                return self.get_user(validated_token)
+        return await sync_to_async(self.get_user)(validated_token)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=TokenUser)
+def invalidate_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+    if kwargs['signal'] is post_save:
+        claims_state.set(instance)
+    else:
+        claims_state.invalidate(instance.pk)
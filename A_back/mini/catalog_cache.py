@@ -0,0 +1,132 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .models import Event, Merchandise
+
+
+class CatalogCache:
+    """
+    Условные GET для каталогов (мероприятия, мерч): ETag и готовые байты ответа.
+
+    Для каждой таблицы в кеше хранится версия. Она меняется при сохранении и
+    удалении строк (сигналы) и на путях записи через UPDATE с F(), которые
+    updated_at не трогают: счетчик прохождений, резерв остатка. Сброс
+    просмотров версию не меняет - views_count в ответе отстает до timeout.
+    Запись ответа ищется по схеме, хосту, пути и версиям таблиц (в теле есть
+    абсолютные ссылки пагинации), поэтому устаревшие записи просто перестают
+    читаться. ETag - хеш тела, так что он сильный и совпадает у всех воркеров
+    с одинаковыми данными. Хранилище - алиас из
+    CACHES, как у start_payload_cache: для нескольких воркеров нужен общий бэкенд.
+    При чтении с отстающей реплики запись может отставать, но не дольше timeout.
+    """
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'CATALOG_CACHE', {})
+        return cls(alias=options.get('ALIAS', 'default'), timeout=options.get('TIMEOUT', 300))
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _version_key(self, model):
+        return f"catalog_version:{model._meta.label_lower}"
+
+    def versions(self, models):
+        keys = [self._version_key(model) for model in models]
+        versions = self.backend.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.backend.add(key, time.time_ns(), None)
+                versions[key] = self.backend.get(key)
+        return ':'.join(str(versions[key]) for key in keys)
+
+    def bump(self, *models):
+        keys = [self._version_key(model) for model in models]
+        self.backend.set_many(dict.fromkeys(keys, time.time_ns()), None)
+        # Запрос, прочитавший новую версию до COMMIT, мог закешировать старые
+        # строки - после фиксации версия меняется еще раз
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self.backend.set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+    def _count(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def respond(self, request, models, build):
+        """
+        Ответ для GET без параметров запроса: 304 по If-None-Match или
+        закешированные байты без обращения к БД, при промахе ответ строит
+        build(). Для остальных запросов возвращает None.
+        """
+        if request.GET or not isinstance(request.accepted_renderer, JSONRenderer):
+            return None
+        # Ссылка next строится от Host запроса - без него в ключе один запрос
+        # с чужим Host отравил бы ответ для всех клиентов
+        key = f"catalog:{request.scheme}://{request.get_host()}{request.path}:{self.versions(models)}"
+        entry = self.backend.get(key)
+        response = None
+        if entry is None:
+            self._count('misses')
+            response = build()
+            if response.status_code != 200:
+                return response
+            body = request.accepted_renderer.render(response.data, request.accepted_media_type)
+            entry = ('"%s"' % hashlib.sha256(body).hexdigest()[:32], body)
+            self.backend.set(key, entry, self.timeout)
+        else:
+            self._count('hits')
+        etag, body = entry
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            self._count('not_modified')
+            response = HttpResponseNotModified()
+        elif response is None:
+            response = HttpResponse(body, content_type=request.accepted_media_type)
+        # При промахе отдается исходный Response (с data) - те же байты
+        response['ETag'] = etag
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+
+catalog_cache = CatalogCache.from_settings()
+
+
+class ConditionalCatalogMixin:
+    """
+    Для DRF-представлений каталога: ETag, 304 и кеш отрендеренных ответов.
+    catalog_models - таблицы, от которых зависит ответ.
+    """
+
+    catalog_models = ()
+
+    def get(self, request, *args, **kwargs):
+        build = super().get
+        response = catalog_cache.respond(request, self.catalog_models, lambda: build(request, *args, **kwargs))
+        return build(request, *args, **kwargs) if response is None else response
+
+
+@receiver([post_save, post_delete], sender=Event)
+@receiver([post_save, post_delete], sender=Merchandise)
+def bump_catalog(sender, **kwargs):
+    catalog_cache.bump(sender)
@@ -0,0 +1,59 @@
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+
+SLOT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+
+class CheckinTokenError(ValueError):
+    """Токен подделан, поврежден или истек"""
+
+
+class CheckinSigner:
+    """
+    Токены QR-чекина: "<event_id>:<слот>:<истекает>:<HMAC-SHA256>".
+
+    Подпись проверяется по SECRET_KEY без обращения к БД, поэтому проверка
+    масштабируется вместе с веб-воркерами. Слот (необязательная метка
+    сеанса или входа) входит в подпись; отозвать отдельный токен нельзя,
+    поэтому на входе стоит показывать короткоживущие токены и обновлять их.
+    """
+
+    salt = 'mini.checkin'
+
+    def __init__(self, ttl=300, max_ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.signer = signing.Signer(salt=self.salt, algorithm='sha256')
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'CHECKIN', {})
+        return cls(ttl=options.get('TOKEN_TTL', 300), max_ttl=options.get('MAX_TOKEN_TTL', 7 * 24 * 3600))
+
+    def mint(self, event_id, slot='', ttl=None):
+        """Возвращает (токен, время истечения в секундах Unix)"""
+        if slot and not SLOT_PATTERN.match(slot):
+            raise CheckinTokenError('Слот - до 32 латинских букв, цифр, "_" или "-"')
+        ttl = self.ttl if ttl is None else ttl
+        if not 0 < ttl <= self.max_ttl:
+            raise CheckinTokenError(f'Срок действия токена - от 1 до {self.max_ttl} секунд')
+        expires = int(time.time()) + ttl
+        return self.signer.sign(f'{event_id}:{slot}:{expires}'), expires
+
+    def verify(self, token):
+        """Возвращает (event_id, слот) действующего токена"""
+        try:
+            value = self.signer.unsign(token)
+            event_id, slot, expires = value.split(':')
+            event_id, expires = int(event_id), int(expires)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise CheckinTokenError('Недействительный QR-код')
+        if expires < time.time():
+            raise CheckinTokenError('Срок действия QR-кода истек')
+        return event_id, slot
+
+
+checkin_signer = CheckinSigner.from_settings()
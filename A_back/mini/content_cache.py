@@ -0,0 +1,103 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Event, Quiz, QuizQuestion, QuizAnswer, Minigame
+
+
+class StartPayloadCache:
+    """
+    Кеш сериализованного содержимого мероприятия (тело квиза / мини-игры).
+
+    Ключ payload включает версию содержимого мероприятия; версия меняется при
+    любом сохранении или удалении Event, Quiz, QuizQuestion, QuizAnswer и
+    Minigame, поэтому устаревшие записи просто перестают читаться и
+    истекают по TTL. Хранилище задается алиасом из CACHES: locmem для одного
+    процесса, общий бэкенд (Redis, Memcached) для нескольких воркеров.
+    """
+
+    def __init__(self, alias='default', timeout=60 * 60):
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'START_PAYLOAD_CACHE', {})
+        return cls(alias=options.get('ALIAS', 'default'), timeout=options.get('TIMEOUT', 60 * 60))
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _version_key(self, event_id):
+        return f"event_content_version:{event_id}"
+
+    def version(self, event_id):
+        key = self._version_key(event_id)
+        version = self.backend.get(key)
+        if version is None:
+            self.backend.add(key, time.time_ns(), None)
+            version = self.backend.get(key)
+        return version
+
+    def bump(self, event_id):
+        if event_id is not None:
+            self.backend.set(self._version_key(event_id), time.time_ns(), None)
+
+    def get_or_build(self, event_id, build):
+        key = f"start_payload:{event_id}:{self.version(event_id)}"
+        payload = self.backend.get(key)
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if payload is None:
+            payload = build()
+            if payload is not None:
+                self.backend.set(key, payload, self.timeout)
+        return payload
+
+    async def aget_or_build(self, event_id, build):
+        # Бэкенды кеша Django синхронные, а build обращается к БД - все уходит в поток
+        return await sync_to_async(self.get_or_build)(event_id, build)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+            }
+
+
+start_payload_cache = StartPayloadCache.from_settings()
+
+
+# Смена версии содержимого при изменении мероприятия и его квиза / мини-игры
+@receiver([post_save, post_delete], sender=Event)
+def bump_event(sender, instance, **kwargs):
+    start_payload_cache.bump(instance.pk)
+
+@receiver([post_save, post_delete], sender=Quiz)
+@receiver([post_save, post_delete], sender=Minigame)
+def bump_event_content(sender, instance, **kwargs):
+    start_payload_cache.bump(instance.event_id)
+
+@receiver([post_save, post_delete], sender=QuizQuestion)
+def bump_question(sender, instance, **kwargs):
+    start_payload_cache.bump(Quiz.objects.filter(pk=instance.quiz_id).values_list('event_id', flat=True).first())
+
+@receiver([post_save, post_delete], sender=QuizAnswer)
+def bump_answer(sender, instance, **kwargs):
+    event_id = QuizQuestion.objects.filter(pk=instance.question_id).values_list('quiz__event_id', flat=True).first()
+    start_payload_cache.bump(event_id)
@@ -0,0 +1,188 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import Event, EventParticipation
+from . import rollups
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterBuffer:
+    """
+    Буфер просмотров мероприятий (write-behind).
+
+    Просмотры (и QR-чекины) копятся в памяти процесса и сбрасываются в БД пачкой:
+    views_count увеличивается F()-выражениями, новые записи EventParticipation
+    создаются одним bulk_create и учитываются в сводной аналитике. Сброс происходит при достижении порога,
+    по истечении интервала и при завершении процесса. Интервал проверяется
+    при очередном просмотре, а при background - еще и фоновым потоком,
+    который запускается с первым просмотром, так что буфер не ждет следующего.
+    Если параллельная вставка заняла одну из пар, вставка повторяется без нее
+    (не больше insert_attempts раз).
+    """
+
+    insert_attempts = 3
+
+    def __init__(self, flush_interval=5.0, flush_threshold=500, background=True):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.background = background
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._views = Counter()
+        self._participants = set()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'VIEW_COUNTER', {})
+        return cls(
+            flush_interval=options.get('FLUSH_INTERVAL', 5.0),
+            flush_threshold=options.get('FLUSH_THRESHOLD', 500),
+            background=options.get('BACKGROUND_FLUSH', True)
+        )
+
+    def _add(self, event_id, student_id, view=True):
+        # Возвращает True, если пора сбрасывать буфер
+        with self._lock:
+            if view:
+                self._views[event_id] += 1
+            # Запись об участии дедуплицируется в пределах окна сброса
+            self._participants.add((event_id, student_id))
+            self._pending += 1
+            # Поток не переживает fork, поэтому проверяется, что он жив
+            if self.background and (self._timer is None or not self._timer.is_alive()):
+                self._timer = threading.Thread(target=self._run_timer, name='view-counter-flush', daemon=True)
+                self._timer.start()
+            return (
+                self._pending >= self.flush_threshold
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def record(self, event_id, student_id):
+        if self._add(event_id, student_id):
+            self.flush()
+
+    def record_participant(self, event_id, student_id):
+        """Участие без просмотра (QR-чекин): только запись EventParticipation"""
+        if self._add(event_id, student_id, view=False):
+            self.flush()
+
+    async def arecord(self, event_id, student_id):
+        # Сброс пишет в БД, поэтому из асинхронного кода он уходит в поток
+        if self._add(event_id, student_id):
+            await sync_to_async(self.flush)()
+
+    def _run_timer(self):
+        while True:
+            with self._lock:
+                wait = self.flush_interval - (time.monotonic() - self._last_flush)
+                due = self._pending and wait <= 0
+            if due:
+                self.flush()
+                # Соединение потока не должно висеть открытым до следующего сброса
+                connection.close()
+            else:
+                time.sleep(max(wait, 0.01) if self._pending else self.flush_interval)
+
+    def pending_views(self, event_id):
+        with self._lock:
+            return self._views.get(event_id, 0)
+
+    def _take(self):
+        with self._lock:
+            views, participants = self._views, self._participants
+            self._views, self._participants = Counter(), set()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        return views, participants
+
+    def _restore(self, views, participants):
+        with self._lock:
+            self._views.update(views)
+            self._participants |= participants
+            # Как в _add: чекины без просмотра тоже приближают порог сброса
+            self._pending += sum(views.values()) + len(participants)
+
+    def flush(self):
+        # Один сброс за раз; конкурентные вызовы просто пропускаются
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            views, participants = self._take()
+            if not views and not participants:
+                return
+            try:
+                self._write(views, participants)
+            except Exception:
+                # Не теряем просмотры: вернем их в буфер до следующего сброса
+                self._restore(views, participants)
+                logger.exception('Failed to flush event view counters')
+        finally:
+            self._flush_lock.release()
+
+    def _known_pairs(self, event_ids, student_ids):
+        return set(EventParticipation.objects.filter(
+            event_id__in=event_ids,
+            student_id__in=student_ids
+        ).values_list('event_id', 'student_id'))
+
+    def _write(self, views, participants):
+        # Мероприятия с одинаковым приростом обновляются одним UPDATE
+        by_increment = defaultdict(list)
+        for event_id, count in views.items():
+            by_increment[count].append(event_id)
+
+        with transaction.atomic():
+            for count, event_ids in by_increment.items():
+                Event.objects.filter(id__in=event_ids).update(views_count=F('views_count') + count)
+            # Каталог мероприятий не сбрасывается: иначе самый частый ответ
+            # перестраивался бы на каждом сбросе, views_count в нем отстает
+            # не дольше TIMEOUT из CATALOG_CACHE
+            rollups.record_views(sum(views.values()))
+
+            # Мероприятия могли быть удалены, пока просмотры лежали в буфере
+            event_ids = views.keys() | {event_id for event_id, _ in participants}
+            event_types = dict(Event.objects.filter(id__in=event_ids).values_list('id', 'event_type'))
+            participants = {pair for pair in participants if pair[0] in event_types}
+            student_ids = {student_id for _, student_id in participants}
+            for _ in range(self.insert_attempts):
+                new_pairs = participants - self._known_pairs(event_types.keys(), student_ids)
+                if not new_pairs:
+                    return
+                returning_students = set(
+                    EventParticipation.objects.filter(student_id__in=student_ids).values_list('student_id', flat=True).distinct()
+                )
+                try:
+                    with transaction.atomic():
+                        EventParticipation.objects.bulk_create(
+                            [
+                                EventParticipation(event_id=event_id, student_id=student_id)
+                                for event_id, student_id in new_pairs
+                            ],
+                            batch_size=500
+                        )
+                except IntegrityError:
+                    # Пару успели вставить параллельно (другой сброс или прямое
+                    # создание, которое само учло ее в сводке) - перечитываем
+                    # известные пары, чтобы в сводку попали только свои строки
+                    continue
+                rollups.record_new_participations(new_pairs, event_types, returning_students)
+                return
+            raise IntegrityError('Event participations are contended, flush is retried later')
+
+
+view_counter = ViewCounterBuffer.from_settings()
+
+# Сбрасываем накопленное при штатном завершении процесса
+atexit.register(view_counter.flush)
@@ -0,0 +1,132 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+class ReplicaBlock:
+    """Состояние блока replica_reads(): роутер, отправивший чтение на реплику"""
+
+    __slots__ = ('router',)
+
+    def __init__(self):
+        self.router = None
+
+
+@contextmanager
+def replica_reads():
+    """Чтения внутри блока уходят на реплику (если она настроена и доступна)"""
+    block = ReplicaBlock()
+    token = _replica_reads.set(block)
+    try:
+        yield block
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaHealth:
+    """
+    Доступность реплики: проверочный запрос не чаще раза в check_interval.
+    После сбоя реплика считается недоступной retry_interval секунд, и все
+    чтения идут на основную БД.
+    """
+
+    def __init__(self, alias, check_interval=5.0, retry_interval=30.0):
+        self.alias = alias
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._healthy = False
+        self._next_check = 0.0
+
+    def is_healthy(self):
+        if time.monotonic() < self._next_check:
+            return self._healthy
+        with self._lock:
+            # Проверку выполняет один поток, остальные видят прежний результат
+            if time.monotonic() >= self._next_check:
+                self._check()
+        return self._healthy
+
+    def _check(self):
+        try:
+            with connections[self.alias].cursor() as cursor:
+                # Пустая или недомигрированная реплика тоже считается недоступной
+                cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        except Exception:
+            if self._healthy or not self._next_check:
+                logger.warning('Read replica "%s" is unavailable, reading from primary', self.alias, exc_info=True)
+            self.mark_down()
+        else:
+            self._healthy = True
+            self._next_check = time.monotonic() + self.check_interval
+
+    def mark_down(self):
+        self._healthy = False
+        self._next_check = time.monotonic() + self.retry_interval
+
+
+class ReadReplicaRouter:
+    """
+    Запись и миграции - только в основную БД. Чтения из блоков replica_reads()
+    (аналитика и другие эндпоинты только для чтения, см. ReplicaReadMixin) идут
+    на реплику, пока она здорова. Внутри транзакции на основной БД чтения
+    остаются на ней, чтобы видеть собственные записи.
+    """
+
+    def __init__(self):
+        options = getattr(settings, 'READ_REPLICA', {})
+        self.alias = options.get('ALIAS', 'replica')
+        self.health = ReplicaHealth(
+            self.alias,
+            check_interval=options.get('HEALTH_CHECK_INTERVAL', 5.0),
+            retry_interval=options.get('RETRY_INTERVAL', 30.0)
+        )
+
+    def db_for_read(self, model, **hints):
+        block = _replica_reads.get()
+        if block is None or self.alias not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or not self.health.is_healthy():
+            return DEFAULT_DB_ALIAS
+        block.router = self
+        return self.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплику через репликацию (или копию файла SQLite)
+        return db != self.alias
+
+
+class ReplicaReadMixin:
+    """
+    Для DRF-представлений: GET и HEAD читают с реплики. Если реплика
+    отказала посреди запроса, она помечается недоступной, а запрос
+    выполняется заново на основной БД.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            with replica_reads() as block:
+                try:
+                    return super().dispatch(request, *args, **kwargs)
+                except OperationalError:
+                    if block.router is None:
+                        raise
+            logger.warning('Read replica "%s" failed, retrying on primary', block.router.alias, exc_info=True)
+            block.router.health.mark_down()
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,181 @@
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import EventParticipation, Feedback, PointTransaction, MerchOrder
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportError(ValueError):
+    """Неизвестный набор данных, формат или некорректный фильтр"""
+
+
+class ExportForbidden(ExportError):
+    """Набор данных недоступен пользователю"""
+
+
+class Dataset:
+    """
+    Описание выгрузки: столбцы (пути для values_list), поле даты для фильтра
+    по периоду и путь до мероприятия (None, если записи с ним не связаны).
+    """
+
+    def __init__(self, model, columns, date_field, event_field=None):
+        self.model = model
+        self.columns = columns
+        self.date_field = date_field
+        self.event_field = event_field
+
+    @property
+    def header(self):
+        return [column.replace('__', '_') for column in self.columns]
+
+
+DATASETS = {
+    'participations': Dataset(
+        EventParticipation,
+        ['id', 'event_id', 'event__title', 'event__manager_id', 'student_id', 'student__username',
+         'completed', 'score', 'first_viewed', 'completed_at'],
+        date_field='first_viewed',
+        event_field='event',
+    ),
+    'feedback': Dataset(
+        Feedback,
+        ['id', 'event_id', 'event__title', 'event__manager_id', 'student_id', 'student__username',
+         'rating', 'comment', 'created_at'],
+        date_field='created_at',
+        event_field='event',
+    ),
+    'transactions': Dataset(
+        PointTransaction,
+        ['id', 'student_id', 'student__username', 'event_id', 'event__manager_id', 'points',
+         'transaction_type', 'description', 'balance_after', 'timestamp'],
+        date_field='timestamp',
+        event_field='event',
+    ),
+    'orders': Dataset(
+        MerchOrder,
+        ['id', 'student_id', 'student__username', 'merchandise_id', 'merchandise__name', 'quantity',
+         'points_spent', 'status', 'created_at'],
+        date_field='created_at',
+    ),
+}
+
+
+def get_dataset(name):
+    try:
+        return DATASETS[name]
+    except KeyError:
+        raise ExportError(f"Неизвестный набор данных '{name}', доступны: {', '.join(DATASETS)}")
+
+
+def _parse_moment(value, end=False):
+    """
+    Дата или дата-время из фильтра: (момент, задана ли только дата). Конец
+    периода по дате - начало следующего дня.
+    """
+    day = None
+    try:
+        # Сначала дата: parse_datetime на Python 3.11+ принимает и YYYY-MM-DD
+        day = parse_date(value)
+        if day is None:
+            moment = parse_datetime(value)
+        else:
+            moment = datetime.datetime.combine(day + datetime.timedelta(days=1) if end else day, datetime.time())
+    except (ValueError, OverflowError):
+        # Формат верный, но такой даты нет (2024-02-30, конец 9999-12-31)
+        moment = None
+    if moment is None:
+        raise ExportError(f"Некорректная дата '{value}', ожидается YYYY-MM-DD или ISO 8601")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, day is not None
+
+
+def _parse_id(name, value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ExportError(f"Параметр {name} должен быть числом")
+
+
+def build_rows(name, event=None, manager=None, date_from=None, date_to=None, owner=None):
+    """
+    Queryset кортежей значений для выгрузки. Фильтры - строки из запроса или
+    командной строки; пустые значения игнорируются. owner - id менеджера,
+    которому доступны только записи его мероприятий (выгрузка через API).
+    """
+    dataset = get_dataset(name)
+    if owner is not None and dataset.event_field is None:
+        raise ExportForbidden(f"Набор '{name}' не связан с мероприятиями и доступен только администраторам")
+    filters = {}
+    if event or manager:
+        if dataset.event_field is None:
+            raise ExportError(f"Набор '{name}' не связан с мероприятиями, фильтр по мероприятию недоступен")
+        if event:
+            filters[f'{dataset.event_field}_id'] = _parse_id('event', event)
+        if manager:
+            filters[f'{dataset.event_field}__manager_id'] = _parse_id('manager', manager)
+    if date_from:
+        filters[f'{dataset.date_field}__gte'], _ = _parse_moment(date_from)
+    if date_to:
+        # Дата-время - включительно, дата - до начала следующего дня
+        moment, is_day = _parse_moment(date_to, end=True)
+        filters[f"{dataset.date_field}__{'lt' if is_day else 'lte'}"] = moment
+    rows = dataset.model.objects.filter(**filters)
+    if owner is not None:
+        # Отдельным filter(), чтобы параметр manager не заменил ограничение
+        rows = rows.filter(**{f'{dataset.event_field}__manager_id': owner})
+    return rows.order_by('pk').values_list(*dataset.columns)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: writerow возвращает готовую строку"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if isinstance(value, datetime.datetime) else value for value in row
+        ])
+
+
+def _ndjson_lines(header, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def stream(name, fmt, rows, chunk_size=2000):
+    """
+    Возвращает генератор байтов выгрузки. Строки читаются из БД через iterator() (на
+    PostgreSQL - серверным курсором) порциями по chunk_size и отдаются такими
+    же порциями, поэтому память не зависит от размера выгрузки.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Неизвестный формат '{fmt}', доступны: {', '.join(FORMATS)}")
+    lines = _csv_lines if fmt == 'csv' else _ndjson_lines
+    return _batched(lines(get_dataset(name).header, rows.iterator(chunk_size=chunk_size)), chunk_size)
+
+
+def _batched(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch).encode()
+            batch = []
+    if batch:
+        yield ''.join(batch).encode()
@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .instrumentation import timed_serialization
+from .serializers import EventSerializer, FeedbackSerializer, MerchOrderSerializer
+
+# Поля, чье представление совпадает со значением из БД
+_IDENTITY_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField)
+
+# Метка DateTimeField в формате ISO 8601: преобразование берется из контекста вызова
+_DATETIME = object()
+
+
+def _is_plain_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return (
+        type(field) is serializers.DateTimeField and settings.USE_TZ and not hasattr(field, 'timezone')
+        and output_format is not None and output_format.lower() == ISO_8601
+    )
+
+
+def _datetime_converter(tz):
+    # То же, что DateTimeField.to_representation для aware-значений из БД
+    def convert(value):
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class _Node:
+    """
+    Скомпилированный сериализатор: колонки .values() с префиксом связи и
+    функция преобразования для каждого поля. Вложенные сериализаторы по
+    FK / one-to-one разворачиваются в колонки того же запроса, many=True -
+    отдельный запрос на уровень со связью по внешнему ключу.
+    """
+
+    def __init__(self, serializer, prefix=''):
+        model = serializer.Meta.model
+        self.model = model
+        self.pk_column = prefix + model._meta.pk.attname
+        self.columns = [self.pk_column]
+        self.fields = []
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.ListSerializer):
+                relation = model._meta.get_field(field.source)
+                child = _Node(field.child)
+                child.fk_column = relation.field.attname
+                child.columns.append(child.fk_column)
+                self.fields.append((field.field_name, child, 'many'))
+            elif isinstance(field, serializers.BaseSerializer):
+                child = _Node(field, f'{prefix}{field.source}__')
+                self.columns.extend(child.columns)
+                self.fields.append((field.field_name, child, 'one'))
+            else:
+                column = prefix + '__'.join(field.source_attrs)
+                if column not in self.columns:
+                    self.columns.append(column)
+                if isinstance(field, _IDENTITY_FIELDS):
+                    converter = None
+                elif _is_plain_datetime(field):
+                    converter = _DATETIME
+                else:
+                    converter = field.to_representation
+                self.fields.append((field.field_name, column, converter))
+
+    def resolve(self, rows, context):
+        """Загружает вложенные many=True для строк rows в context[id(узла)]"""
+        for _, child, kind in self.fields:
+            if kind == 'one':
+                child.resolve(rows, context)
+            elif kind == 'many':
+                pks = {row[self.pk_column] for row in rows if row[self.pk_column] is not None}
+                child_rows = list(
+                    child.model._default_manager.filter(**{f'{child.fk_column}__in': pks}).values(*child.columns)
+                ) if pks else []
+                child.resolve(child_rows, context)
+                grouped = defaultdict(list)
+                for row in child_rows:
+                    grouped[row[child.fk_column]].append(child.represent(row, context))
+                context[id(child)] = grouped
+
+    def represent(self, row, context):
+        if row[self.pk_column] is None:
+            return None
+        data = {}
+        for name, source, kind in self.fields:
+            if kind == 'one':
+                data[name] = source.represent(row, context)
+            elif kind == 'many':
+                data[name] = context[id(source)].get(row[self.pk_column], [])
+            else:
+                value = row[source]
+                if kind is None or value is None:
+                    data[name] = value
+                elif kind is _DATETIME:
+                    data[name] = context[_DATETIME](value)
+                else:
+                    data[name] = kind(value)
+        return data
+
+
+class FastSerializer:
+    """
+    Быстрое чтение для read-only списков: строки из .values() вместо
+    экземпляров моделей, поля - по плану, заранее скомпилированному из
+    обычного DRF-сериализатора. Вывод совпадает с serializer(many=True).data
+    байт в байт после JSONRenderer: те же поля и порядок, даты - в том же
+    формате, что у DateTimeField. Отключается FAST_SERIALIZERS['ENABLED'].
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.enabled = getattr(settings, 'FAST_SERIALIZERS', {}).get('ENABLED', True)
+        self.renderer = JSONRenderer()
+        self._plans = {}
+
+    def plan(self, prefix=''):
+        node = self._plans.get(prefix)
+        if node is None:
+            node = self._plans[prefix] = _Node(self.serializer_class(), prefix)
+        return node
+
+    def columns(self, prefix=''):
+        """Колонки для queryset.values(); prefix - путь к связи, например 'event__'"""
+        return self.plan(prefix).columns
+
+    def serialize(self, rows, prefix=''):
+        """Список словарей из строк .values(), полученных с теми же columns(prefix)"""
+        node = self.plan(prefix)
+        with timed_serialization():
+            rows = list(rows)
+            # Часовой пояс - текущий на момент вызова, как у DateTimeField
+            context = {_DATETIME: _datetime_converter(timezone.get_current_timezone())}
+            node.resolve(rows, context)
+            return [node.represent(row, context) for row in rows]
+
+    def data(self, queryset):
+        return self.serialize(queryset.values(*self.columns()))
+
+    def render(self, queryset):
+        return self.renderer.render(self.data(queryset))
+
+
+fast_events = FastSerializer(EventSerializer)
+fast_feedback = FastSerializer(FeedbackSerializer)
+fast_merch_orders = FastSerializer(MerchOrderSerializer)
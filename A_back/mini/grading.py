@@ -0,0 +1,86 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Quiz, QuizQuestion, QuizAnswer
+
+ANSWER_KEY_CACHE_PREFIX = 'quiz_answer_key'
+ANSWER_KEY_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(quiz_id):
+    return f"{ANSWER_KEY_CACHE_PREFIX}:{quiz_id}"
+
+
+class AnswerKey:
+    """Ключ ответов квиза: question_id -> множество id правильных ответов"""
+
+    __slots__ = ('quiz_id', 'correct', 'total_questions')
+
+    def __init__(self, quiz_id, correct, total_questions):
+        self.quiz_id = quiz_id
+        self.correct = correct
+        self.total_questions = total_questions
+
+    @classmethod
+    def build(cls, quiz_id):
+        # Два запроса независимо от количества вопросов
+        question_ids = list(QuizQuestion.objects.filter(quiz_id=quiz_id).values_list('id', flat=True))
+        correct = {question_id: set() for question_id in question_ids}
+        rows = QuizAnswer.objects.filter(
+            question__quiz_id=quiz_id,
+            is_correct=True
+        ).values_list('question_id', 'id')
+        for question_id, answer_id in rows:
+            correct[question_id].add(answer_id)
+        return cls(
+            quiz_id,
+            {question_id: frozenset(ids) for question_id, ids in correct.items()},
+            len(question_ids)
+        )
+
+    def grade(self, answers):
+        """Возвращает количество правильно отвеченных вопросов"""
+        answered = set()
+        for answer_data in answers:
+            if not isinstance(answer_data, dict):
+                continue
+            try:
+                question_id = int(answer_data.get('question_id'))
+                answer_id = int(answer_data.get('answer_id'))
+            except (TypeError, ValueError):
+                continue
+            # Каждый вопрос засчитывается не более одного раза
+            if question_id in answered:
+                continue
+            if answer_id in self.correct.get(question_id, ()):
+                answered.add(question_id)
+        return len(answered)
+
+
+def get_answer_key(quiz_id):
+    key = cache.get(_cache_key(quiz_id))
+    if key is None:
+        key = AnswerKey.build(quiz_id)
+        cache.set(_cache_key(quiz_id), key, ANSWER_KEY_CACHE_TIMEOUT)
+    return key
+
+
+def invalidate_answer_key(quiz_id):
+    if quiz_id is not None:
+        cache.delete(_cache_key(quiz_id))
+
+
+# Сброс кеша при изменении квиза, вопросов или ответов
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_quiz(sender, instance, **kwargs):
+    invalidate_answer_key(instance.pk)
+
+@receiver([post_save, post_delete], sender=QuizQuestion)
+def invalidate_question(sender, instance, **kwargs):
+    invalidate_answer_key(instance.quiz_id)
+
+@receiver([post_save, post_delete], sender=QuizAnswer)
+def invalidate_answer(sender, instance, **kwargs):
+    quiz_id = QuizQuestion.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    invalidate_answer_key(quiz_id)
@@ -0,0 +1,187 @@
+import datetime
+import functools
+import hashlib
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _digest(value):
+    return hashlib.sha256(value).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Хранилище ключей идемпотентности в таблице IdempotencyKey.
+
+    Ключ клиента и запрос хранятся как SHA-256, ответ - готовыми байтами
+    JSON. Записи живут ttl секунд; запись без ответа (запрос еще выполняется)
+    через in_progress_timeout считается брошенной, например после падения
+    процесса, и ключ можно использовать снова.
+    """
+
+    def __init__(self, ttl=24 * 3600, in_progress_timeout=60):
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.in_progress_timeout = datetime.timedelta(seconds=in_progress_timeout)
+        self.renderer = JSONRenderer()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'IDEMPOTENCY', {})
+        return cls(ttl=options.get('TTL', 24 * 3600), in_progress_timeout=options.get('IN_PROGRESS_TIMEOUT', 60))
+
+    def begin(self, user_id, key, request_hash):
+        """
+        Занимает ключ. Возвращает (новая запись, None) или (None, существующая
+        запись), если ключ уже использован и еще действует.
+        """
+        key = _digest(key.encode())
+        for _ in range(2):
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    return IdempotencyKey.objects.create(
+                        user_id=user_id, key=key, request_hash=request_hash, created_at=now
+                    ), None
+            except IntegrityError:
+                existing = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+            if existing is None:
+                continue
+            abandoned = existing.status_code is None and existing.created_at < now - self.in_progress_timeout
+            if not abandoned and existing.created_at >= now - self.ttl:
+                return None, existing
+            # Истекшую или брошенную запись удаляем, только если ее никто не успел заменить
+            IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+        raise IntegrityError(f'Idempotency key of user #{user_id} is contended')
+
+    def complete(self, record, response):
+        if isinstance(response, Response):
+            body = self.renderer.render(response.data) if response.data is not None else b''
+        else:
+            # Ответ async-представления уже отрендерен
+            body = response.content
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response_body=body)
+
+    def release(self, record):
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+    def purge(self):
+        """Удаляет истекшие записи; возвращает их количество"""
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - self.ttl).delete()
+        return deleted
+
+
+idempotency_store = IdempotencyStore.from_settings()
+
+
+def _begin(request):
+    """
+    (запись, None), если запрос нужно выполнить, или (None, ответ): отказ -
+    кортеж (данные, статус) - либо сохраненный ответ для повтора
+    """
+    key = request.headers.get(HEADER)
+    if len(key) > MAX_KEY_LENGTH:
+        return None, ({'error': f'{HEADER} длиннее {MAX_KEY_LENGTH} символов'}, status.HTTP_400_BAD_REQUEST)
+
+    request_hash = _digest(b'%s %s\n%s' % (request.method.encode(), request.path.encode(), request.body))
+    record, existing = idempotency_store.begin(request.user.id, key, request_hash)
+    if existing is None:
+        return record, None
+    if existing.request_hash != request_hash:
+        return None, ({'error': f'{HEADER} уже использован для другого запроса'},
+                      status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if existing.status_code is None:
+        return None, ({'error': 'Запрос с этим ключом еще выполняется, повторите позже'}, status.HTTP_409_CONFLICT)
+    response = HttpResponse(
+        bytes(existing.response_body or b''), status=existing.status_code, content_type='application/json'
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return None, response
+
+
+def defer(response, future, build):
+    """
+    Ответ-заглушка запроса, итог которого еще вычисляется в future. Ключ
+    Idempotency-Key остается занятым (повтор получает 409), а когда future
+    завершится, под ключом сохраняется ответ build(future).
+    """
+    response.deferred = (future, build)
+    return response
+
+
+def _finish_deferred(record, future, build):
+    try:
+        response = build(future)
+    except Exception:
+        idempotency_store.release(record)
+        raise
+    _finish(record, response)
+
+
+def _finish(record, response):
+    deferred = getattr(response, 'deferred', None)
+    if deferred is not None:
+        future, build = deferred
+        future.add_done_callback(lambda done: _finish_deferred(record, done, build))
+    elif response.status_code >= 500:
+        idempotency_store.release(record)
+    else:
+        idempotency_store.complete(record, response)
+
+
+def idempotent(handler):
+    """
+    Декоратор метода APIView или async-метода AsyncAPIView: повтор запроса
+    с тем же заголовком Idempotency-Key от того же пользователя возвращает
+    сохраненный ответ, не выполняя представление еще раз. Ответы 5xx не
+    сохраняются - такой запрос можно повторить с тем же ключом. Для ответа
+    из defer() сохраняется итоговый ответ, а не заглушка.
+    """
+
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(view, request, *args, **kwargs):
+            if not request.headers.get(HEADER):
+                return await handler(view, request, *args, **kwargs)
+            # Хранилище работает с транзакциями - вызывается в потоке
+            record, reply = await sync_to_async(_begin)(request)
+            if reply is not None:
+                return view.respond(*reply) if isinstance(reply, tuple) else reply
+            try:
+                response = await handler(view, request, *args, **kwargs)
+            except Exception:
+                await sync_to_async(idempotency_store.release)(record)
+                raise
+            await sync_to_async(_finish)(record, response)
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        if not request.headers.get(HEADER):
+            return handler(view, request, *args, **kwargs)
+        record, reply = _begin(request)
+        if reply is not None:
+            return Response(*reply) if isinstance(reply, tuple) else reply
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            idempotency_store.release(record)
+            raise
+        _finish(record, response)
+        return response
+
+    return wrapper
@@ -0,0 +1,290 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import ListSerializer
+
+from .catalog_cache import catalog_cache
+from .content_cache import start_payload_cache
+
+# Границы корзин гистограмм: время (сек) и число SQL-запросов
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL-запросы, время БД, сериализации и рендеринга"""
+
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'render_started', 'in_serializer', 'response')
+
+    def __init__(self):
+        self.response = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_started = None
+        self.in_serializer = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обертка execute_wrapper: считает запросы и время в БД
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus (корзины хранятся некумулятивно)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield _format_number(bound), cumulative
+        yield '+Inf', self.count
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Гистограммы по имени URL в памяти процесса и вывод в текстовом формате Prometheus"""
+
+    METRICS = (
+        ('request_duration_seconds', 'Total request time', DURATION_BUCKETS),
+        ('db_duration_seconds', 'Time spent in SQL queries', DURATION_BUCKETS),
+        ('serializer_duration_seconds', 'Time spent in DRF serializers', DURATION_BUCKETS),
+        ('render_duration_seconds', 'Time spent rendering the response body', DURATION_BUCKETS),
+        ('db_queries', 'SQL queries per request', QUERY_BUCKETS),
+    )
+
+    def __init__(self, namespace='mini'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+        self._collectors = []
+
+    def observe(self, view, status_code, values):
+        with self._lock:
+            histograms = self._histograms.get(view)
+            if histograms is None:
+                histograms = self._histograms[view] = {
+                    name: Histogram(buckets) for name, _, buckets in self.METRICS
+                }
+            for name, value in values.items():
+                histograms[name].observe(value)
+            key = (view, status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def register_collector(self, collector):
+        """collector() -> [(имя, описание, тип, {метки} | None, значение)]"""
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self):
+        prefix = self.namespace
+        lines = []
+        with self._lock:
+            lines.append(f'# HELP {prefix}_requests_total Requests by URL name and status')
+            lines.append(f'# TYPE {prefix}_requests_total counter')
+            for (view, status_code), count in sorted(self._requests.items()):
+                lines.append(f'{prefix}_requests_total{{view="{_escape(view)}",status="{status_code}"}} {count}')
+            for name, description, _ in self.METRICS:
+                lines.append(f'# HELP {prefix}_{name} {description}')
+                lines.append(f'# TYPE {prefix}_{name} histogram')
+                for view in sorted(self._histograms):
+                    histogram = self._histograms[view][name]
+                    label = f'view="{_escape(view)}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{prefix}_{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{prefix}_{name}_sum{{{label}}} {histogram.sum!r}')
+                    lines.append(f'{prefix}_{name}_count{{{label}}} {histogram.count}')
+        described = set()
+        for collector in self._collectors:
+            for name, description, metric_type, labels, value in collector():
+                # Несколько наборов меток одной метрики - под одним HELP/TYPE
+                if name not in described:
+                    described.add(name)
+                    lines.append(f'# HELP {prefix}_{name} {description}')
+                    lines.append(f'# TYPE {prefix}_{name} {metric_type}')
+                label = ','.join(f'{key}="{_escape(val)}"' for key, val in (labels or {}).items())
+                lines.append(f'{prefix}_{name}{{{label}}} {value}' if label else f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def _start_payload_cache_metrics():
+    stats = start_payload_cache.stats()
+    return [
+        ('start_payload_cache_hits_total', 'StartEventView payload cache hits', 'counter', None, stats['hits']),
+        ('start_payload_cache_misses_total', 'StartEventView payload cache misses', 'counter', None, stats['misses']),
+    ]
+
+
+metrics.register_collector(_start_payload_cache_metrics)
+
+
+def _catalog_cache_metrics():
+    stats = catalog_cache.stats()
+    return [
+        ('catalog_cache_hits_total', 'Catalog responses served from cached bytes', 'counter', None, stats['hits']),
+        ('catalog_cache_misses_total', 'Catalog responses rendered from the database', 'counter', None, stats['misses']),
+        ('catalog_not_modified_total', 'Catalog requests answered with 304', 'counter', None, stats['not_modified']),
+    ]
+
+
+metrics.register_collector(_catalog_cache_metrics)
+
+
+@contextmanager
+def timed_serialization():
+    """Учитывает время блока как время сериализации текущего запроса"""
+    current = _current.get()
+    if current is None or current.in_serializer:
+        # Вложенные вызовы уже учтены внешним
+        yield
+        return
+    current.in_serializer = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.serializer_time += time.perf_counter() - started
+        current.in_serializer = False
+
+
+class TimedSerializerMixin:
+    """
+    Сериализатор DRF, чье обращение к .data попадает в замеры запроса
+    (serializer_duration_seconds, ser в Server-Timing). many=True дает
+    TimedListSerializer.
+    """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        # Meta.list_serializer_class не задан - подменяем только стандартный класс
+        if type(serializer) is ListSerializer:
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
+class InstrumentationMiddleware:
+    """
+    Замер каждого запроса: число SQL-запросов и время в БД (execute_wrapper),
+    время сериализаторов DRF, рендеринга ответа и общее время. Результат
+    отдается заголовком Server-Timing и копится в гистограммах по имени URL,
+    которые читает MetricsView.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'INSTRUMENTATION', {}).get('SERVER_TIMING', True)
+        # Под ASGI асинхронные представления не переводятся обратно в поток
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request) as measured:
+            measured.response = self.get_response(request)
+        return measured.response
+
+    async def __acall__(self, request):
+        with self.measure(request) as measured:
+            measured.response = await self.get_response(request)
+        return measured.response
+
+    @contextmanager
+    def measure(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Соединения привязаны к контексту, поэтому обертка действует
+                # и на запросы асинхронного ORM, выполняемые в потоке
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(request_metrics))
+                yield request_metrics
+        finally:
+            _current.reset(token)
+        self.record(request, request_metrics, started)
+
+    def record(self, request, request_metrics, started):
+        response = request_metrics.response
+        finished = time.perf_counter()
+        total = finished - started
+        # Рендеринг завершается до возврата из get_response
+        render = finished - request_metrics.render_started if request_metrics.render_started else 0.0
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        metrics.observe(view, response.status_code, {
+            'request_duration_seconds': total,
+            'db_duration_seconds': request_metrics.db_time,
+            'serializer_duration_seconds': request_metrics.serializer_time,
+            'render_duration_seconds': render,
+            'db_queries': request_metrics.queries,
+        })
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;desc="{request_metrics.queries} queries";dur={request_metrics.db_time * 1000:.2f}, '
+                f'ser;dur={request_metrics.serializer_time * 1000:.2f}, '
+                f'render;dur={render * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}'
+            )
+
+    def process_template_response(self, request, response):
+        # Вызывается прямо перед response.render() (DRF Response - шаблонный ответ)
+        request_metrics = _current.get()
+        if request_metrics is not None:
+            request_metrics.render_started = time.perf_counter()
+        return response
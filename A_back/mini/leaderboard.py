@@ -0,0 +1,293 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import CustomUser, StudentProfile, PointTransaction
+
+logger = logging.getLogger(__name__)
+
+
+class RankIndex:
+    """
+    Упорядоченный индекс баллов студентов.
+
+    Количество студентов с каждым значением баллов хранится в дереве Фенвика
+    над отсортированным списком различных значений (сжатые координаты), поэтому
+    место студента считается за O(log k), а память не зависит от величины
+    баллов. Появление или исчезновение значения сдвигает координаты - дерево
+    перестраивается за O(k) при следующем подсчете места. Страницы топа
+    кешируются и сбрасываются только если изменение затрагивает закешированную
+    область (неполная страница - любое изменение: в нее может попасть новый студент).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._points = {}
+        self._buckets = {}
+        self._scores = []
+        # None - координаты изменились, дерево строится заново по _buckets
+        self._tree = None
+        self._pages = {}
+        self._pages_floor = None
+
+    def __len__(self):
+        return len(self._points)
+
+    @classmethod
+    def from_rows(cls, rows):
+        index = cls()
+        for user_id, points in rows:
+            points = max(points or 0, 0)
+            index._points[user_id] = points
+            bucket = index._buckets.get(points)
+            if bucket is None:
+                bucket = index._buckets[points] = set()
+            bucket.add(user_id)
+        index._scores = sorted(index._buckets)
+        return index
+
+    # Дерево Фенвика (позиция = номер значения в _scores + 1)
+
+    def _build_tree(self):
+        tree = [0] + [len(self._buckets[score]) for score in self._scores]
+        size = len(tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, points, delta):
+        if self._tree is None:
+            return
+        i = bisect.bisect_left(self._scores, points) + 1
+        size = len(self._tree)
+        while i < size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, points):
+        """Количество студентов с баллами <= points"""
+        if self._tree is None:
+            self._build_tree()
+        i = bisect.bisect_right(self._scores, points)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    # Изменения
+
+    def _touch_pages(self, *scores):
+        if self._pages and (self._pages_floor is None or max(scores) >= self._pages_floor):
+            self._pages.clear()
+            self._pages_floor = None
+
+    def _detach(self, user_id, points):
+        bucket = self._buckets[points]
+        bucket.discard(user_id)
+        if bucket:
+            self._add(points, -1)
+        else:
+            del self._buckets[points]
+            del self._scores[bisect.bisect_left(self._scores, points)]
+            self._tree = None
+
+    def _attach(self, user_id, points):
+        bucket = self._buckets.get(points)
+        if bucket is None:
+            bucket = self._buckets[points] = set()
+            bisect.insort(self._scores, points)
+            self._tree = None
+        else:
+            self._add(points, 1)
+        bucket.add(user_id)
+
+    def update(self, user_id, points):
+        points = max(points or 0, 0)
+        with self._lock:
+            old = self._points.get(user_id)
+            if old == points:
+                return
+            if old is not None:
+                self._detach(user_id, old)
+            self._attach(user_id, points)
+            self._points[user_id] = points
+            self._touch_pages(points, old if old is not None else points)
+
+    def add(self, user_id, delta):
+        with self._lock:
+            self.update(user_id, self._points.get(user_id, 0) + delta)
+
+    def remove(self, user_id):
+        with self._lock:
+            old = self._points.pop(user_id, None)
+            if old is not None:
+                self._detach(user_id, old)
+                self._touch_pages(old)
+
+    # Чтение
+
+    def points(self, user_id):
+        return self._points.get(user_id)
+
+    def rank(self, user_id):
+        """Место студента (одинаковые баллы - одинаковое место) или None"""
+        with self._lock:
+            points = self._points.get(user_id)
+            if points is None:
+                return None
+            return len(self._points) - self._count_upto(points) + 1
+
+    def top(self, limit, offset=0):
+        """Страница топа: список (место, user_id, баллы)"""
+        key = (offset, limit)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                return page
+            page = []
+            above = 0
+            skip = offset
+            for score in reversed(self._scores):
+                bucket = self._buckets[score]
+                if skip >= len(bucket):
+                    skip -= len(bucket)
+                    above += len(bucket)
+                    continue
+                for user_id in heapq.nsmallest(skip + limit - len(page), bucket)[skip:]:
+                    page.append((above + 1, user_id, score))
+                skip = 0
+                above += len(bucket)
+                if len(page) >= limit:
+                    break
+            self._pages[key] = page
+            # Неполная страница охватывает и студентов с 0 баллов: ее меняет любое изменение
+            floor = page[-1][2] if len(page) >= limit else -1
+            self._pages_floor = floor if self._pages_floor is None else min(self._pages_floor, floor)
+            return page
+
+
+def _options():
+    return getattr(settings, 'LEADERBOARD', {})
+
+
+class Leaderboard:
+    """
+    Общий рейтинг по StudentProfile.points и оконные рейтинги по PointTransaction.
+
+    Общий индекс строится при первом обращении, а затем раз в REFRESH_INTERVAL
+    перестраивается в фоновом потоке: запросы тем временем читают прежний
+    индекс, а изменения баланса за время перестроения применяются к новому.
+    """
+
+    WINDOWS = {
+        'week': timedelta(days=7),
+        'month': timedelta(days=30),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._built_at = 0
+        self._windows = {}
+        self._refresher = None
+        self._replay = {}
+        self._generation = 0
+
+    def _build_global(self):
+        rows = StudentProfile.objects.filter(user__user_type='STUDENT').values_list('user_id', 'points')
+        return RankIndex.from_rows(rows.iterator(chunk_size=10000))
+
+    def index(self):
+        # Индекс процесса периодически перестраивается, чтобы подтянуть
+        # изменения, сделанные другими процессами
+        refresh = _options().get('REFRESH_INTERVAL', 300)
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_global()
+                self._built_at = time.monotonic()
+            elif self._refresher is None and time.monotonic() - self._built_at > refresh:
+                self._replay = {}
+                self._refresher = threading.Thread(
+                    target=self._refresh, args=(self._generation,), name='leaderboard-refresh', daemon=True
+                )
+                self._refresher.start()
+            return self._index
+
+    def _refresh(self, generation):
+        try:
+            index = self._build_global()
+        except Exception:
+            logger.exception('Failed to rebuild the leaderboard index')
+            index = None
+        finally:
+            connection.close()
+        with self._lock:
+            if generation == self._generation:
+                if index is not None:
+                    for user_id, balance in self._replay.items():
+                        index.update(user_id, balance)
+                    self._index = index
+                # При ошибке следующая попытка - через REFRESH_INTERVAL
+                self._built_at = time.monotonic()
+                self._refresher = None
+                self._replay = {}
+
+    def window_index(self, window=None, event_id=None):
+        key = (window, event_id)
+        ttl = _options().get('WINDOW_TTL', 60)
+        with self._lock:
+            cached = self._windows.get(key)
+            if cached is not None and time.monotonic() - cached[1] <= ttl:
+                return cached[0]
+        transactions = PointTransaction.objects.filter(points__gt=0, student__user_type='STUDENT')
+        if window is not None:
+            transactions = transactions.filter(timestamp__gte=timezone.now() - self.WINDOWS[window])
+        if event_id is not None:
+            transactions = transactions.filter(event_id=event_id)
+        rows = transactions.values('student_id').annotate(total=Sum('points')).values_list('student_id', 'total')
+        index = RankIndex.from_rows(rows.iterator(chunk_size=10000))
+        with self._lock:
+            self._windows[key] = (index, time.monotonic())
+        return index
+
+    def record(self, user_id, balance, delta, event_id=None):
+        """Вызывается после коммита изменения баланса"""
+        with self._lock:
+            index = self._index
+            windows = list(self._windows.items())
+            if self._refresher is not None:
+                self._replay[user_id] = balance
+        if index is not None:
+            index.update(user_id, balance)
+        # Оконные рейтинги учитывают только заработанные баллы
+        if delta > 0:
+            for (_, window_event_id), (window_index, _) in windows:
+                if window_event_id is None or window_event_id == event_id:
+                    window_index.add(user_id, delta)
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._windows = {}
+            # Перестроение, начатое до сброса, свой результат уже не установит
+            self._generation += 1
+            self._refresher = None
+            self._replay = {}
+
+
+def usernames(user_ids):
+    return dict(CustomUser.objects.filter(id__in=user_ids).values_list('id', 'username'))
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,206 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import StudentProfile, PointTransaction
+from .leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientPoints(Exception):
+    """Недостаточно баллов для списания"""
+
+    def __init__(self, required, available):
+        super().__init__(f"Недостаточно баллов: требуется {required}, доступно {available}")
+        self.required = required
+        self.available = available
+
+
+def _apply(user, delta, transaction_type, description, event=None, completed_event=None):
+    # Изменение баланса выполняется в БД (F-выражение) внутри одной транзакции:
+    # UPDATE блокирует строку профиля до коммита, поэтому прочитанный
+    # после него баланс принадлежит именно этой операции
+    with transaction.atomic():
+        profiles = StudentProfile.objects.filter(user_id=user.pk)
+        if delta < 0:
+            profiles = profiles.filter(points__gte=-delta)
+        updated = profiles.update(points=F('points') + delta, last_activity=timezone.now())
+        if not updated:
+            available = StudentProfile.objects.filter(user_id=user.pk).values_list('points', flat=True).first()
+            if available is None:
+                raise StudentProfile.DoesNotExist(f"User {user.pk} has no student profile")
+            raise InsufficientPoints(-delta, available)
+
+        balance = StudentProfile.objects.filter(user_id=user.pk).values_list('points', flat=True).get()
+        point_transaction = PointTransaction.objects.create(
+            student_id=user.pk,
+            event=event,
+            points=delta,
+            transaction_type=transaction_type,
+            description=description,
+            balance_after=balance,
+            completed_event=completed_event
+        )
+
+    # Синхронизируем закешированный на пользователе профиль
+    profile = user._state.fields_cache.get('student_profile')
+    if profile is not None:
+        profile.points = balance
+    # Рейтинг обновляется только после фиксации транзакции
+    event_id = event.pk if event is not None else None
+    transaction.on_commit(lambda: leaderboard.record(user.pk, balance, delta, event_id))
+    return point_transaction
+
+
+def credit(user, points, description, transaction_type='EARNED', event=None):
+    """Начислить баллы студенту. Возвращает созданную PointTransaction"""
+    if points < 0:
+        raise ValueError('points must be non-negative')
+    return _apply(user, points, transaction_type, description, event)
+
+
+def award_completion(user, event, description):
+    """
+    Начисление за прохождение мероприятия - не больше одного на пару
+    (студент, мероприятие), что гарантирует уникальное ограничение в БД, в
+    том числе при параллельных повторах запроса. Возвращает PointTransaction
+    или None, если за это прохождение баллы уже начислены.
+    """
+    awarded = PointTransaction.objects.filter(student_id=user.pk, completed_event=event)
+    if awarded.exists():
+        return None
+    try:
+        # Точка сохранения: при конфликте откатывается и изменение баланса
+        with transaction.atomic():
+            return _apply(user, event.points, 'EARNED', description, event, completed_event=event)
+    except IntegrityError:
+        # Параллельный повтор запроса успел начислить первым
+        if awarded.exists():
+            return None
+        raise
+
+
+def credit_many(awards, transaction_type='EARNED', completion=False):
+    """
+    Пакетное начисление: awards - список (user_id, points, description, event).
+    completion - начисления за прохождение (см. award_completion); повторное
+    начисление за то же прохождение нарушит ограничение и откатит всю пачку.
+
+    Профили блокируются одним SELECT FOR UPDATE, балансы считаются по порядку
+    списка, затем один bulk_update профилей и один bulk_create операций.
+    Возвращает баланс после каждого начисления (в порядке awards).
+    """
+    if any(points < 0 for _, points, _, _ in awards):
+        raise ValueError('points must be non-negative')
+    user_ids = {user_id for user_id, _, _, _ in awards}
+    now = timezone.now()
+    with transaction.atomic():
+        profiles = {
+            profile.user_id: profile
+            for profile in StudentProfile.objects.select_for_update().filter(user_id__in=user_ids).only('user_id', 'points')
+        }
+        missing = user_ids - profiles.keys()
+        if missing:
+            raise StudentProfile.DoesNotExist(f"Users {sorted(missing)} have no student profile")
+
+        balances, rows = [], []
+        for user_id, points, description, event in awards:
+            profile = profiles[user_id]
+            profile.points += points
+            profile.last_activity = now
+            balances.append(profile.points)
+            rows.append(PointTransaction(
+                student_id=user_id,
+                event=event,
+                points=points,
+                transaction_type=transaction_type,
+                description=description,
+                balance_after=profile.points,
+                completed_event=event if completion else None
+            ))
+        StudentProfile.objects.bulk_update(profiles.values(), ['points', 'last_activity'], batch_size=500)
+        PointTransaction.objects.bulk_create(rows, batch_size=500)
+
+        for (user_id, points, _, event), balance in zip(awards, balances):
+            event_id = event.pk if event is not None else None
+            transaction.on_commit(
+                lambda user_id=user_id, balance=balance, points=points, event_id=event_id:
+                    leaderboard.record(user_id, balance, points, event_id)
+            )
+    return balances
+
+
+def debit(user, points, description, transaction_type='SPENT', event=None):
+    """Списать баллы у студента, не допуская отрицательного баланса"""
+    if points < 0:
+        raise ValueError('points must be non-negative')
+    return _apply(user, -points, transaction_type, description, event)
+
+
+def get_balance(user):
+    return StudentProfile.objects.filter(user_id=user.pk).values_list('points', flat=True).first() or 0
+
+
+def balance_at(user_id, moment):
+    """
+    Баланс студента на момент moment по журналу операций.
+
+    Контрольная точка - balance_after последней операции не позже moment
+    (поиск по индексу (student, timestamp, id)). Миграция 0009 заполнила
+    balance_after у старых операций, так что операций без него быть не
+    должно; если они все же есть (запись в обход ledger), они досуммируются
+    к точке с предупреждением в лог - это медленный путь по истории.
+    """
+    history = PointTransaction.objects.filter(student_id=user_id, timestamp__lte=moment)
+    checkpoint = (
+        history.filter(balance_after__isnull=False)
+        .order_by('-timestamp', '-id')
+        .values_list('timestamp', 'id', 'balance_after')
+        .first()
+    )
+    unrecorded = history.filter(balance_after__isnull=True)
+    if checkpoint is None:
+        balance = 0
+    else:
+        timestamp, transaction_id, balance = checkpoint
+        unrecorded = unrecorded.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=transaction_id))
+    total, count = unrecorded.aggregate(total=Sum('points'), count=Count('id')).values()
+    if count:
+        logger.warning('Balance of user #%s summed %d transaction(s) without balance_after', user_id, count)
+    return balance + (total or 0)
+
+
+def reconcile_range(after, upto, fix=False):
+    """
+    Сверка StudentProfile.points с суммой журнала для профилей с
+    after < user_id <= upto: два агрегирующих запроса на диапазон.
+    При fix расхождение исправляется условным UPDATE (только если баланс не
+    изменился после чтения, иначе его изменила конкурентная операция), а
+    исправленный баланс попадает в рейтинг, как после _apply.
+    Возвращает (число профилей, [(user_id, points, по журналу, исправлено)]).
+    """
+    profiles = StudentProfile.objects.filter(user_id__gt=after, user_id__lte=upto)
+    balances = dict(profiles.values_list('user_id', 'points'))
+    totals = dict(
+        PointTransaction.objects.filter(student_id__gt=after, student_id__lte=upto)
+        .values('student_id').annotate(total=Sum('points')).order_by()
+        .values_list('student_id', 'total')
+    )
+    drifts = []
+    for user_id, points in balances.items():
+        expected = totals.get(user_id, 0)
+        if points == expected:
+            continue
+        fixed = False
+        if fix:
+            fixed = bool(StudentProfile.objects.filter(user_id=user_id, points=points).update(points=expected))
+            if fixed:
+                # Журнал не менялся - оконные рейтинги исправление не затрагивает
+                transaction.on_commit(
+                    lambda user_id=user_id, expected=expected: leaderboard.record(user_id, expected, 0)
+                )
+        drifts.append((user_id, points, expected, fixed))
+    return len(balances), drifts
@@ -0,0 +1,242 @@
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from mini.authentication import ClaimsRefreshToken
+from mini.counters import view_counter
+from mini.models import CustomUser, Event
+from mini.throttling import rate_limiter
+
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares throughput of the hot student endpoints served three ways: sync views under WSGI '
+        '(thread pool), the same sync views under ASGI and the native async views under ASGI. '
+        'Requests are driven in-process, without a network server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--events', type=int, default=50)
+        parser.add_argument('--participations', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint and mode')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='WSGI worker threads / concurrent ASGI requests')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Run only this mode (repeatable)')
+        parser.add_argument('--endpoint', action='append', help='Run only this endpoint (repeatable)')
+        parser.add_argument('--db-latency', type=float, default=0.0,
+                            help='Extra delay per SQL query in ms, emulates a network database')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Run against the already seeded current database instead of a fresh test one')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        delay = options['db_latency'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def install_delay(sender, connection, **kwargs):
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        if delay:
+            # У каждого потока свое соединение, задержка ставится на все
+            connection_created.connect(install_delay)
+        try:
+            if old_name is not None:
+                call_command(
+                    'generate_load_data',
+                    '--seed', str(options['seed']),
+                    '--prefix', 'benchasync',
+                    '--users', str(options['users']),
+                    '--events', str(options['events']),
+                    '--participations', str(options['participations']),
+                    stdout=io.StringIO(),
+                )
+            if delay:
+                install_delay(None, connection)
+            # Все запросы идут от одного клиента - лимиты замер не касаются
+            with rate_limiter.disabled():
+                results = self.run_modes(options)
+        finally:
+            connection_created.disconnect(install_delay)
+            view_counter.flush()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.report(results)
+
+    def scenarios(self):
+        student = CustomUser.objects.filter(user_type='STUDENT').order_by('id').first()
+        event = Event.objects.filter(event_type='QUIZ', is_active=True).order_by('id').first()
+        if student is None or event is None:
+            raise CommandError('Dataset has no students or no active quiz events')
+        answers = [
+            {'question_id': question.id, 'answer_id': question.answers.get(is_correct=True).id}
+            for question in event.quiz.questions.all()
+        ]
+        token = str(ClaimsRefreshToken.for_user(student).access_token)
+        # (имя, метод, путь без префикса /api/ или /api/async/, тело)
+        return token, [
+            ('event-list', 'GET', 'events/', None),
+            ('event-detail', 'GET', f'events/{event.id}/', None),
+            ('start-event', 'POST', f'events/{event.id}/start/', None),
+            ('submit-quiz', 'POST', f'events/{event.id}/submit-quiz/', {'answers': answers}),
+        ]
+
+    def run_modes(self, options):
+        token, scenarios = self.scenarios()
+        only = set(options['endpoint'] or [])
+        modes = options['mode'] or MODES
+        wsgi, asgi = WSGIHandler(), get_asgi_application()
+        results = []
+        for name, method, path, data in scenarios:
+            if only and name not in only:
+                continue
+            body = json.dumps(data).encode() if data is not None else b''
+            for mode in modes:
+                url = f'/api/async/{path}' if mode == 'asgi-async' else f'/api/{path}'
+                request = (method, url, body, token)
+                if mode == 'wsgi':
+                    # Прогрев: первый запрос импортирует и компилирует все нужное
+                    self.call_wsgi(wsgi, request)
+                    measured = self.run_wsgi(wsgi, request, options['requests'], options['concurrency'])
+                else:
+                    asyncio.run(self.call_asgi(asgi, request))
+                    measured = asyncio.run(self.run_asgi(asgi, request, options['requests'], options['concurrency']))
+                results.append((name, mode, measured))
+        return results
+
+    # WSGI: пул потоков, как у gunicorn --threads
+
+    def call_wsgi(self, handler, request):
+        method, url, body, token = request
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_AUTHORIZATION': f'Bearer {token}',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+        }
+        status = []
+        response = handler(environ, lambda status_line, headers, exc_info=None: status.append(status_line))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return int(status[0].split()[0])
+
+    def run_wsgi(self, handler, request, total, concurrency):
+        def timed(_):
+            started = time.perf_counter()
+            code = self.call_wsgi(handler, request)
+            return code, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, range(total)))
+        return self.summarize(outcomes, time.perf_counter() - started)
+
+    # ASGI: один цикл событий, как у uvicorn с одним воркером
+
+    async def call_asgi(self, application, request):
+        method, url, body, token = request
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': url,
+            'raw_path': url.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Bearer {token}'.encode()),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        finished = asyncio.Event()
+        received = False
+        status = []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Клиент не отключается, пока ответ не отправлен целиком
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await application(scope, receive, send)
+        return status[0]
+
+    async def run_asgi(self, application, request, total, concurrency):
+        remaining = iter(range(total))
+        outcomes = []
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                code = await self.call_asgi(application, request)
+                outcomes.append((code, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return self.summarize(outcomes, time.perf_counter() - started)
+
+    # Отчет
+
+    def summarize(self, outcomes, elapsed):
+        latencies = sorted(duration * 1000 for _, duration in outcomes)
+        return {
+            'rps': len(outcomes) / elapsed,
+            'p50_ms': latencies[len(latencies) // 2],
+            'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'errors': sum(1 for code, _ in outcomes if code >= 400),
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<16}{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, mode, result in results:
+            self.stdout.write(
+                f"{name:<16}{mode:<12}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['errors']:>8}"
+            )
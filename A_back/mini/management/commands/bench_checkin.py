@@ -0,0 +1,122 @@
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from mini.authentication import ClaimsRefreshToken
+from mini.checkin import checkin_signer
+from mini.counters import ViewCounterBuffer, view_counter
+from mini.models import CustomUser, Event, EventParticipation, StudentProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'QR check-in throughput on a fresh test database: token verification alone, '
+        'verify-and-enqueue from many threads, and the full /api/checkin/ request path; '
+        'then checks that every accepted check-in became exactly one EventParticipation'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2_000)
+        parser.add_argument('--verify-iterations', type=int, default=20_000)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--flush-threshold', type=int, default=500)
+        parser.add_argument('--phone-start', type=int, default=9_300_000_000)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            view_counter.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        password = make_password(None)
+        phones = [str(options['phone_start'] + index) for index in range(options['students'] + 1)]
+        # Без сигналов: профили и сводки для замера не нужны, только строки пользователей
+        CustomUser.objects.bulk_create(
+            [CustomUser(username=f'checkin_{phone}', phone=phone, password=password) for phone in phones],
+            batch_size=1000
+        )
+        manager = CustomUser.objects.get(phone=phones[0])
+        CustomUser.objects.filter(id=manager.id).update(user_type='MANAGER')
+        students = list(CustomUser.objects.filter(phone__in=phones[1:]).order_by('id'))
+        StudentProfile.objects.bulk_create([StudentProfile(user=student) for student in students], batch_size=1000)
+        events = [
+            Event.objects.create(title=f'Check-in {index}', description='bench', event_type='QUEST', manager=manager)
+            for index in range(2)
+        ]
+        return students, events
+
+    def run(self, options):
+        students, (enqueue_event, request_event) = self.seed(options)
+
+        # 1. Только проверка подписи
+        token, _ = checkin_signer.mint(enqueue_event.id, slot='gate-a')
+        started = time.perf_counter()
+        for _ in range(options['verify_iterations']):
+            checkin_signer.verify(token)
+        verify_rate = options['verify_iterations'] / (time.perf_counter() - started)
+
+        # 2. Проверка и постановка в буфер из нескольких потоков (сброс - по порогу)
+        buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=options['flush_threshold'], background=False)
+        position = iter(students)
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        student = next(position, None)
+                    if student is None:
+                        return
+                    event_id, _ = checkin_signer.verify(token)
+                    buffer.record_participant(event_id, student.id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.flush()
+        enqueue_rate = len(students) / (time.perf_counter() - started)
+
+        # 3. Полный путь запроса: JWT из claims, проверка токена, буфер
+        token, _ = checkin_signer.mint(request_event.id)
+        client = Client()
+        headers = [
+            {'HTTP_AUTHORIZATION': f'Bearer {ClaimsRefreshToken.for_user(student).access_token}'}
+            for student in students
+        ]
+        failures = 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for header in headers:
+                response = client.post('/api/checkin/', {'token': token}, content_type='application/json', **header)
+                failures += response.status_code != 202
+            view_counter.flush()
+            request_rate = len(students) / (time.perf_counter() - started)
+
+        self.stdout.write(f"verify only            {verify_rate:>10.0f} tokens/s")
+        self.stdout.write(f"verify + enqueue       {enqueue_rate:>10.0f} check-ins/s ({options['workers']} threads, incl. flushes)")
+        self.stdout.write(f"POST /api/checkin/     {request_rate:>10.0f} check-ins/s (1 thread, incl. flushes)")
+        self.stdout.write(f"SQL queries per check-in (amortized flushes): {len(queries) / len(students):.3f}")
+
+        expected = len(students)
+        created = {
+            event.id: EventParticipation.objects.filter(event=event).count()
+            for event in (enqueue_event, request_event)
+        }
+        if failures or any(count != expected for count in created.values()):
+            raise CommandError(
+                f'{failures} failed requests; participations {created}, expected {expected} per event'
+            )
+        self.stdout.write(self.style.SUCCESS(f'All {expected * 2} check-ins recorded exactly once'))
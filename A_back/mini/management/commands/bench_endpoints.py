@@ -0,0 +1,227 @@
+import gc
+import io
+import itertools
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from mini.authentication import ClaimsRefreshToken
+from mini.counters import view_counter
+from mini.models import CustomUser, Event, EventParticipation, Feedback, Merchandise, MerchOrder, StudentProfile
+from mini.throttling import rate_limiter
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / 'bench_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives the API endpoints against a seeded test database and checks SQL query count, '
+        'latency and response size against a committed baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--events', type=int, default=100)
+        parser.add_argument('--participations', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--endpoint', action='append', help='Run only this endpoint (repeatable)')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the measured results as the new baseline')
+        parser.add_argument('--latency-tolerance', type=float, default=1.0,
+                            help='Allowed relative p50/p99 latency growth over the baseline')
+        parser.add_argument('--latency-slack', type=float, default=20.0,
+                            help='Absolute latency slack in ms, absorbs single GC / IO pauses on short runs')
+        parser.add_argument('--size-tolerance', type=float, default=0.2,
+                            help='Allowed relative response size growth over the baseline')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Only enforce query-count budgets (latency is noisy on shared CI)')
+
+    def handle(self, *args, **options):
+        # Сценарии пишут в БД (регистрации, покупки, отзывы) - только в тестовую
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command(
+                'generate_load_data',
+                '--seed', str(options['seed']),
+                '--prefix', 'bench',
+                '--users', str(options['users']),
+                '--events', str(options['events']),
+                '--participations', str(options['participations']),
+                '--bonus-transactions', str(options['users'] * 5),
+                '--orders', str(options['users']),
+                stdout=io.StringIO(),
+            )
+            # Все запросы идут от одного клиента - лимиты замер не касаются
+            with rate_limiter.disabled():
+                results = self.run_scenarios(options)
+        finally:
+            # Отложенные просмотры должны попасть в тестовую базу до ее удаления
+            view_counter.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            raise CommandError(f'Baseline {baseline_path} not found, run with --update-baseline first')
+        failures = self.compare(results, json.loads(baseline_path.read_text()), options)
+        if failures:
+            raise CommandError(f'{len(failures)} budget(s) exceeded:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All endpoints are within budget'))
+
+    # Сценарии
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+        return client
+
+    def scenarios(self):
+        student = (
+            CustomUser.objects.filter(
+                user_type='STUDENT', participations__completed=True, participations__event__event_type='QUIZ'
+            ).order_by('id').first()
+        )
+        manager = CustomUser.objects.filter(user_type='MANAGER').order_by('id').first()
+        if student is None or manager is None:
+            raise CommandError('Dataset has no students with completed events or no managers')
+        # Баллов и остатков хватает на все итерации покупок
+        StudentProfile.objects.filter(user=student).update(points=100_000)
+        quiz_event = Event.objects.filter(event_type='QUIZ', is_active=True).order_by('id').first()
+        merch = Merchandise.objects.order_by('id').first()
+        Merchandise.objects.filter(id=merch.id).update(stock_quantity=10 ** 6, is_available=True)
+        order = MerchOrder.objects.filter(student=student).first() or MerchOrder.objects.create(
+            student=student, merchandise=merch, points_spent=0
+        )
+        answers = [
+            {'question_id': question.id, 'answer_id': question.answers.get(is_correct=True).id}
+            for question in quiz_event.quiz.questions.all()
+        ]
+        # Мероприятие с квизом - самый тяжелый вариант сериализации
+        completed_event_id = EventParticipation.objects.filter(
+            student=student, completed=True
+        ).order_by('-event__event_type', 'event_id').values_list('event_id', flat=True).first()
+
+        phones = itertools.count(9_100_000_000)
+
+        def reset_feedback():
+            Feedback.objects.filter(event_id=completed_event_id, student=student).delete()
+
+        anonymous = APIClient()
+        as_student = self.client_for(student)
+        as_manager = self.client_for(manager)
+        # (имя, клиент, метод, url, тело или функция, возвращающая тело, подготовка перед итерацией)
+        return [
+            ('register', anonymous, 'post', reverse('register'), lambda: {'phone': str(next(phones))}, None),
+            ('login', anonymous, 'post', reverse('login'), {'phone': student.phone}, None),
+            ('event-list', as_student, 'get', reverse('event-list'), None, None),
+            ('event-detail', as_student, 'get', reverse('event-detail', args=[quiz_event.id]), None, None),
+            ('start-event', as_student, 'post', reverse('start-event', args=[quiz_event.id]), None, None),
+            ('submit-quiz', as_student, 'post', reverse('submit-quiz', args=[quiz_event.id]),
+             {'answers': answers}, None),
+            ('submit-feedback', as_student, 'post', reverse('submit-feedback', args=[completed_event_id]),
+             {'rating': 5, 'comment': 'bench'}, reset_feedback),
+            ('purchase-merch', as_student, 'post', reverse('purchase-merch', args=[merch.id]), {'quantity': 1}, None),
+            ('manager-analytics', as_manager, 'get', reverse('manager-analytics'), None, None),
+            ('event-analytics', as_manager, 'get', reverse('event-analytics', args=[completed_event_id]), None, None),
+            ('completed-events', as_student, 'get', reverse('completed-events'), None, None),
+            ('my-feedbacks', as_student, 'get', reverse('my-feedbacks'), None, None),
+            ('my-activity', as_student, 'get', reverse('my-activity'), None, None),
+            ('merchandise-list', as_student, 'get', reverse('merchandise-list'), None, None),
+            ('merchandise-detail', as_student, 'get', reverse('merchandise-detail', args=[merch.id]), None, None),
+            ('merch-orders-list', as_student, 'get', reverse('merch-orders-list'), None, None),
+            ('merch-order-detail', as_student, 'get', reverse('merch-order-detail', args=[order.id]), None, None),
+            ('points-history', as_student, 'get', reverse('points-history'), None, None),
+            ('balance-at', as_student, 'get', reverse('balance-at') + '?at=2030-01-01T00:00:00Z', None, None),
+            ('leaderboard', as_student, 'get', reverse('leaderboard'), None, None),
+        ]
+
+    def prepare(self, data, before):
+        """Подготовка итерации вне замера: сброс состояния и тело запроса"""
+        if before is not None:
+            before()
+        return data() if callable(data) else data
+
+    def run_scenarios(self, options):
+        results = {}
+        only = set(options['endpoint'] or [])
+        for name, client, method, url, data, before in self.scenarios():
+            if only and name not in only:
+                continue
+            for _ in range(options['warmup']):
+                getattr(client, method)(url, self.prepare(data, before), format='json')
+            # Как timeit: сборщик мусора выключен, чтобы его паузы не попадали в p99
+            gc.collect()
+            gc.disable()
+            try:
+                results[name] = self.measure(name, client, method, url, data, before, options['iterations'])
+            finally:
+                gc.enable()
+        return results
+
+    def measure(self, name, client, method, url, data, before, iterations):
+        queries, latencies, sizes = [], [], []
+        for _ in range(iterations):
+            body = self.prepare(data, before)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, body, format='json')
+                latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f'{name}: HTTP {response.status_code} {response.content[:200]!r}')
+            queries.append(len(captured))
+            sizes.append(len(response.content))
+        latencies.sort()
+        return {
+            'queries': int(statistics.median(queries)),
+            'queries_max': max(queries),
+            'p50_ms': round(latencies[len(latencies) // 2], 3),
+            'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+            'bytes': int(statistics.median(sizes)),
+        }
+
+    # Отчет и сравнение с базовой линией
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<22}{'queries':>8}{'max':>6}{'p50 ms':>10}{'p99 ms':>10}{'bytes':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<22}{result['queries']:>8}{result['queries_max']:>6}"
+                f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['bytes']:>10}"
+            )
+
+    def compare(self, results, baseline, options):
+        failures = []
+        tolerance = 1 + options['latency_tolerance']
+        slack = options['latency_slack']
+        size_tolerance = 1 + options['size_tolerance']
+        for name, result in results.items():
+            budget = baseline.get(name)
+            if budget is None:
+                failures.append(f'{name}: no baseline entry')
+                continue
+            if result['queries'] > budget['queries']:
+                failures.append(f"{name}: {result['queries']} queries > budget {budget['queries']}")
+            if options['queries_only']:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                limit = budget[metric] * tolerance + slack
+                if result[metric] > limit:
+                    failures.append(f"{name}: {metric} {result[metric]:.2f} > budget {limit:.2f}")
+            if result['bytes'] > budget['bytes'] * size_tolerance:
+                failures.append(f"{name}: {result['bytes']} bytes > budget {budget['bytes'] * size_tolerance:.0f}")
+        return failures
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from mini.leaderboard import RankIndex
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the in-memory leaderboard index (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1_000_000)
+        parser.add_argument('--max-points', type=int, default=20_000)
+        parser.add_argument('--operations', type=int, default=200_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        students = options['students']
+        max_points = options['max_points']
+        operations = options['operations']
+
+        rows = [(user_id, int(rng.paretovariate(1.5) * 10) % max_points) for user_id in range(1, students + 1)]
+        started = time.perf_counter()
+        index = RankIndex.from_rows(rows)
+        self._report('build', students, time.perf_counter() - started)
+
+        user_ids = [rng.randint(1, students) for _ in range(operations)]
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            index.rank(user_id)
+        self._report('rank lookup', operations, time.perf_counter() - started)
+
+        deltas = [rng.randint(-20, 100) for _ in range(operations)]
+        started = time.perf_counter()
+        for user_id, delta in zip(user_ids, deltas):
+            index.add(user_id, delta)
+        self._report('point update', operations, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        index.top(100)
+        self._report('top-100 (cold)', 1, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(operations):
+            index.top(100)
+        self._report('top-100 (cached)', operations, time.perf_counter() - started)
+
+        # Смешанная нагрузка: в основном начисления студентам вне топа
+        started = time.perf_counter()
+        for i, (user_id, delta) in enumerate(zip(user_ids, deltas)):
+            if i % 10 == 0:
+                index.top(100)
+            elif i % 2:
+                index.rank(user_id)
+            else:
+                index.add(user_id, delta)
+        self._report('mixed', operations, time.perf_counter() - started)
+
+    def _report(self, name, count, elapsed):
+        per_op = elapsed / count * 1_000_000 if count else 0
+        rate = count / elapsed if elapsed else float('inf')
+        self.stdout.write(f'{name:<18} {count:>10} ops  {elapsed:8.3f}s  {per_op:10.2f} us/op  {rate:12.0f} ops/s')
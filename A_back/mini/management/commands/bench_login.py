@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+
+from mini.counters import view_counter
+from mini.models import CustomUser, StudentProfile
+from mini.throttling import rate_limiter
+
+
+class Command(BaseCommand):
+    help = (
+        'Login storm: many threads log in with the same set of phones at once through LoginView '
+        'on a fresh test database, then checks that no duplicate users or profiles were created'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=500, help='Distinct students')
+        parser.add_argument('--repeat', type=int, default=4, help='Logins per phone (the storm)')
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--phone-start', type=int, default=9_200_000_000)
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Run against the current database instead of a fresh test one')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Шторм входов идет с одного адреса - лимит по IP замер не касается
+            with rate_limiter.disabled():
+                self.storm(options)
+        finally:
+            view_counter.flush()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def storm(self, options):
+        phone_start = options['phone_start']
+        phones = [str(phone_start + index) for index in range(options['phones'])]
+        # Каждый номер встречается repeat раз подряд, поэтому одновременные входы
+        # с одним номером попадают в разные потоки
+        requests = [phone for phone in phones for _ in range(options['repeat'])]
+        users_before = CustomUser.objects.count()
+        # Номера, которые уже есть в базе (при --use-current-db), входят без создания
+        existing = CustomUser.objects.filter(phone__in=phones).count()
+
+        lock = threading.Lock()
+        position = iter(range(len(requests)))
+        latencies, failures = [], []
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        index = next(position, None)
+                    if index is None:
+                        return
+                    started = time.perf_counter()
+                    response = client.post(
+                        '/api/login/', {'phone': f"+7{requests[index]}"}, content_type='application/json'
+                    )
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed * 1000)
+                        if response.status_code != 200:
+                            failures.append((requests[index], response.status_code))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"{len(requests)} logins ({len(phones)} phones x {options['repeat']}) "
+            f"with {options['workers']} workers in {elapsed:.2f}s: {len(requests) / elapsed:.0f} logins/s"
+        )
+        self.stdout.write(
+            f"latency p50 {latencies[len(latencies) // 2]:.2f}ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99)]:.2f}ms  max {latencies[-1]:.2f}ms"
+        )
+
+        created = CustomUser.objects.count() - users_before
+        duplicates = (
+            CustomUser.objects.filter(phone__in=phones).values('phone')
+            .annotate(count=Count('id')).filter(count__gt=1).count()
+        )
+        profiles = StudentProfile.objects.filter(user__phone__in=phones).count()
+        self.stdout.write(f'created users: {created}, duplicate phones: {duplicates}, profiles: {profiles}')
+        if failures:
+            raise CommandError(f'{len(failures)} logins failed, first: {failures[0]}')
+        if duplicates or created != len(phones) - existing or profiles != len(phones):
+            raise CommandError('Login storm produced duplicate or missing users')
+        self.stdout.write(self.style.SUCCESS('No duplicate users'))
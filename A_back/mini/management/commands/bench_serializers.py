@@ -0,0 +1,85 @@
+import io
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from mini.counters import view_counter
+from mini.fast_serializers import fast_events, fast_feedback, fast_merch_orders
+from mini.models import Event, Feedback, MerchOrder
+from mini.serializers import EventSerializer, FeedbackSerializer, MerchOrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Microbenchmark of the fast .values() serializers against the DRF serializers they '
+        'replace, on a fresh test database: time per list (queries + serialization + JSON '
+        'rendering) and a byte-for-byte comparison of the rendered output'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--participations', type=int, default=10_000)
+        parser.add_argument('--orders', type=int, default=2_000)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer; the best is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command(
+                'generate_load_data',
+                '--seed', str(options['seed']),
+                '--prefix', 'benchser',
+                '--users', str(options['users']),
+                '--events', str(options['events']),
+                '--participations', str(options['participations']),
+                '--orders', str(options['orders']),
+                stdout=io.StringIO(),
+            )
+            results = self.run(options)
+        finally:
+            view_counter.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'serializer':<24}{'rows':>8}{'DRF ms':>10}{'fast ms':>10}{'speedup':>9}")
+        for name, rows, slow, fast in results:
+            self.stdout.write(f'{name:<24}{rows:>8}{slow * 1000:>10.1f}{fast * 1000:>10.1f}{slow / fast:>8.1f}x')
+
+    def best(self, build, repeat):
+        timings, body = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = build()
+            timings.append(time.perf_counter() - started)
+        return min(timings), body
+
+    def run(self, options):
+        renderer = JSONRenderer()
+        events = Event.objects.order_by('-created_at')
+        feedbacks = Feedback.objects.order_by('-created_at')
+        orders = MerchOrder.objects.all()
+        cases = [
+            ('EventSerializer', events.count(),
+             lambda: renderer.render(EventSerializer(EventSerializer.setup_eager_loading(events), many=True).data),
+             lambda: fast_events.render(events)),
+            ('FeedbackSerializer', feedbacks.count(),
+             lambda: renderer.render(FeedbackSerializer(
+                 EventSerializer.setup_eager_loading(feedbacks.select_related('event'), prefix='event__'), many=True
+             ).data),
+             lambda: fast_feedback.render(feedbacks)),
+            ('MerchOrderSerializer', orders.count(),
+             lambda: renderer.render(MerchOrderSerializer(orders.select_related('student', 'merchandise'), many=True).data),
+             lambda: fast_merch_orders.render(orders)),
+        ]
+        results = []
+        for name, rows, slow_build, fast_build in cases:
+            slow, expected = self.best(slow_build, options['repeat'])
+            fast, actual = self.best(fast_build, options['repeat'])
+            if actual != expected:
+                raise CommandError(f'{name}: fast output differs from the DRF serializer')
+            results.append((name, rows, slow, fast))
+        return results
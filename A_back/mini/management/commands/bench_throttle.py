@@ -0,0 +1,51 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from mini.throttling import TokenBucketLimiter, parse_rate, rate_limiter
+
+
+class Command(BaseCommand):
+    help = (
+        'Cost of the token-bucket throttle: a bare limiter check (admitted and rejected) '
+        'and a full POST /api/login/ that is rejected with 429 before reaching the view'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100_000)
+        parser.add_argument('--requests', type=int, default=2_000)
+        parser.add_argument('--keys', type=int, default=10_000, help='Distinct clients for the admitted checks')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        limiter = TokenBucketLimiter()
+        rate = parse_rate('1000000/min')
+        keys = [f'bench:user:{index}' for index in range(options['keys'])]
+        started = time.perf_counter()
+        for index in range(iterations):
+            limiter.hit(keys[index % len(keys)], rate)
+        admitted = (time.perf_counter() - started) / iterations
+
+        rate = parse_rate('1/hour')
+        limiter.hit('bench:ip:1', rate)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            limiter.hit('bench:ip:1', rate)
+        rejected = (time.perf_counter() - started) / iterations
+
+        # Полный путь через Django и DRF; до обращения к БД запрос не доходит.
+        # Адрес из TEST-NET, чтобы в общем кеше лимитов не задеть реальных клиентов
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        with rate_limiter.overridden({'login': {'ip': '1/hour'}}):
+            client.post('/api/login/', {}, content_type='application/json')
+            started = time.perf_counter()
+            statuses = Counter()
+            for _ in range(options['requests']):
+                statuses.update([client.post('/api/login/', {}, content_type='application/json').status_code])
+            request = (time.perf_counter() - started) / options['requests']
+
+        self.stdout.write(f'limiter check, admitted  {admitted * 1e6:>8.2f} us')
+        self.stdout.write(f'limiter check, rejected  {rejected * 1e6:>8.2f} us')
+        self.stdout.write(f'429 request end to end   {request * 1e6:>8.2f} us (statuses {dict(statuses)})')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mini import exports
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams participations, feedback, point transactions or merch orders as CSV or NDJSON '
+        'with constant memory, same format as the /api/exports/ endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--event', help='Only rows of this event id')
+        parser.add_argument('--manager', help='Only rows of events owned by this manager id')
+        parser.add_argument('--date-from', help='YYYY-MM-DD or ISO 8601 datetime, inclusive')
+        parser.add_argument('--date-to', help='YYYY-MM-DD (whole day) or ISO 8601 datetime, inclusive')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            rows = exports.build_rows(
+                options['dataset'],
+                event=options['event'],
+                manager=options['manager'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+            )
+            content = exports.stream(options['dataset'], options['fmt'], rows, chunk_size=options['chunk_size'])
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+
+        if not options['output']:
+            for chunk in content:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+        with open(options['output'], 'wb') as output:
+            for chunk in content:
+                output.write(chunk)
+        self.stderr.write(f"Exported {options['dataset']} to {options['output']}")
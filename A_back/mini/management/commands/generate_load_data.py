@@ -0,0 +1,280 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from mini.models import (
+    CustomUser, StudentProfile, ManagerProfile, Event, Quiz, QuizQuestion, QuizAnswer, Minigame,
+    EventParticipation, Feedback, PointTransaction, Merchandise, MerchOrder,
+)
+
+UNUSABLE_PASSWORD = f"{UNUSABLE_PASSWORD_PREFIX}load"
+
+COMMENTS = ['Отлично!', 'Было интересно', 'Сложновато', 'Хочу еще', None]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключает auto_now/auto_now_add, чтобы сохранить сгенерированные даты"""
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def spread(total, parts, rng):
+    """Раскладывает total по parts корзинам почти поровну (остаток - случайно)"""
+    base, remainder = divmod(total, parts)
+    extra = set(rng.sample(range(parts), remainder)) if remainder else set()
+    return [base + (1 if index in extra else 0) for index in range(parts)]
+
+
+class Command(BaseCommand):
+    help = 'Generates a reproducible synthetic dataset of configurable size for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='load', help='Prefix for generated usernames')
+        parser.add_argument('--phone-start', type=int, default=5_000_000_000,
+                            help='First phone number of generated students (managers go below it)')
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--questions', type=int, default=5, help='Questions per quiz')
+        parser.add_argument('--merch', type=int, default=20)
+        parser.add_argument('--participations', type=int, default=100_000)
+        parser.add_argument('--completion-rate', type=float, default=0.6)
+        parser.add_argument('--feedback-rate', type=float, default=0.3, help='Share of completions with feedback')
+        parser.add_argument('--bonus-transactions', type=int, default=10_000)
+        parser.add_argument('--orders', type=int, default=5_000)
+        parser.add_argument('--days', type=int, default=90, help='History length')
+        parser.add_argument('--chunk-size', type=int, default=5_000, help='Users per chunk')
+        parser.add_argument('--batch-size', type=int, default=2_000, help='Rows per INSERT')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild analytics rollups')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        self.rows = {}
+        prefix = options['prefix']
+
+        if CustomUser.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(f'Users with prefix "{prefix}_" already exist, use another --prefix')
+        if options['participations'] > options['users'] * options['events']:
+            raise CommandError('Not enough (user, event) pairs for the requested participations')
+
+        started = time.perf_counter()
+        with explicit_timestamps(CustomUser, StudentProfile, Event, EventParticipation, Feedback,
+                                 PointTransaction, Merchandise, MerchOrder):
+            with transaction.atomic():
+                self.create_catalogue()
+            self.create_students()
+            with transaction.atomic():
+                Event.objects.bulk_update(self.events, ['views_count', 'completion_count'], batch_size=self.batch_size)
+
+        elapsed = time.perf_counter() - started
+        total = sum(self.rows.values())
+        for name, count in self.rows.items():
+            self.stdout.write(f'{name:<20} {count:>12}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)'
+        ))
+
+        if not options['skip_rollups']:
+            call_command('rebuild_rollups', stdout=self.stdout)
+
+    # Вспомогательные методы
+
+    def timestamp(self, after=None):
+        start = after or self.start
+        span = max((self.now - start).total_seconds(), 1)
+        return start + timedelta(seconds=self.rng.random() * span)
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        name = model.__name__
+        self.rows[name] = self.rows.get(name, 0) + len(objects)
+        return objects
+
+    # Каталог: менеджеры, мероприятия с квизами, мерч
+
+    def create_catalogue(self):
+        rng, prefix = self.rng, self.options['prefix']
+        managers = self.bulk(CustomUser, [
+            CustomUser(
+                username=f"{prefix}_manager_{index}",
+                email=f"{prefix}_manager_{index}@x5.ru",
+                password=UNUSABLE_PASSWORD,
+                phone=str(self.options['phone_start'] - 1 - index),
+                user_type='MANAGER',
+                created_at=self.start,
+                updated_at=self.start,
+            )
+            for index in range(self.options['managers'])
+        ])
+        self.bulk(ManagerProfile, [ManagerProfile(user=manager, company='X5') for manager in managers])
+
+        self.events = []
+        for index in range(self.options['events']):
+            created_at = self.timestamp()
+            self.events.append(Event(
+                title=f"Event {index}",
+                description=f"Synthetic event {index}",
+                event_type='QUIZ' if rng.random() < 0.8 else 'MINIGAME',
+                manager=rng.choice(managers),
+                points=rng.choice((10, 20, 30, 40, 50)),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        self.bulk(Event, self.events)
+
+        quiz_events = [event for event in self.events if event.event_type == 'QUIZ']
+        quizzes = self.bulk(Quiz, [Quiz(event=event, passing_score=70) for event in quiz_events])
+        self.bulk(Minigame, [
+            Minigame(event=event, instructions='Synthetic minigame')
+            for event in self.events if event.event_type == 'MINIGAME'
+        ])
+        questions = self.bulk(QuizQuestion, [
+            QuizQuestion(quiz=quiz, question_text=f"Question {order}", order=order)
+            for quiz in quizzes
+            for order in range(1, self.options['questions'] + 1)
+        ])
+        correct = {question.pk: rng.randrange(4) for question in questions}
+        self.bulk(QuizAnswer, [
+            QuizAnswer(question=question, answer_text=f"Answer {option}", is_correct=option == correct[question.pk])
+            for question in questions
+            for option in range(4)
+        ])
+
+        self.merch = self.bulk(Merchandise, [
+            Merchandise(
+                name=f"{prefix} merch {index}",
+                merch_type=rng.choice(Merchandise.MERCH_TYPE_CHOICES)[0],
+                points_cost=rng.choice((30, 60, 80, 100, 200)),
+                stock_quantity=rng.randint(0, 1000),
+                created_at=self.start,
+                updated_at=self.start,
+            )
+            for index in range(self.options['merch'])
+        ])
+
+    # Студенты и их история, порциями
+
+    def create_students(self):
+        users = self.options['users']
+        chunk_size = self.options['chunk_size']
+        chunks = (users + chunk_size - 1) // chunk_size
+        participations = spread(self.options['participations'], users, self.rng)
+        bonuses = spread(self.options['bonus_transactions'], users, self.rng)
+        orders = spread(self.options['orders'], users, self.rng) if self.merch else [0] * users
+
+        for chunk in range(chunks):
+            first = chunk * chunk_size
+            last = min(first + chunk_size, users)
+            with transaction.atomic():
+                self.create_chunk(range(first, last), participations, bonuses, orders)
+            self.stdout.write(f'  users {last}/{users}', ending='\r')
+            self.stdout.flush()
+        self.stdout.write('')
+
+    def create_chunk(self, indexes, participation_counts, bonus_counts, order_counts):
+        rng, prefix = self.rng, self.options['prefix']
+        completion_rate = self.options['completion_rate']
+        feedback_rate = self.options['feedback_rate']
+
+        students = []
+        for index in indexes:
+            created_at = self.timestamp()
+            students.append(CustomUser(
+                username=f"{prefix}_{index}",
+                email=f"{prefix}_{index}@x5.ru",
+                password=UNUSABLE_PASSWORD,
+                phone=str(self.options['phone_start'] + index),
+                user_type='STUDENT',
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        self.bulk(CustomUser, students)
+
+        participations, feedbacks, transactions, orders, profiles = [], [], [], [], []
+        for index, student in zip(indexes, students):
+            history = []
+            for event in rng.sample(self.events, participation_counts[index]):
+                first_viewed = self.timestamp(max(student.created_at, event.created_at))
+                completed = rng.random() < completion_rate
+                completed_at = self.timestamp(first_viewed) if completed else None
+                event.views_count += rng.randint(1, 3)
+                participations.append(EventParticipation(
+                    event_id=event.pk,
+                    student_id=student.pk,
+                    completed=completed,
+                    score=rng.randint(70, 100) if completed else rng.randint(0, 69),
+                    completed_at=completed_at,
+                    first_viewed=first_viewed,
+                ))
+                if completed:
+                    event.completion_count += 1
+                    history.append((completed_at, event.points, 'EARNED', f"Completed event: {event.title}", event.pk, event.pk))
+                    if rng.random() < feedback_rate:
+                        feedbacks.append(Feedback(
+                            event_id=event.pk,
+                            student_id=student.pk,
+                            rating=rng.randint(1, 5),
+                            comment=rng.choice(COMMENTS),
+                            created_at=self.timestamp(completed_at),
+                        ))
+            for _ in range(bonus_counts[index]):
+                history.append((self.timestamp(student.created_at), rng.choice((5, 10, 25)), 'BONUS', 'Bonus', None, None))
+
+            # Хронологическая история баллов с балансом после каждой операции
+            history.sort(key=lambda item: item[0])
+            balance = 0
+            last_activity = student.created_at
+            for timestamp, points, transaction_type, description, event_id, completed_event_id in history:
+                balance += points
+                last_activity = timestamp
+                transactions.append(PointTransaction(
+                    student_id=student.pk, event_id=event_id, completed_event_id=completed_event_id, points=points,
+                    transaction_type=transaction_type, description=description, timestamp=timestamp,
+                    balance_after=balance,
+                ))
+            # Покупки - после накопления баллов, только если хватает баланса
+            for _ in range(order_counts[index]):
+                merch = rng.choice(self.merch)
+                if merch.points_cost > balance:
+                    continue
+                ordered_at = self.timestamp(last_activity)
+                balance -= merch.points_cost
+                last_activity = ordered_at
+                orders.append(MerchOrder(
+                    student_id=student.pk, merchandise_id=merch.pk, quantity=1, points_spent=merch.points_cost,
+                    status=rng.choice(MerchOrder.ORDER_STATUS_CHOICES)[0], phone=student.phone,
+                    created_at=ordered_at, updated_at=ordered_at,
+                ))
+                transactions.append(PointTransaction(
+                    student_id=student.pk, points=-merch.points_cost, transaction_type='SPENT',
+                    description=f"Покупка мерча: {merch.name} x1", timestamp=ordered_at, balance_after=balance,
+                ))
+            profiles.append(StudentProfile(user_id=student.pk, points=balance, last_activity=last_activity))
+
+        self.bulk(StudentProfile, profiles)
+        self.bulk(EventParticipation, participations)
+        self.bulk(Feedback, feedbacks)
+        self.bulk(PointTransaction, transactions)
+        self.bulk(MerchOrder, orders)
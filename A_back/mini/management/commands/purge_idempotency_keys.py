@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mini.idempotency import idempotency_store
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored Idempotency-Key responses older than IDEMPOTENCY["TTL"]; run periodically from cron'
+
+    def handle(self, *args, **options):
+        deleted = idempotency_store.purge()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired idempotency keys deleted'))
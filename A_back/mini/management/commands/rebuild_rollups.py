@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mini.models import EventStats, GlobalStats
+from mini.rollups import EVENT_STATS_FIELDS, GLOBAL_STATS_ID, compute_event_stats, compute_global_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds analytics rollups from source tables and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, do not write anything')
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        verbose = options['verbosity'] >= 2
+        drift = 0
+
+        with transaction.atomic():
+            expected = compute_event_stats()
+            current = {stats.event_id: stats for stats in EventStats.objects.all()}
+
+            to_create, to_update = [], []
+            for event_id, values in expected.items():
+                stats = current.get(event_id)
+                if stats is None:
+                    drift += 1
+                    if verbose:
+                        self.stdout.write(self.style.WARNING(f'Event #{event_id}: rollup missing'))
+                    to_create.append(EventStats(event_id=event_id, **values))
+                    continue
+                diff = {field: (getattr(stats, field), value) for field, value in values.items()
+                        if getattr(stats, field) != value}
+                if diff:
+                    drift += 1
+                    if verbose:
+                        self.stdout.write(self.style.WARNING(f'Event #{event_id}: {self._format(diff)}'))
+                    for field, value in values.items():
+                        setattr(stats, field, value)
+                    to_update.append(stats)
+
+            expected_global = compute_global_stats()
+            global_stats = GlobalStats.objects.filter(pk=GLOBAL_STATS_ID).first()
+            if global_stats is None:
+                drift += 1
+                self.stdout.write(self.style.WARNING('Global rollup missing'))
+            else:
+                diff = {field: (getattr(global_stats, field), value) for field, value in expected_global.items()
+                        if getattr(global_stats, field) != value}
+                if diff:
+                    drift += 1
+                    self.stdout.write(self.style.WARNING(f'Global: {self._format(diff)}'))
+
+            if not check_only:
+                EventStats.objects.bulk_create(to_create, batch_size=1000)
+                EventStats.objects.bulk_update(to_update, EVENT_STATS_FIELDS, batch_size=1000)
+                GlobalStats.objects.update_or_create(pk=GLOBAL_STATS_ID, defaults=expected_global)
+
+        if to_create or to_update:
+            self.stdout.write(
+                f'Event rollups: {len(to_create)} missing, {len(to_update)} drifted (use -v 2 for details)'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS(f'Rollups are consistent ({len(expected)} events)'))
+        elif check_only:
+            raise CommandError(f'Found drift in {drift} rollup(s)')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {drift} drifted rollup(s)'))
+
+    @staticmethod
+    def _format(diff):
+        return ', '.join(f'{field} {old} -> {new}' for field, (old, new) in diff.items())
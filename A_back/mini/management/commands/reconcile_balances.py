@@ -0,0 +1,95 @@
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from mini.ledger import reconcile_range
+from mini.models import StudentProfile
+
+
+def _reconcile_in_worker(after, upto, fix):
+    # Дочерний процесс открывает собственное соединение с БД
+    try:
+        return reconcile_range(after, upto, fix)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes StudentProfile.points from the PointTransaction ledger in user_id chunks, '
+        'reports drifted accounts and optionally corrects them. Progress is checkpointed to '
+        'a state file so an interrupted run can be resumed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Set drifted balances to the ledger sum')
+        parser.add_argument('--chunk-size', type=int, default=5_000, help='Profiles per chunk')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Check chunks in a pool of N processes (0 - in this process)')
+        parser.add_argument('--state', help='Progress file; an existing one is resumed from')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved progress in --state')
+
+    def handle(self, *args, **options):
+        state_path = Path(options['state']) if options['state'] else None
+        progress = {'after': 0, 'checked': 0, 'drifted': 0, 'fixed': 0}
+        if state_path is not None and state_path.exists() and not options['restart']:
+            progress.update(json.loads(state_path.read_text()))
+            self.stdout.write(f"Resuming after user #{progress['after']} ({progress['checked']} checked)")
+
+        for upto, (checked, drifts) in self.run_chunks(progress['after'], options):
+            for user_id, points, expected, fixed in drifts:
+                note = ' (fixed)' if fixed else ' (changed concurrently, skipped)' if options['fix'] else ''
+                self.stdout.write(self.style.WARNING(
+                    f'User #{user_id}: points {points}, ledger {expected} ({expected - points:+d}){note}'
+                ))
+            progress['after'] = upto
+            progress['checked'] += checked
+            progress['drifted'] += len(drifts)
+            progress['fixed'] += sum(1 for drift in drifts if drift[3])
+            if state_path is not None:
+                state_path.write_text(json.dumps(progress))
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"Checked up to user #{upto}: {progress['checked']} profiles")
+
+        summary = f"{progress['checked']} profiles checked, {progress['drifted']} drifted, {progress['fixed']} fixed"
+        if progress['drifted'] > progress['fixed']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def chunk_bounds(self, after, chunk_size):
+        """Границы чанков (after, upto] по индексу user_id, без OFFSET по всей таблице"""
+        profiles = StudentProfile.objects.order_by('user_id').values_list('user_id', flat=True)
+        while True:
+            upto = profiles.filter(user_id__gt=after)[chunk_size - 1:chunk_size].first()
+            if upto is None:
+                upto = profiles.filter(user_id__gt=after).last()
+                if upto is None:
+                    return
+            yield after, upto
+            after = upto
+
+    def run_chunks(self, after, options):
+        """Результаты чанков строго по порядку, чтобы сохраненный прогресс не имел пропусков"""
+        bounds = self.chunk_bounds(after, options['chunk_size'])
+        if not options['workers']:
+            for chunk_after, upto in bounds:
+                yield upto, reconcile_range(chunk_after, upto, options['fix'])
+            return
+
+        # Дочерние процессы не должны наследовать открытые соединения
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            pending = deque()
+            for chunk_after, upto in bounds:
+                pending.append((upto, pool.submit(_reconcile_in_worker, chunk_after, upto, options['fix'])))
+                # В очереди не больше двух чанков на процесс - память ограничена
+                if len(pending) >= options['workers'] * 2:
+                    upto, future = pending.popleft()
+                    yield upto, future.result()
+            while pending:
+                upto, future = pending.popleft()
+                yield upto, future.result()
@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the SQLite primary database into the file configured as the "replica" alias '
+        '(DB_REPLICA_PATH) so the read/write router can be exercised locally'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep copying every N seconds (simulates replication lag)')
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'READ_REPLICA', {}).get('ALIAS', 'replica')
+        if alias not in settings.DATABASES:
+            raise CommandError(f'No "{alias}" database configured, set DB_REPLICA_PATH')
+        primary, replica = settings.DATABASES['default'], settings.DATABASES[alias]
+        if not all(db['ENGINE'].endswith('sqlite3') for db in (primary, replica)):
+            raise CommandError('Only SQLite databases can be copied, use streaming replication for PostgreSQL')
+
+        # Открытые соединения с репликой увидят новую копию после переподключения
+        connections[alias].close()
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                # Backup API дает согласованный снимок даже во время записи в основную БД
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f"Copied {primary['NAME']} -> {replica['NAME']} in {time.perf_counter() - started:.2f}s")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
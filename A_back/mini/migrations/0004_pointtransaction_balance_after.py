@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini', '0003_merchandise_merchorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointtransaction',
+            name='balance_after',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
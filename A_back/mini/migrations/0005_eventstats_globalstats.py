@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini', '0004_pointtransaction_balance_after'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='mini.event')),
+                ('participants_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('score_total', models.BigIntegerField(default=0)),
+                ('feedback_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GlobalStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_events', models.IntegerField(default=0)),
+                ('total_views', models.BigIntegerField(default=0)),
+                ('total_completions', models.BigIntegerField(default=0)),
+                ('quiz_attempts', models.BigIntegerField(default=0)),
+                ('successful_quiz_attempts', models.BigIntegerField(default=0)),
+                ('students_participated', models.IntegerField(default=0)),
+                ('total_users', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
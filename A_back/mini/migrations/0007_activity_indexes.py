@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini', '0006_tokenuser'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventparticipation',
+            index=models.Index(fields=['student', 'completed', '-id'], name='participation_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventparticipation',
+            index=models.Index(fields=['student', '-first_viewed', '-id'], name='participation_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['student', 'event'], name='feedback_student_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['student', '-created_at', '-id'], name='feedback_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointtransaction',
+            index=models.Index(fields=['student', '-timestamp', '-id'], name='transaction_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-18 19:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_completed_event(apps, schema_editor):
+    # Начисления за прохождение до этой миграции: completed_event получает
+    # только самое раннее на пару (студент, мероприятие), повторы остаются в
+    # истории как обычные операции - иначе ограничение ниже не создать
+    PointTransaction = apps.get_model('mini', 'PointTransaction')
+    awards = PointTransaction.objects.filter(
+        transaction_type='EARNED', event__isnull=False, description__startswith='Completed event: '
+    ).order_by('student_id', 'event_id', 'timestamp', 'id').values_list('id', 'student_id', 'event_id')
+    first, seen = [], set()
+    for transaction_id, student_id, event_id in awards.iterator(chunk_size=2000):
+        if (student_id, event_id) not in seen:
+            seen.add((student_id, event_id))
+            first.append(transaction_id)
+    for start in range(0, len(first), 500):
+        PointTransaction.objects.filter(id__in=first[start:start + 500]).update(completed_event=models.F('event'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini', '0007_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('response_body', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pointtransaction',
+            name='completed_event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mini.event'),
+        ),
+        migrations.RunPython(backfill_completed_event, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pointtransaction',
+            constraint=models.UniqueConstraint(fields=('student', 'completed_event'), name='one_award_per_completion'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='idempotencykey',
+            unique_together={('user', 'key')},
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:40
+
+from django.db import migrations
+
+
+def backfill_balance_after(apps, schema_editor):
+    # Операции до 0004 получают balance_after нарастающим итогом по истории
+    # студента (timestamp, id); записанный баланс операции - новая точка отсчета.
+    # После этого balance_at() не суммирует историю целиком
+    PointTransaction = apps.get_model('mini', 'PointTransaction')
+    students = (
+        PointTransaction.objects.filter(balance_after__isnull=True)
+        .values_list('student_id', flat=True).distinct().order_by()
+    )
+    for student_id in list(students):
+        history = (
+            PointTransaction.objects.filter(student_id=student_id)
+            .order_by('timestamp', 'id').only('id', 'points', 'balance_after')
+        )
+        balance, missing = 0, []
+        for row in history.iterator(chunk_size=2000):
+            if row.balance_after is None:
+                balance += row.points
+                row.balance_after = balance
+                missing.append(row)
+            else:
+                balance = row.balance_after
+        PointTransaction.objects.bulk_update(missing, ['balance_after'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini', '0008_idempotency_and_single_award'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_balance_after, migrations.RunPython.noop),
+    ]
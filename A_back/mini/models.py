@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router
 from django.contrib.auth.models import AbstractUser
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -21,6 +21,28 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
 
+# Пользователь, собранный из claims JWT-токена (см. authentication.ClaimsJWTAuthentication):
+# поля, которых нет в токене, загружаются все сразу из кеша пользователей процесса
+class TokenUser(CustomUser):
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, claims):
+        field_names = [field.attname for field in cls._meta.concrete_fields if field.attname in claims]
+        return cls.from_db(router.db_for_write(cls), field_names, [claims[name] for name in field_names])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is None or from_queryset is not None or not deferred.issuperset(fields):
+            return super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        from .authentication import user_cache
+        row = user_cache.get(self.pk)
+        if row is None:
+            raise CustomUser.DoesNotExist(f"User {self.pk} does not exist")
+        for name in deferred:
+            setattr(self, name, row[name])
+
 # Профиль студента
 class StudentProfile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='student_profile')
@@ -40,13 +62,15 @@ class ManagerProfile(models.Model):
         return f"Manager: {self.user.username}"
 
 # Сигналы для автоматического создания профилей
+# (пользователь только что создан, поэтому профиля у него еще нет: хватает
+# одного INSERT без SELECT и точки сохранения из get_or_create)
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         if instance.user_type == 'STUDENT':
-            StudentProfile.objects.get_or_create(user=instance)
+            StudentProfile.objects.create(user=instance)
         elif instance.user_type == 'MANAGER':
-            ManagerProfile.objects.get_or_create(user=instance)
+            ManagerProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=CustomUser)
 def save_user_profile(sender, instance, created, **kwargs):
@@ -80,6 +104,13 @@ class Event(models.Model):
     views_count = models.IntegerField(default=0)
     completion_count = models.IntegerField(default=0)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Загруженный тип: сводная аналитика учитывает смену типа (попытки квизов)
+        instance._loaded_event_type = instance.__dict__.get('event_type')
+        return instance
+    
     def __str__(self):
         return f"{self.title} ({self.get_event_type_display()})"
 
@@ -130,6 +161,19 @@ class EventParticipation(models.Model):
     
     class Meta:
         unique_together = ('event', 'student')
+        indexes = [
+            # Завершенные мероприятия и лента активности студента (keyset-пагинация)
+            models.Index(fields=['student', 'completed', '-id'], name='participation_done_idx'),
+            models.Index(fields=['student', '-first_viewed', '-id'], name='participation_activity_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное состояние, чтобы сводная аналитика
+        # могла учесть переход completed/score без дополнительного запроса
+        instance._loaded_result = (instance.__dict__.get('completed'), instance.__dict__.get('score'))
+        return instance
     
     def __str__(self):
         return f"{self.student.username} - {self.event.title}"
@@ -142,6 +186,13 @@ class Feedback(models.Model):
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Анти-join "завершено, но без отзыва" и лента активности
+            models.Index(fields=['student', 'event'], name='feedback_student_event_idx'),
+            models.Index(fields=['student', '-created_at', '-id'], name='feedback_activity_idx'),
+        ]
+    
     def __str__(self):
         return f"Feedback for {self.event.title} by {self.student.username}"
 
@@ -157,6 +208,18 @@ class PointTransaction(models.Model):
     ))
     description = models.CharField(max_length=255)
     timestamp = models.DateTimeField(auto_now_add=True)
+    balance_after = models.IntegerField(null=True, blank=True)  # баланс после применения транзакции
+    # Заполняется только у начисления за прохождение мероприятия: уникальность
+    # (student, completed_event) не дает начислить за одно прохождение дважды
+    completed_event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['student', '-timestamp', '-id'], name='transaction_activity_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'completed_event'], name='one_award_per_completion'),
+        ]
     
     def __str__(self):
         return f"{self.student.username}: {self.points} points"
@@ -217,4 +280,43 @@ class MerchOrder(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"Заказ #{self.id} - {self.student.username} - {self.merchandise.name}"
\ No newline at end of file
+        return f"Заказ #{self.id} - {self.student.username} - {self.merchandise.name}"
+
+# Сводная аналитика по мероприятию (поддерживается инкрементально, см. mini/rollups.py)
+class EventStats(models.Model):
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    participants_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    score_total = models.BigIntegerField(default=0)  # сумма баллов завершивших
+    feedback_count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Stats for event #{self.event_id}"
+
+# Глобальная сводная аналитика (единственная строка с pk=1)
+class GlobalStats(models.Model):
+    total_events = models.IntegerField(default=0)
+    total_views = models.BigIntegerField(default=0)
+    total_completions = models.BigIntegerField(default=0)
+    quiz_attempts = models.BigIntegerField(default=0)
+    successful_quiz_attempts = models.BigIntegerField(default=0)
+    students_participated = models.IntegerField(default=0)
+    total_users = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return "Global stats"
+
+# Ключи идемпотентности: сохраненный ответ на запрос с заголовком Idempotency-Key
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64)  # SHA-256 ключа клиента
+    request_hash = models.CharField(max_length=64)  # SHA-256 метода, пути и тела
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None - запрос еще выполняется
+    response_body = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('user', 'key')
+    
+    def __str__(self):
+        return f"Idempotency key {self.key[:8]} of user #{self.user_id}"
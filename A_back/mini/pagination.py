@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class EventCursorPagination(CursorPagination):
+    """Keyset-пагинация мероприятий по (created_at, id), новые сначала"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class HistoryCursorPagination(CursorPagination):
+    """Keyset-пагинация истории студента по id, новые сначала"""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class PointsHistoryPagination(CursorPagination):
+    """Keyset-пагинация операций с баллами по (timestamp, id), новые сначала"""
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,249 @@
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog_cache import catalog_cache
+from .models import CustomUser, Event, EventParticipation, Feedback, EventStats, GlobalStats
+
+GLOBAL_STATS_ID = 1
+
+EVENT_STATS_FIELDS = ('participants_count', 'completed_count', 'score_total', 'feedback_count')
+
+
+def _increments(deltas):
+    return {field: F(field) + delta for field, delta in deltas.items() if delta}
+
+
+def bump_event(event_id, **deltas):
+    # Если строки еще нет, она будет посчитана целиком при первом чтении
+    increments = _increments(deltas)
+    if increments:
+        EventStats.objects.filter(event_id=event_id).update(**increments)
+
+
+def bump_global(**deltas):
+    increments = _increments(deltas)
+    if increments:
+        GlobalStats.objects.filter(pk=GLOBAL_STATS_ID).update(**increments)
+
+
+# Полный пересчет из исходных таблиц
+
+def compute_event_stats(event_ids=None):
+    """Возвращает {event_id: {поле: значение}} по данным участий и отзывов"""
+    events = Event.objects.all()
+    participations = EventParticipation.objects.all()
+    feedbacks = Feedback.objects.all()
+    if event_ids is not None:
+        events = events.filter(id__in=event_ids)
+        participations = participations.filter(event_id__in=event_ids)
+        feedbacks = feedbacks.filter(event_id__in=event_ids)
+
+    stats = {event_id: dict.fromkeys(EVENT_STATS_FIELDS, 0) for event_id in events.values_list('id', flat=True)}
+    rows = participations.values('event_id').annotate(
+        participants_total=Count('id'),
+        completed_total=Count('id', filter=Q(completed=True)),
+        score_sum=Sum('score', filter=Q(completed=True)),
+    )
+    for row in rows:
+        if row['event_id'] in stats:
+            stats[row['event_id']].update(
+                participants_count=row['participants_total'],
+                completed_count=row['completed_total'],
+                score_total=row['score_sum'] or 0,
+            )
+    for row in feedbacks.values('event_id').annotate(count=Count('id')):
+        if row['event_id'] in stats:
+            stats[row['event_id']]['feedback_count'] = row['count']
+    return stats
+
+
+def compute_global_stats():
+    events = Event.objects.aggregate(
+        total_events=Count('id'),
+        total_views=Sum('views_count'),
+        total_completions=Sum('completion_count'),
+    )
+    quiz = EventParticipation.objects.filter(event__event_type='QUIZ').aggregate(
+        quiz_attempts=Count('id'),
+        successful_quiz_attempts=Count('id', filter=Q(completed=True)),
+    )
+    return {
+        'total_events': events['total_events'],
+        'total_views': events['total_views'] or 0,
+        'total_completions': events['total_completions'] or 0,
+        'quiz_attempts': quiz['quiz_attempts'],
+        'successful_quiz_attempts': quiz['successful_quiz_attempts'],
+        'students_participated': EventParticipation.objects.values('student_id').distinct().count(),
+        'total_users': CustomUser.objects.count(),
+    }
+
+
+# Чтение (с ленивым созданием недостающих строк)
+
+def get_event_stats(event_id):
+    try:
+        return EventStats.objects.get(event_id=event_id)
+    except EventStats.DoesNotExist:
+        values = compute_event_stats([event_id]).get(event_id, dict.fromkeys(EVENT_STATS_FIELDS, 0))
+        stats, _ = EventStats.objects.get_or_create(event_id=event_id, defaults=values)
+        return stats
+
+
+def get_global_stats():
+    try:
+        return GlobalStats.objects.get(pk=GLOBAL_STATS_ID)
+    except GlobalStats.DoesNotExist:
+        stats, _ = GlobalStats.objects.get_or_create(pk=GLOBAL_STATS_ID, defaults=compute_global_stats())
+        return stats
+
+
+# Инкрементальные обновления для путей записи без сигналов
+
+def record_views(count):
+    bump_global(total_views=count)
+
+
+def record_completion(event_id, count=1):
+    Event.objects.filter(id=event_id).update(completion_count=F('completion_count') + count)
+    catalog_cache.bump(Event)
+    bump_global(total_completions=count)
+
+
+def record_results(changes):
+    """
+    Учитывает результаты участий, записанные через bulk_create/bulk_update.
+
+    changes - (event_id, is_quiz, было завершено, прежний балл, завершено, балл);
+    для новых участий прежние значения - (False, 0).
+    """
+    per_event = {}
+    successful_quiz_attempts = 0
+    for event_id, is_quiz, was_completed, old_score, completed, score in changes:
+        completed_delta = int(bool(completed)) - int(bool(was_completed))
+        score_delta = (score if completed else 0) - (old_score if was_completed else 0)
+        totals = per_event.setdefault(event_id, [0, 0])
+        totals[0] += completed_delta
+        totals[1] += score_delta
+        if is_quiz:
+            successful_quiz_attempts += completed_delta
+    for event_id, (completed_delta, score_delta) in per_event.items():
+        bump_event(event_id, completed_count=completed_delta, score_total=score_delta)
+    bump_global(successful_quiz_attempts=successful_quiz_attempts)
+
+
+def record_new_participations(pairs, event_types, returning_students):
+    """
+    Учитывает просмотры-участия, вставленные через bulk_create.
+
+    pairs - новые пары (event_id, student_id), event_types - {event_id: event_type},
+    returning_students - студенты, у которых уже были участия до вставки.
+    """
+    per_event = {}
+    quiz_attempts = 0
+    new_students = set()
+    for event_id, student_id in pairs:
+        per_event[event_id] = per_event.get(event_id, 0) + 1
+        if event_types.get(event_id) == 'QUIZ':
+            quiz_attempts += 1
+        if student_id not in returning_students:
+            new_students.add(student_id)
+    for event_id, count in per_event.items():
+        bump_event(event_id, participants_count=count)
+    bump_global(quiz_attempts=quiz_attempts, students_participated=len(new_students))
+
+
+# Сигналы
+
+def _event_type(participation):
+    event = participation._state.fields_cache.get('event')
+    if event is not None:
+        return event.event_type
+    return Event.objects.filter(id=participation.event_id).values_list('event_type', flat=True).first()
+
+
+def _apply_participation(participation, sign):
+    completed = sign if participation.completed else 0
+    bump_event(
+        participation.event_id,
+        participants_count=sign,
+        completed_count=completed,
+        score_total=participation.score * completed,
+    )
+    is_quiz = _event_type(participation) == 'QUIZ'
+    first_or_last = not EventParticipation.objects.filter(
+        student_id=participation.student_id
+    ).exclude(pk=participation.pk).exists()
+    bump_global(
+        quiz_attempts=sign if is_quiz else 0,
+        successful_quiz_attempts=completed if is_quiz else 0,
+        students_participated=sign if first_or_last else 0,
+    )
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, created, **kwargs):
+    if created:
+        EventStats.objects.get_or_create(event=instance)
+        bump_global(total_events=1)
+    else:
+        # Попытки квиза - участия мероприятия типа QUIZ: при смене типа они
+        # переходят в счетчики или выходят из них. QuerySet.update(event_type=...)
+        # сигналов не вызывает - после него нужен rebuild_rollups
+        loaded = getattr(instance, '_loaded_event_type', None)
+        if loaded is not None and (loaded == 'QUIZ') != (instance.event_type == 'QUIZ'):
+            sign = 1 if instance.event_type == 'QUIZ' else -1
+            counts = EventParticipation.objects.filter(event_id=instance.id).aggregate(
+                attempts=Count('id'),
+                successful=Count('id', filter=Q(completed=True)),
+            )
+            bump_global(quiz_attempts=sign * counts['attempts'], successful_quiz_attempts=sign * counts['successful'])
+    instance._loaded_event_type = instance.event_type
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    bump_global(
+        total_events=-1,
+        total_views=-instance.views_count,
+        total_completions=-instance.completion_count,
+    )
+
+@receiver(post_save, sender=EventParticipation)
+def participation_saved(sender, instance, created, **kwargs):
+    if created:
+        _apply_participation(instance, 1)
+    elif hasattr(instance, '_loaded_result'):
+        was_completed, old_score = instance._loaded_result
+        old_total = old_score if was_completed else 0
+        new_total = instance.score if instance.completed else 0
+        completed_delta = int(bool(instance.completed)) - int(bool(was_completed))
+        bump_event(
+            instance.event_id,
+            completed_count=completed_delta,
+            score_total=new_total - old_total,
+        )
+        if completed_delta and _event_type(instance) == 'QUIZ':
+            bump_global(successful_quiz_attempts=completed_delta)
+    instance._loaded_result = (instance.completed, instance.score)
+
+@receiver(post_delete, sender=EventParticipation)
+def participation_deleted(sender, instance, **kwargs):
+    _apply_participation(instance, -1)
+
+@receiver(post_save, sender=Feedback)
+def feedback_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_event(instance.event_id, feedback_count=1)
+
+@receiver(post_delete, sender=Feedback)
+def feedback_deleted(sender, instance, **kwargs):
+    bump_event(instance.event_id, feedback_count=-1)
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_global(total_users=1)
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    bump_global(total_users=-1)
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from .instrumentation import TimedSerializerMixin
 from .models import CustomUser, StudentProfile, ManagerProfile, Event, Quiz, QuizQuestion, QuizAnswer
 from .models import Minigame, EventParticipation, Feedback, PointTransaction, Merchandise, MerchOrder
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'password', 'user_type', 'phone', 'university', 'telegram_id', 'interests']
@@ -34,45 +35,45 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
         return user
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+class StudentProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = StudentProfile
         fields = ['id', 'user', 'points', 'last_activity']
 
-class ManagerProfileSerializer(serializers.ModelSerializer):
+class ManagerProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = ManagerProfile
         fields = ['id', 'user', 'company', 'department']
 
-class QuizAnswerSerializer(serializers.ModelSerializer):
+class QuizAnswerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = QuizAnswer
         fields = ['id', 'answer_text', 'is_correct']
 
-class QuizQuestionSerializer(serializers.ModelSerializer):
+class QuizQuestionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     answers = QuizAnswerSerializer(many=True, read_only=True)
     
     class Meta:
         model = QuizQuestion
         fields = ['id', 'question_text', 'order', 'answers']
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     questions = QuizQuestionSerializer(many=True, read_only=True)
     
     class Meta:
         model = Quiz
         fields = ['id', 'time_limit', 'passing_score', 'questions']
 
-class MinigameSerializer(serializers.ModelSerializer):
+class MinigameSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Minigame
         fields = ['id', 'game_type', 'instructions']
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     quiz = QuizSerializer(read_only=True)
     minigame = MinigameSerializer(read_only=True)
     
@@ -80,35 +81,51 @@ class EventSerializer(serializers.ModelSerializer):
         model = Event
         fields = ['id', 'title', 'description', 'event_type', 'points', 'is_active', 'qr_code', 
                  'views_count', 'completion_count', 'created_at', 'updated_at', 'quiz', 'minigame']
+    
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """Подгружает вложенные квиз/мини-игру одним набором запросов"""
+        return queryset.select_related(f'{prefix}quiz', f'{prefix}minigame').prefetch_related(
+            f'{prefix}quiz__questions__answers'
+        )
+
+class EventListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Краткое представление мероприятия для списков, без тела квиза"""
+    
+    class Meta:
+        model = Event
+        fields = ['id', 'title', 'description', 'event_type', 'points', 'is_active', 'qr_code', 
+                 'views_count', 'completion_count', 'created_at', 'updated_at']
+        read_only_fields = fields
 
-class EventParticipationSerializer(serializers.ModelSerializer):
+class EventParticipationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     event = EventSerializer(read_only=True)
     
     class Meta:
         model = EventParticipation
         fields = ['id', 'event', 'completed', 'score', 'completed_at', 'first_viewed']
 
-class FeedbackSerializer(serializers.ModelSerializer):
+class FeedbackSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     event = EventSerializer(read_only=True)
     
     class Meta:
         model = Feedback
         fields = ['id', 'event', 'rating', 'comment', 'created_at']
 
-class PointTransactionSerializer(serializers.ModelSerializer):
-    event = EventSerializer(read_only=True)
+class PointTransactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    event = EventListSerializer(read_only=True)
     
     class Meta:
         model = PointTransaction
-        fields = ['id', 'points', 'transaction_type', 'description', 'timestamp', 'event']
+        fields = ['id', 'points', 'transaction_type', 'description', 'timestamp', 'balance_after', 'event']
 
-class MerchandiseSerializer(serializers.ModelSerializer):
+class MerchandiseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Merchandise
         fields = ['id', 'name', 'description', 'merch_type', 'points_cost', 'image_url', 
                  'is_available', 'stock_quantity', 'created_at', 'updated_at']
 
-class MerchOrderSerializer(serializers.ModelSerializer):
+class MerchOrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     merchandise = MerchandiseSerializer(read_only=True)
     student = UserSerializer(read_only=True)
     
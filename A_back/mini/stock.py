@@ -0,0 +1,164 @@
+import queue
+import threading
+from concurrent import futures
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from .catalog_cache import catalog_cache
+from .models import Merchandise, MerchOrder
+from . import ledger
+
+
+class OutOfStock(Exception):
+    """Недостаточно товара на складе"""
+
+    def __init__(self, available):
+        super().__init__(f"Недостаточно товара на складе. Доступно: {available}")
+        self.available = available
+
+
+class AllocationTimeout(Exception):
+    """
+    Заказ не был обработан очередью за отведенное время. future - заказ,
+    который очередь уже начала выполнять (он еще может быть оформлен), или
+    None, если он снят с очереди.
+    """
+
+    def __init__(self, future=None):
+        super().__init__('Заказ не обработан за отведенное время')
+        self.future = future
+
+    @property
+    def started(self):
+        return self.future is not None
+
+
+def reserve(merchandise_id, quantity):
+    """
+    Условное атомарное списание остатка: UPDATE ... WHERE stock_quantity >= quantity.
+    Возвращает оставшееся количество. Должно вызываться внутри транзакции.
+    """
+    reserved = Merchandise.objects.filter(
+        id=merchandise_id,
+        stock_quantity__gte=quantity
+    ).update(stock_quantity=F('stock_quantity') - quantity)
+    remaining = Merchandise.objects.filter(id=merchandise_id).values_list('stock_quantity', flat=True).first()
+    if not reserved:
+        raise OutOfStock(remaining or 0)
+    catalog_cache.bump(Merchandise)
+    return remaining
+
+
+def place_order(user, merchandise, quantity, **order_fields):
+    """
+    Оформляет заказ: списание баллов, создание MerchOrder и резерв остатка
+    в одной транзакции. Возвращает (order, point_transaction).
+    """
+    # Проверка по уже загруженной строке до списания баллов: при нехватке
+    # товара ответ - "нет на складе", даже если не хватает и баллов.
+    # Окончательно остаток проверяет reserve()
+    if merchandise.stock_quantity < quantity:
+        raise OutOfStock(merchandise.stock_quantity)
+    total_cost = merchandise.points_cost * quantity
+    with transaction.atomic():
+        point_transaction = ledger.debit(
+            user,
+            total_cost,
+            description=f"Покупка мерча: {merchandise.name} x{quantity}"
+        )
+        order = MerchOrder.objects.create(
+            student=user,
+            merchandise=merchandise,
+            quantity=quantity,
+            points_spent=total_cost,
+            **order_fields
+        )
+        # Строка товара - самая "горячая", поэтому блокируем ее последней,
+        # чтобы держать блокировку как можно меньше
+        merchandise.stock_quantity = reserve(merchandise.id, quantity)
+    return order, point_transaction
+
+
+class StockAllocator:
+    """
+    Оформление заказов с переключением в очередь при высокой конкуренции.
+
+    В режиме direct каждый запрос сам выполняет place_order. В режиме queued
+    заказы выполняются одним фоновым потоком строго в порядке поступления
+    (first-come-first-served), что снимает борьбу за блокировку строки товара
+    внутри процесса. В режиме auto очередь включается, когда на один товар
+    одновременно приходится не меньше CONTENTION_THRESHOLD заказов.
+    """
+
+    def __init__(self, mode='auto', contention_threshold=8, timeout=10.0):
+        self.mode = mode
+        self.contention_threshold = contention_threshold
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._queue = queue.Queue()
+        self._worker = None
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'MERCH_ALLOCATION', {})
+        return cls(
+            mode=options.get('MODE', 'auto'),
+            contention_threshold=options.get('CONTENTION_THRESHOLD', 8),
+            timeout=options.get('TIMEOUT', 10.0)
+        )
+
+    def purchase(self, user, merchandise, quantity, **order_fields):
+        with self._lock:
+            in_flight = self._in_flight.get(merchandise.id, 0) + 1
+            self._in_flight[merchandise.id] = in_flight
+        try:
+            queued = self.mode == 'queued' or (
+                self.mode == 'auto' and in_flight >= self.contention_threshold
+            )
+            if queued:
+                return self._submit(user, merchandise, quantity, order_fields)
+            return place_order(user, merchandise, quantity, **order_fields)
+        finally:
+            with self._lock:
+                self._in_flight[merchandise.id] -= 1
+                if not self._in_flight[merchandise.id]:
+                    del self._in_flight[merchandise.id]
+
+    def _submit(self, user, merchandise, quantity, order_fields):
+        future = futures.Future()
+        self._ensure_worker()
+        self._queue.put((future, user, merchandise, quantity, order_fields))
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            # Заказ еще может быть выполнен; отменяем, только если он не начат
+            if future.cancel():
+                raise AllocationTimeout()
+        # Уже выполняется - ждем еще не больше timeout, поток запроса не виснет
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            raise AllocationTimeout(future)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='stock-allocator', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            future, user, merchandise, quantity, order_fields = self._queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(place_order(user, merchandise, quantity, **order_fields))
+                except Exception as e:
+                    future.set_exception(e)
+            if self._queue.empty():
+                close_old_connections()
+
+
+allocator = StockAllocator.from_settings()
@@ -0,0 +1,230 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .accounts import normalize_phone
+from .grading import get_answer_key
+from .models import CustomUser, EventParticipation, PointTransaction, Quiz, StudentProfile
+from . import ledger
+from . import rollups
+
+MAX_BATCH_SIZE = 500
+
+
+class BatchError(ValueError):
+    """Пакет целиком не может быть принят"""
+
+
+def grade_and_record(user, event, answers):
+    """
+    Проверка одного квиза и запись результата: участие, начисление за
+    прохождение (один раз на мероприятие) и счетчик завершений. event - с
+    загруженным quiz. Возвращает тело ответа SubmitQuizView.
+    """
+    quiz = event.quiz
+    answer_key = get_answer_key(quiz.id)
+    total_questions = answer_key.total_questions
+    correct_count = answer_key.grade(answers if isinstance(answers, list) else [])
+    score_percent = (correct_count / total_questions) * 100 if total_questions > 0 else 0
+    passed = score_percent >= quiz.passing_score
+
+    participation, _ = EventParticipation.objects.update_or_create(
+        event=event,
+        student=user,
+        defaults={
+            'completed': passed,
+            'score': int(score_percent),
+            'completed_at': timezone.now() if passed else None
+        }
+    )
+
+    current_points = None
+    if participation.completed:
+        with transaction.atomic():
+            point_transaction = ledger.award_completion(user, event, description=f"Completed event: {event.title}")
+            if point_transaction is not None:
+                rollups.record_completion(event.id)
+                current_points = point_transaction.balance_after
+    awarded = current_points is not None
+    if not awarded:
+        current_points = ledger.get_balance(user)
+
+    return {
+        'score': int(score_percent),
+        'total_questions': total_questions,
+        'correct_count': correct_count,
+        'passed': participation.completed,
+        'points_earned': event.points if awarded else 0,
+        'current_points': current_points
+    }
+
+
+def _parse_item(item, submitter):
+    """(student_id или None, телефон или None, event_id, answers) либо текст ошибки"""
+    if not isinstance(item, dict):
+        return 'Элемент пакета должен быть объектом'
+    try:
+        event_id = int(item.get('event_id'))
+    except (TypeError, ValueError):
+        return 'Не указан event_id'
+    answers = item.get('answers', [])
+    if not isinstance(answers, list):
+        answers = []
+
+    if submitter.user_type != 'MANAGER':
+        # Студент отправляет накопленные результаты только за себя
+        if item.get('student_id') not in (None, submitter.id) or item.get('phone'):
+            return 'Студент может отправлять только свои результаты'
+        return submitter.id, None, event_id, answers
+    if item.get('student_id') is not None:
+        try:
+            return int(item['student_id']), None, event_id, answers
+        except (TypeError, ValueError):
+            return 'Некорректный student_id'
+    phone = normalize_phone(item.get('phone') or '')
+    if phone is None:
+        return 'Укажите student_id или phone студента'
+    return None, phone, event_id, answers
+
+
+def submit_quiz_batch(items, submitter):
+    """
+    Пакетная отправка результатов квизов (киоски и планшеты без связи).
+
+    Элементы проверяются так же, как в SubmitQuizView, и по порядку: если
+    одна пара (студент, мероприятие) встречается несколько раз, итоговым
+    будет последний результат. Ключи ответов загружаются один раз на квиз,
+    а участия, начисления и сводная аналитика пишутся bulk-операциями в
+    одной транзакции, поэтому число запросов не зависит от размера пакета.
+    Ошибки отдельных элементов не мешают остальным.
+    Возвращает список результатов в порядке элементов.
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchError('Ожидается непустой список submissions')
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchError(f'Не больше {MAX_BATCH_SIZE} элементов в пакете')
+
+    results, parsed = [], []
+    for index, item in enumerate(items):
+        result = {'index': index}
+        if isinstance(item, dict) and 'client_id' in item:
+            result['client_id'] = item['client_id']
+        results.append(result)
+        fields = _parse_item(item, submitter)
+        if isinstance(fields, str):
+            result.update(status='error', error=fields)
+        else:
+            parsed.append((index, *fields))
+
+    # Студенты (по id или телефону) и квизы - по одному запросу на весь пакет
+    ids = {student_id for _, student_id, _, _, _ in parsed if student_id is not None}
+    phones = {phone for _, _, phone, _, _ in parsed if phone is not None}
+    students = CustomUser.objects.filter(
+        Q(id__in=ids) | Q(phone__in=phones), user_type='STUDENT', student_profile__isnull=False
+    ).values_list('id', 'phone')
+    known_ids, by_phone = set(), {}
+    for student_id, phone in students:
+        known_ids.add(student_id)
+        by_phone[phone] = student_id
+    quizzes = {
+        quiz.event_id: quiz
+        for quiz in Quiz.objects.select_related('event').filter(
+            event_id__in={event_id for _, _, _, event_id, _ in parsed}, event__event_type='QUIZ'
+        )
+    }
+
+    graded = []
+    for index, student_id, phone, event_id, answers in parsed:
+        student_id = by_phone.get(phone) if phone is not None else student_id
+        if student_id not in known_ids:
+            results[index].update(status='error', error='Студент не найден')
+            continue
+        quiz = quizzes.get(event_id)
+        if quiz is None:
+            results[index].update(status='error', error='Quiz not found')
+            continue
+        answer_key = get_answer_key(quiz.id)
+        correct_count = answer_key.grade(answers)
+        total_questions = answer_key.total_questions
+        score_percent = (correct_count / total_questions) * 100 if total_questions > 0 else 0
+        graded.append((index, student_id, quiz, correct_count, total_questions, score_percent))
+
+    if graded:
+        _write(graded, results)
+    return results
+
+
+def _write(graded, results):
+    student_ids = {student_id for _, student_id, _, _, _, _ in graded}
+    event_ids = {quiz.event_id for _, _, quiz, _, _, _ in graded}
+    now = timezone.now()
+
+    with transaction.atomic():
+        balances = dict(
+            StudentProfile.objects.select_for_update().filter(user_id__in=student_ids).values_list('user_id', 'points')
+        )
+        existing = {
+            (participation.event_id, participation.student_id): participation
+            for participation in EventParticipation.objects.filter(
+                event_id__in=event_ids, student_id__in=student_ids
+            ).only('id', 'event_id', 'student_id', 'completed', 'score', 'completed_at')
+        }
+        loaded = {pair: (participation.completed, participation.score) for pair, participation in existing.items()}
+        # Баллы за прохождение начисляются один раз на (мероприятие, студент)
+        awarded = set(
+            PointTransaction.objects.filter(student_id__in=student_ids, completed_event_id__in=event_ids)
+            .values_list('completed_event_id', 'student_id')
+        )
+        created, updated = {}, {}
+        awards = []
+
+        for index, student_id, quiz, correct_count, total_questions, score_percent in graded:
+            event = quiz.event
+            pair = (event.id, student_id)
+            passed = score_percent >= quiz.passing_score
+            if pair in existing:
+                participation = updated[pair] = existing[pair]
+            elif pair in created:
+                participation = created[pair]
+            else:
+                participation = created[pair] = EventParticipation(event_id=event.id, student_id=student_id)
+            participation.completed = passed
+            participation.score = int(score_percent)
+            participation.completed_at = now if passed else None
+            earned = passed and pair not in awarded
+            if earned:
+                awarded.add(pair)
+                awards.append((student_id, event.points, f"Completed event: {event.title}", event))
+                balances[student_id] += event.points
+            results[index].update(
+                status='ok',
+                score=int(score_percent),
+                total_questions=total_questions,
+                correct_count=correct_count,
+                passed=passed,
+                points_earned=event.points if earned else 0,
+                current_points=balances[student_id]
+            )
+
+        returning = set(
+            EventParticipation.objects.filter(student_id__in={student_id for _, student_id in created})
+            .values_list('student_id', flat=True).distinct()
+        ) if created else set()
+        EventParticipation.objects.bulk_create(created.values(), batch_size=500)
+        EventParticipation.objects.bulk_update(
+            updated.values(), ['completed', 'score', 'completed_at'], batch_size=500
+        )
+
+        # Сигналы при bulk-операциях не срабатывают, сводки обновляются явно
+        event_types = {quiz.event_id: quiz.event.event_type for _, _, quiz, _, _, _ in graded}
+        rollups.record_new_participations(created.keys(), event_types, returning)
+        rollups.record_results([
+            (pair[0], True, *loaded.get(pair, (False, 0)), participation.completed, participation.score)
+            for pair, participation in [*created.items(), *updated.items()]
+        ])
+        if awards:
+            ledger.credit_many(awards, completion=True)
+            for event_id, count in Counter(event.id for _, _, _, event in awards).items():
+                rollups.record_completion(event_id, count)
@@ -1,3 +1,1489 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent import futures
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (
+    CustomUser, StudentProfile, Event, EventParticipation, Feedback, Quiz, QuizQuestion, QuizAnswer, Minigame,
+    PointTransaction, Merchandise, MerchOrder, IdempotencyKey,
+)
+from . import ledger
+from .counters import ViewCounterBuffer, view_counter
+from .grading import get_answer_key
+from .checkin import CheckinSigner, CheckinTokenError
+from .serializers import EventSerializer, FeedbackSerializer, MerchOrderSerializer
+from .idempotency import IdempotencyStore
+from .throttling import TokenBucketLimiter, parse_rate, rate_limiter
+from .pagination import EventCursorPagination
+from .stock import place_order
+from .fast_serializers import fast_events, fast_feedback, fast_merch_orders
+from . import rollups
+from .leaderboard import Leaderboard, RankIndex, leaderboard
+from .stock import AllocationTimeout, StockAllocator
+from .content_cache import start_payload_cache
+from .instrumentation import metrics
+from .authentication import CLAIM_FIELDS, ClaimsRefreshToken, ClaimsJWTAuthentication, claims_state, user_cache
+from .db_router import ReadReplicaRouter, ReplicaHealth, ReplicaReadMixin, replica_reads
+from .management.commands.bench_endpoints import Command as BenchEndpointsCommand
+
+
+def setUpModule():
+    # Тесты шлют много запросов с одного адреса; троттлинг проверяется в ThrottlingTests
+    rate_limiter.enabled = False
+    # Фоновый сброс писал бы в БД из другого потока, мимо транзакции теста
+    view_counter.background = False
+
+
+def tearDownModule():
+    rate_limiter.enabled = True
+    view_counter.background = True
+
+
+def make_user(phone, user_type='STUDENT'):
+    return CustomUser.objects.create_user(
+        username=f"user_{phone}",
+        phone=phone,
+        user_type=user_type
+    )
+
+
+def make_quiz_event(manager, questions=3, points=10, passing_score=70):
+    event = Event.objects.create(
+        title='Quiz', description='Quiz', event_type='QUIZ', manager=manager, points=points
+    )
+    quiz = Quiz.objects.create(event=event, passing_score=passing_score)
+    for order in range(questions):
+        question = QuizQuestion.objects.create(quiz=quiz, question_text=f"Q{order}", order=order)
+        QuizAnswer.objects.create(question=question, answer_text='yes', is_correct=True)
+        QuizAnswer.objects.create(question=question, answer_text='no', is_correct=False)
+    return event, quiz
+
+
+def answers_for(quiz, correct=True):
+    return [
+        {'question_id': question.id, 'answer_id': question.answers.get(is_correct=correct).id}
+        for question in quiz.questions.all()
+    ]
+
+
+class SubmitQuizTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def submit(self, event, answers):
+        return self.client.post(f"/api/events/{event.id}/submit-quiz/", {'answers': answers}, format='json')
+
+    def test_grades_submission(self):
+        event, quiz = make_quiz_event(self.manager)
+        response = self.submit(event, answers_for(quiz))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['correct_count'], 3)
+        self.assertTrue(response.data['passed'])
+
+    def test_duplicate_answers_counted_once(self):
+        event, quiz = make_quiz_event(self.manager)
+        answers = answers_for(quiz)[:1] * 3
+        response = self.submit(event, answers)
+        self.assertEqual(response.data['correct_count'], 1)
+        self.assertFalse(response.data['passed'])
+
+    def test_query_count_does_not_depend_on_question_count(self):
+        small_event, small_quiz = make_quiz_event(self.manager, questions=2)
+        large_event, large_quiz = make_quiz_event(self.manager, questions=30)
+        small_answers = answers_for(small_quiz)
+        large_answers = answers_for(large_quiz)
+
+        with CaptureQueriesContext(connection) as small:
+            self.submit(small_event, small_answers)
+        with CaptureQueriesContext(connection) as large:
+            self.submit(large_event, large_answers)
+        self.assertEqual(len(small), len(large))
+
+    def test_answer_key_invalidated_on_change(self):
+        event, quiz = make_quiz_event(self.manager, questions=1)
+        answers = answers_for(quiz, correct=False)
+        self.assertEqual(self.submit(event, answers).data['correct_count'], 0)
+
+        answer = QuizAnswer.objects.get(id=answers[0]['answer_id'])
+        answer.is_correct = True
+        answer.save()
+        self.assertEqual(self.submit(event, answers).data['correct_count'], 1)
+
+
+def run_concurrently(worker, workers):
+    """Запускает worker(index) в нескольких потоках, у каждого свое соединение с БД"""
+    errors = []
+
+    def target(index):
+        try:
+            worker(index)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.student = make_user('9000000001')
+
+    def test_credit_and_debit_record_balance(self):
+        ledger.credit(self.student, 100, description='bonus', transaction_type='BONUS')
+        spent = ledger.debit(self.student, 30, description='purchase')
+        self.assertEqual(spent.points, -30)
+        self.assertEqual(spent.balance_after, 70)
+        self.assertEqual(ledger.get_balance(self.student), 70)
+
+    def test_debit_rejects_overdraft(self):
+        ledger.credit(self.student, 10, description='bonus')
+        with self.assertRaises(ledger.InsufficientPoints):
+            ledger.debit(self.student, 11, description='purchase')
+        self.assertEqual(ledger.get_balance(self.student), 10)
+        self.assertEqual(PointTransaction.objects.count(), 1)
+
+
+class LedgerConcurrencyTests(TransactionTestCase):
+    def test_no_lost_updates_under_contention(self):
+        student = make_user('9000000001')
+        workers, iterations = 8, 25
+
+        def worker(index):
+            for _ in range(iterations):
+                ledger.credit(student, 2, description='stress')
+                ledger.debit(student, 1, description='stress')
+
+        errors = run_concurrently(worker, workers)
+        self.assertEqual(errors, [])
+
+        expected = workers * iterations
+        self.assertEqual(StudentProfile.objects.get(user=student).points, expected)
+        # Баланс после каждой транзакции равен предыдущему балансу плюс ее сумма
+        balance = 0
+        rows = PointTransaction.objects.filter(student=student).order_by('id').values_list('points', 'balance_after')
+        for points, balance_after in rows:
+            balance += points
+            self.assertEqual(balance_after, balance)
+        self.assertEqual(balance, expected)
+
+
+class EventListTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_list_is_summary_with_flat_query_count(self):
+        make_quiz_event(self.manager)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/api/events/')
+        for _ in range(10):
+            make_quiz_event(self.manager)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/events/')
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.data['results']), 11)
+        self.assertNotIn('quiz', response.data['results'][0])
+
+    def test_cursor_pagination_walks_all_events(self):
+        for _ in range(5):
+            make_quiz_event(self.manager, questions=0)
+        seen = []
+        url = '/api/events/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(event['id'] for event in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Event.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 4)]
+        self.event, _ = make_quiz_event(self.manager, questions=1)
+        self.buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=1000, background=False)
+        patcher = mock.patch('mini.views.view_counter', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, student):
+        client = APIClient()
+        client.force_authenticate(student)
+        return client.get(f"/api/events/{self.event.id}/")
+
+    def test_views_are_buffered_and_flushed_in_batch(self):
+        for student in self.students:
+            self.view(student)
+        response = self.view(self.students[0])
+        self.assertEqual(response.data['views_count'], 4)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.views_count, 0)
+        self.assertFalse(EventParticipation.objects.exists())
+
+        self.buffer.flush()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.views_count, 4)
+        self.assertEqual(EventParticipation.objects.filter(event=self.event).count(), 3)
+
+    def test_threshold_triggers_flush(self):
+        self.buffer.flush_threshold = 2
+        self.view(self.students[0])
+        self.view(self.students[0])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.views_count, 2)
+        self.assertEqual(EventParticipation.objects.filter(event=self.event).count(), 1)
+
+
+    def test_background_flush_without_further_views(self):
+        buffer = ViewCounterBuffer(flush_interval=0.05, flush_threshold=1000)
+        flushed = threading.Event()
+        with mock.patch.object(buffer, '_write', side_effect=lambda views, participants: flushed.set()):
+            buffer.record(self.event.id, self.students[0].id)
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(buffer.pending_views(self.event.id), 0)
+
+
+    def test_failed_flush_keeps_checkins_toward_threshold(self):
+        self.buffer.flush_threshold = 3
+        with mock.patch.object(self.buffer, '_write', side_effect=OperationalError), \
+                self.assertLogs('mini.counters', 'ERROR'):
+            for student in self.students[:2]:
+                self.buffer.record_participant(self.event.id, student.id)
+            self.buffer.flush()
+        self.buffer.record_participant(self.event.id, self.students[2].id)
+        self.assertEqual(EventParticipation.objects.filter(event=self.event).count(), 3)
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 4)]
+        self.event, self.quiz = make_quiz_event(self.manager, questions=2)
+        self.buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=1000, background=False)
+        patcher = mock.patch('mini.views.view_counter', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def generate_activity(self):
+        for student in self.students:
+            self.client_for(student).get(f"/api/events/{self.event.id}/")
+        self.buffer.flush()
+        passing, failing = answers_for(self.quiz), answers_for(self.quiz, correct=False)
+        self.client_for(self.students[0]).post(
+            f"/api/events/{self.event.id}/submit-quiz/", {'answers': passing}, format='json'
+        )
+        self.client_for(self.students[1]).post(
+            f"/api/events/{self.event.id}/submit-quiz/", {'answers': failing}, format='json'
+        )
+        self.client_for(self.students[0]).post(
+            f"/api/events/{self.event.id}/feedback/", {'rating': 4}, format='json'
+        )
+
+    def test_flush_racing_a_direct_insert_counts_it_once(self):
+        rollups.get_global_stats()
+        for student in self.students:
+            self.buffer.record(self.event.id, student.id)
+        # Параллельный запрос создал участие после того, как сброс прочитал известные пары
+        EventParticipation.objects.create(event=self.event, student=self.students[0])
+        known_pairs = self.buffer._known_pairs
+        reads = [set()]
+        with mock.patch.object(self.buffer, '_known_pairs',
+                               side_effect=lambda *args: reads.pop() if reads else known_pairs(*args)):
+            self.buffer.flush()
+        self.assertEqual(EventParticipation.objects.filter(event=self.event).count(), 3)
+        response = self.client_for(self.manager).get(f"/api/analytics/{self.event.id}/")
+        self.assertEqual(response.data['total_participants'], 3)
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+    def test_rollups_match_full_recompute(self):
+        rollups.get_global_stats()
+        self.generate_activity()
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+        response = self.client_for(self.manager).get(f"/api/analytics/{self.event.id}/")
+        self.assertEqual(response.data['total_participants'], 3)
+        self.assertEqual(response.data['completed_count'], 1)
+        self.assertEqual(response.data['average_score'], 100)
+        self.assertEqual(response.data['feedback_count'], 1)
+
+        response = self.client_for(self.manager).get('/api/analytics/')
+        self.assertEqual(response.data['total_views'], 3)
+        self.assertEqual(response.data['total_quiz_attempts'], 3)
+        self.assertEqual(response.data['successful_quiz_attempts'], 1)
+        self.assertEqual(response.data['students_participated'], 3)
+        self.assertEqual(response.data['total_students'], 4)
+
+    def test_event_type_change_moves_quiz_attempts(self):
+        rollups.get_global_stats()
+        self.generate_activity()
+        event = Event.objects.get(id=self.event.id)
+        event.event_type = 'QUEST'
+        event.save()
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+        self.assertEqual(rollups.get_global_stats().quiz_attempts, 0)
+
+        event.event_type = 'QUIZ'
+        event.save()
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+        self.assertEqual(rollups.get_global_stats().successful_quiz_attempts, 1)
+
+    def test_rebuild_repairs_drift(self):
+        self.generate_activity()
+        rollups.get_global_stats()
+        rollups.bump_event(self.event.id, participants_count=10)
+        rollups.bump_global(total_views=5)
+        with self.assertRaises(Exception):
+            call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+    def test_global_analytics_query_count_is_constant(self):
+        client = self.client_for(self.manager)
+        client.get('/api/analytics/')
+        with CaptureQueriesContext(connection) as before:
+            client.get('/api/analytics/')
+        self.generate_activity()
+        for _ in range(3):
+            make_quiz_event(self.manager)
+        with CaptureQueriesContext(connection) as after:
+            client.get('/api/analytics/')
+        self.assertEqual(len(before), len(after))
+
+
+class RankIndexTests(TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        index = RankIndex.from_rows((user_id, rng.randint(0, 50)) for user_id in range(200))
+        for _ in range(500):
+            index.add(rng.randrange(250), rng.randint(-30, 3000))
+            index.top(5)
+            index.rank(rng.randrange(250))
+
+        points = {user_id: index.points(user_id) for user_id in range(250) if index.points(user_id) is not None}
+        for user_id, value in points.items():
+            self.assertEqual(index.rank(user_id), 1 + sum(1 for other in points.values() if other > value))
+        expected = sorted(points.items(), key=lambda item: (-item[1], item[0]))[:20]
+        self.assertEqual([(user_id, value) for _, user_id, value in index.top(20)], expected)
+
+
+    def test_short_and_empty_pages_see_new_students(self):
+        index = RankIndex.from_rows([(1, 50), (2, 40)])
+        self.assertEqual(len(index.top(10)), 2)
+        index.update(3, 10)
+        self.assertEqual([user_id for _, user_id, _ in index.top(10)], [1, 2, 3])
+
+        index = RankIndex()
+        self.assertEqual(index.top(5), [])
+        index.update(1, 0)
+        self.assertEqual(index.top(5), [(1, 1, 0)])
+
+    def test_large_scores_do_not_grow_the_tree(self):
+        index = RankIndex.from_rows([(1, 10), (2, 10 ** 9)])
+        index.update(3, 10 ** 12)
+        self.assertEqual([index.rank(user_id) for user_id in (1, 2, 3)], [3, 2, 1])
+        self.assertEqual(len(index._tree), 4)
+
+    def test_full_page_survives_changes_below_it(self):
+        index = RankIndex.from_rows([(1, 50), (2, 40), (3, 10)])
+        page = index.top(2)
+        index.update(4, 5)
+        self.assertIs(index.top(2), page)
+
+
+class LeaderboardRefreshTests(SimpleTestCase):
+    def setUp(self):
+        self.board = Leaderboard()
+        self.built = threading.Event()
+        self.release = threading.Event()
+
+        def build():
+            self.built.set()
+            self.release.wait(5)
+            return RankIndex.from_rows([(1, 10), (2, 20)])
+
+        patcher = mock.patch.object(self.board, '_build_global', side_effect=build)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.release.set()
+        self.first = self.board.index()
+        self.release.clear()
+
+    def test_stale_index_is_rebuilt_in_background(self):
+        self.board._built_at -= 3600
+        self.assertIs(self.board.index(), self.first)
+        self.assertTrue(self.built.wait(5))
+        # Изменение во время перестроения попадает и в новый индекс
+        self.board.record(1, 99, 89)
+        refresher = self.board._refresher
+        self.release.set()
+        refresher.join(5)
+        rebuilt = self.board.index()
+        self.assertIsNot(rebuilt, self.first)
+        self.assertEqual(rebuilt.points(1), 99)
+        self.assertEqual(self.first.points(1), 99)
+
+
+class LeaderboardViewTests(TestCase):
+    def setUp(self):
+        leaderboard.reset()
+        self.addCleanup(leaderboard.reset)
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 4)]
+        for student, points in zip(self.students, (30, 50, 10)):
+            ledger.credit(student, points, description='bonus', transaction_type='BONUS')
+        self.client = APIClient()
+        self.client.force_authenticate(self.students[2])
+
+    def test_top_and_my_rank(self):
+        response = self.client.get('/api/leaderboard/?limit=2')
+        self.assertEqual([row['points'] for row in response.data['results']], [50, 30])
+        self.assertEqual(response.data['me'], {'rank': 3, 'points': 10})
+
+    def test_ledger_updates_rank_after_commit(self):
+        self.client.get('/api/leaderboard/')
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.credit(self.students[2], 100, description='bonus')
+        response = self.client.get('/api/leaderboard/?limit=1')
+        self.assertEqual(response.data['me'], {'rank': 1, 'points': 110})
+        self.assertEqual(response.data['results'][0]['user_id'], self.students[2].id)
+
+    def test_weekly_window(self):
+        response = self.client.get('/api/leaderboard/?window=week')
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(self.client.get('/api/leaderboard/?window=year').status_code, 400)
+
+
+class MerchDropLoadTests(TransactionTestCase):
+    """Нагрузочный тест распродажи: остаток не уходит в минус при конкурентных покупках"""
+    workers = 16
+    stock = 5
+
+    def setUp(self):
+        self.merch = Merchandise.objects.create(name='Hoodie', merch_type='HOODIE', points_cost=100, stock_quantity=self.stock)
+        self.students = [make_user(f"91000000{index:02d}") for index in range(self.workers)]
+        for student in self.students:
+            ledger.credit(student, 150, description='bonus', transaction_type='BONUS')
+
+    def run_drop(self, allocator):
+        statuses = []
+
+        def worker(index):
+            client = APIClient()
+            client.force_authenticate(self.students[index])
+            with mock.patch('mini.views.allocator', allocator):
+                response = client.post(f"/api/merchandise/{self.merch.id}/purchase/", {'quantity': 1}, format='json')
+            statuses.append(response.status_code)
+
+        self.assertEqual(run_concurrently(worker, self.workers), [])
+        return statuses
+
+    def assert_no_oversell(self, statuses):
+        self.merch.refresh_from_db()
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(self.merch.stock_quantity, 0)
+        self.assertEqual(MerchOrder.objects.count(), self.stock)
+        self.assertEqual(PointTransaction.objects.filter(transaction_type='SPENT').count(), self.stock)
+        self.assertEqual(
+            sum(StudentProfile.objects.values_list('points', flat=True)),
+            self.workers * 150 - self.stock * 100
+        )
+
+    def test_direct_mode(self):
+        self.assert_no_oversell(self.run_drop(StockAllocator(mode='direct')))
+
+    def test_queued_mode(self):
+        self.assert_no_oversell(self.run_drop(StockAllocator(mode='queued')))
+
+
+class StockAllocatorTests(TestCase):
+    def setUp(self):
+        self.merch = Merchandise.objects.create(name='Cap', merch_type='CAP', points_cost=100, stock_quantity=0)
+        self.student = make_user('9100000099')
+
+    def test_out_of_stock_is_reported_before_points(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.post(f"/api/merchandise/{self.merch.id}/purchase/", {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Недостаточно товара', response.data['error'])
+        self.assertFalse(PointTransaction.objects.exists())
+
+    def test_started_order_wait_is_bounded(self):
+        allocator = StockAllocator(mode='queued', timeout=0.2)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('mini.stock.place_order', side_effect=lambda *args, **kwargs: release.wait(5)):
+            started = time.monotonic()
+            with self.assertRaises(AllocationTimeout) as raised:
+                allocator.purchase(self.student, self.merch, 1)
+        self.assertTrue(raised.exception.started)
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class StartPayloadCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, self.quiz = make_quiz_event(self.manager, questions=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def start(self):
+        return self.client.post(f"/api/events/{self.event.id}/start/")
+
+    def test_payload_is_cached_until_content_changes(self):
+        hits = start_payload_cache.stats()['hits']
+        first = self.start()
+        with CaptureQueriesContext(connection) as cached:
+            second = self.start()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(start_payload_cache.stats()['hits'], hits + 1)
+        self.assertFalse(any('mini_quizquestion' in query['sql'] for query in cached.captured_queries))
+
+        question = self.quiz.questions.first()
+        question.question_text = 'Changed'
+        question.save()
+        texts = [q['question_text'] for q in self.start().data['quiz']['questions']]
+        self.assertIn('Changed', texts)
+
+    def test_answer_change_invalidates_payload(self):
+        self.start()
+        answer = QuizAnswer.objects.filter(question__quiz=self.quiz).first()
+        answer.delete()
+        answers = sum(len(q['answers']) for q in self.start().data['quiz']['questions'])
+        self.assertEqual(answers, 5)
+
+
+class GenerateLoadDataTests(TestCase):
+    def test_generates_consistent_dataset(self):
+        call_command(
+            'generate_load_data', '--users', '40', '--events', '10', '--participations', '200',
+            '--bonus-transactions', '40', '--orders', '20', '--chunk-size', '15', stdout=io.StringIO()
+        )
+        self.assertEqual(StudentProfile.objects.count(), 40)
+        self.assertEqual(EventParticipation.objects.count(), 200)
+        for profile in StudentProfile.objects.all():
+            history = PointTransaction.objects.filter(student_id=profile.user_id).order_by('timestamp', 'id')
+            self.assertEqual(sum(history.values_list('points', flat=True)), profile.points)
+            last = history.last()
+            self.assertEqual(last.balance_after if last else 0, profile.points)
+        earned = PointTransaction.objects.filter(transaction_type='EARNED')
+        self.assertEqual(earned.count(), EventParticipation.objects.filter(completed=True).count())
+        self.assertFalse(earned.filter(completed_event__isnull=True).exists())
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+
+class EndpointBudgetTests(TestCase):
+    """Регрессия N+1: число запросов к БД на эндпоинт не выше базовой линии"""
+
+    def test_query_counts_within_baseline(self):
+        call_command(
+            'generate_load_data', '--users', '30', '--events', '8', '--participations', '120',
+            '--bonus-transactions', '30', '--orders', '30', stdout=io.StringIO()
+        )
+        leaderboard.reset()
+        # Сценарии выполняются в БД теста, команда целиком создала бы свою;
+        # отложенные просмотры записываются до отката теста
+        self.addCleanup(view_counter.flush)
+        command = BenchEndpointsCommand(stdout=io.StringIO())
+        options = vars(command.create_parser('manage.py', 'bench_endpoints').parse_args(
+            ['--queries-only', '--iterations', '3', '--warmup', '1']
+        ))
+        results = command.run_scenarios(options)
+        self.assertEqual(command.compare(results, json.loads(Path(options['baseline']).read_text()), options), [])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_server_timing_and_metrics_per_url_name(self):
+        make_quiz_event(self.manager)
+        response = self.client.get('/api/events/')
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'ser', 'render', 'total'})
+        queries = int(timing['db'].split('"')[1].split()[0])
+        self.assertGreater(queries, 0)
+        self.assertGreater(float(timing['ser'].split('=')[1]), 0)
+
+        with self.settings(INSTRUMENTATION={'METRICS_TOKEN': 'secret'}):
+            body = APIClient().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('mini_requests_total{view="event-list",status="200"} 1', body)
+        self.assertIn(f'mini_db_queries_sum{{view="event-list"}} {float(queries)!r}', body)
+        self.assertIn('mini_request_duration_seconds_bucket{view="event-list",le="+Inf"} 1', body)
+        self.assertIn('mini_start_payload_cache_hits_total', body)
+
+    def test_metrics_token(self):
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 404)
+        with self.settings(INSTRUMENTATION={'METRICS_TOKEN': 'secret'}):
+            self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+            self.assertEqual(APIClient().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class LoginTests(TestCase):
+    def test_existing_user_is_one_indexed_read(self):
+        student = make_user('9001234567')
+        with self.assertNumQueries(1):
+            response = APIClient().post('/api/login/', {'phone': '+7 (900) 123-45-67'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], student.id)
+
+    def test_new_user_gets_profile_and_unusable_password(self):
+        response = APIClient().post('/api/login/', {'phone': '89007654321'}, format='json')
+        user = CustomUser.objects.get(phone='9007654321')
+        self.assertEqual(response.data['user']['id'], user.id)
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(user.student_profile.points, 0)
+
+
+class LoginStormTests(TransactionTestCase):
+    def test_concurrent_logins_create_one_user(self):
+        workers = 8
+
+        def login(index):
+            response = APIClient().post('/api/login/', {'phone': '9005550000'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(run_concurrently(login, workers), [])
+        self.assertEqual(CustomUser.objects.filter(phone='9005550000').count(), 1)
+        self.assertEqual(StudentProfile.objects.filter(user__phone='9005550000').count(), 1)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.student = make_user('9001112233')
+        self.token = ClaimsRefreshToken.for_user(self.student).access_token
+
+    def test_token_user_needs_no_query(self):
+        manager = make_user('9001112244', 'MANAGER')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(manager).access_token}')
+        with self.assertNumQueries(0):
+            response = client.get('/api/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_fields_load_once_from_user_cache(self):
+        authentication = ClaimsJWTAuthentication()
+        with self.assertNumQueries(0):
+            user = authentication.get_user(self.token)
+            self.assertEqual((user.pk, user.user_type), (self.student.pk, 'STUDENT'))
+            self.assertEqual(user.student_profile.pk, self.student.student_profile.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.phone, '9001112233')
+            self.assertEqual(user.email, self.student.email)
+        with self.assertNumQueries(0):
+            self.assertEqual(authentication.get_user(self.token).phone, '9001112233')
+
+        self.student.phone = '9001112299'
+        self.student.save()
+        self.assertEqual(authentication.get_user(self.token).phone, '9001112299')
+
+    def test_token_user_works_in_writes(self):
+        user = ClaimsJWTAuthentication().get_user(self.token)
+        ledger.credit(user, 15, 'Bonus', transaction_type='BONUS')
+        self.assertEqual(user.student_profile.points, 15)
+        self.assertEqual(PointTransaction.objects.get().student_id, self.student.pk)
+
+    def test_deactivation_and_role_change_revoke_issued_tokens(self):
+        authentication = ClaimsJWTAuthentication()
+        self.student.user_type = 'MANAGER'
+        self.student.save()
+        with self.assertRaises(InvalidToken):
+            authentication.get_user(self.token)
+
+        self.student.is_active = False
+        self.student.save()
+        token = ClaimsRefreshToken.for_user(self.student).access_token
+        with self.assertRaises(AuthenticationFailed):
+            authentication.get_user(token)
+
+    def test_stale_cached_state_defers_to_database(self):
+        # Роль сменили в другом воркере: кеш этого процесса хранит старые claims
+        stale = claims_state.get(self.student.pk)
+        self.student.user_type = 'MANAGER'
+        self.student.save()
+        token = ClaimsRefreshToken.for_user(self.student).access_token
+        claims_state.backend.set(claims_state._key(self.student.pk), stale)
+
+        user = ClaimsJWTAuthentication().get_user(token)
+        self.assertEqual(user.user_type, 'MANAGER')
+        self.assertEqual(claims_state.get(self.student.pk)[CLAIM_FIELDS.index('user_type')], 'MANAGER')
+        with self.assertRaises(InvalidToken):
+            ClaimsJWTAuthentication().get_user(self.token)
+
+    def test_unrelated_save_keeps_token_valid(self):
+        self.student.email = 'new@example.com'
+        self.student.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(ClaimsJWTAuthentication().get_user(self.token).pk, self.student.pk)
+
+    def test_tokens_without_claims_fall_back_to_database(self):
+        token = RefreshToken.for_user(self.student).access_token
+        with self.assertNumQueries(1):
+            user = ClaimsJWTAuthentication().get_user(token)
+        self.assertEqual(type(user), CustomUser)
+
+
+class ReadReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+        self.router.health = mock.Mock(is_healthy=mock.Mock(return_value=True))
+        patcher = mock.patch.dict(settings.DATABASES, {'replica': {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_healthy_replica_only_inside_replica_blocks(self):
+        self.assertIsNone(self.router.db_for_read(Event))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Event), 'replica')
+            self.router.health.is_healthy.return_value = False
+            self.assertEqual(self.router.db_for_read(Event), 'default')
+        self.assertEqual(self.router.db_for_write(Event), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'mini'))
+
+    def test_unavailable_replica_is_not_rechecked_until_retry(self):
+        health = ReplicaHealth('missing', retry_interval=60)
+        with mock.patch.object(health, '_check', wraps=health._check) as check:
+            with self.assertLogs('mini.db_router', 'WARNING'):
+                self.assertFalse(health.is_healthy())
+            self.assertFalse(health.is_healthy())
+        self.assertEqual(check.call_count, 1)
+
+    def test_replica_failure_mid_request_retries_on_primary(self):
+        router = self.router
+        databases = []
+
+        class View:
+            def dispatch(self, request):
+                databases.append(router.db_for_read(Event))
+                if len(databases) == 1:
+                    raise OperationalError('replica went away')
+                return 'ok'
+
+        class ReplicaView(ReplicaReadMixin, View):
+            pass
+
+        request = mock.Mock(method='GET')
+        with self.assertLogs('mini.db_router', 'WARNING'):
+            self.assertEqual(ReplicaView().dispatch(request), 'ok')
+        self.assertEqual(databases, ['replica', None])
+        router.health.mark_down.assert_called_once_with()
+
+        # Ошибка основной БД не повторяется
+        databases.clear()
+        router.health.is_healthy.return_value = False
+        with self.assertRaises(OperationalError):
+            ReplicaView().dispatch(request)
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, self.quiz = make_quiz_event(self.manager)
+        token = ClaimsRefreshToken.for_user(self.student).access_token
+        self.auth = {'Authorization': f'Bearer {token}'}
+        buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=1000, background=False)
+        for target in ('mini.views.view_counter', 'mini.async_views.view_counter'):
+            patcher = mock.patch(target, buffer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def get_both(self, url):
+        sync_response = await sync_to_async(self.client.get)(f'/api/{url}', headers=self.auth)
+        async_response = await self.async_client.get(f'/api/async/{url}', headers=self.auth)
+        return sync_response, async_response
+
+    async def test_responses_match_sync_views(self):
+        sync_response, async_response = await self.get_both('events/')
+        self.assertEqual(async_response.content, sync_response.content)
+
+        sync_response, async_response = await self.get_both(f'events/{self.event.id}/')
+        sync_data, async_data = sync_response.json(), async_response.json()
+        # Каждый просмотр увеличивает счетчик
+        self.assertEqual(async_data.pop('views_count'), sync_data.pop('views_count') + 1)
+        self.assertEqual(async_data, sync_data)
+
+        response = await self.async_client.post(f'/api/async/events/{self.event.id}/start/', headers=self.auth)
+        self.assertEqual(response.json()['quiz']['id'], self.quiz.id)
+        self.assertTrue(await EventParticipation.objects.filter(event=self.event, student=self.student).aexists())
+
+    async def test_submit_quiz_awards_points(self):
+        answers = await sync_to_async(answers_for)(self.quiz)
+        response = await self.async_client.post(
+            f'/api/async/events/{self.event.id}/submit-quiz/', {'answers': answers},
+            content_type='application/json', headers=self.auth
+        )
+        self.assertEqual(response.json(), {
+            'score': 100, 'total_questions': 3, 'correct_count': 3,
+            'passed': True, 'points_earned': 10, 'current_points': 10,
+        })
+
+    async def test_submit_quiz_honours_idempotency_key(self):
+        answers = await sync_to_async(answers_for)(self.quiz)
+        responses = [
+            await self.async_client.post(
+                f'/api/async/events/{self.event.id}/submit-quiz/', {'answers': answers},
+                content_type='application/json', headers={**self.auth, 'Idempotency-Key': 'async-1'}
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(responses[1].content, responses[0].content)
+        self.assertEqual(responses[1].json()['points_earned'], 10)
+
+    async def test_submit_rejects_non_object_body(self):
+        url = f'events/{self.event.id}/submit-quiz/'
+        sync_response = await sync_to_async(self.client.post)(
+            f'/api/{url}', [1, 2], content_type='application/json', headers=self.auth
+        )
+        async_response = await self.async_client.post(
+            f'/api/async/{url}', [1, 2], content_type='application/json', headers=self.auth
+        )
+        self.assertEqual((sync_response.status_code, async_response.status_code), (400, 400))
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/async/events/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.other_manager = make_user('9000000009', 'MANAGER')
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 4)]
+        self.event, _ = make_quiz_event(self.manager, questions=1)
+        self.other_event, _ = make_quiz_event(self.other_manager, questions=1)
+        for student in self.students:
+            EventParticipation.objects.create(event=self.event, student=student, completed=True, score=100)
+        EventParticipation.objects.create(event=self.other_event, student=self.students[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def export(self, path, **params):
+        response = self.client.get(f'/api/exports/{path}', params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_is_filtered_by_manager(self):
+        rows = list(csv.reader(io.StringIO(self.export('participations.csv', manager=self.manager.id))))
+        self.assertEqual(rows[0][:3], ['id', 'event_id', 'event_title'])
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(all(row[1] == str(self.event.id) for row in rows[1:]))
+
+    def test_ndjson_export_and_date_filter(self):
+        self.client.force_authenticate(self.other_manager)
+        lines = self.export('participations.ndjson', event=self.other_event.id).splitlines()
+        self.assertEqual([json.loads(line)['student_id'] for line in lines], [self.students[0].id])
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.export('participations.ndjson', date_to='2000-01-01'), '')
+        # Дата без времени включает весь день
+        self.assertEqual(len(self.export('participations.ndjson', date_to=timezone.localdate().isoformat()).splitlines()), 3)
+
+    def test_manager_sees_only_own_events(self):
+        self.assertEqual(self.export('participations.ndjson', event=self.other_event.id), '')
+        self.assertEqual(self.export('participations.ndjson', manager=self.other_manager.id), '')
+        self.assertEqual(self.client.get('/api/exports/orders.csv').status_code, 403)
+
+        CustomUser.objects.filter(pk=self.manager.pk).update(is_staff=True)
+        self.manager.refresh_from_db()
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(len(self.export('participations.ndjson').splitlines()), 4)
+        self.assertEqual(self.client.get('/api/exports/orders.csv').status_code, 200)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get('/api/exports/participations.xml').status_code, 400)
+        self.manager.is_staff = True
+        self.assertEqual(self.client.get('/api/exports/orders.csv', {'event': self.event.id}).status_code, 400)
+        self.manager.is_staff = False
+        for value in ('2024-02-30', '2024-02-30T10:00:00', '9999-12-31'):
+            self.assertEqual(self.client.get('/api/exports/participations.csv', {'date_to': value}).status_code, 400)
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get('/api/exports/participations.csv').status_code, 403)
+
+    def test_command_matches_endpoint(self):
+        output = io.StringIO()
+        call_command('export_data', 'participations', '--format', 'ndjson', '--chunk-size', '2',
+                     '--manager', str(self.manager.id), stdout=output)
+        self.assertEqual(output.getvalue(), self.export('participations.ndjson'))
+
+
+class StudentHistoryTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.events = [make_quiz_event(self.manager, questions=1)[0] for _ in range(4)]
+        for event in self.events:
+            EventParticipation.objects.create(event=event, student=self.student, completed=True, score=100)
+            ledger.credit(self.student, event.points, 'Quiz', event=event)
+        Feedback.objects.create(event=self.events[0], student=self.student, rating=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def collect(self, url):
+        items = []
+        while url:
+            data = self.client.get(url).data
+            items.extend(data.get('events', data.get('results')))
+            url = data['next']
+        return items
+
+    def test_completed_events_exclude_reviewed_and_paginate(self):
+        events = self.collect('/api/completed-events/?page_size=2')
+        self.assertEqual([event['id'] for event in events], [event.id for event in reversed(self.events[1:])])
+
+    def test_completed_events_query_count_does_not_grow(self):
+        with CaptureQueriesContext(connection) as short_history:
+            self.client.get('/api/completed-events/')
+        for _ in range(5):
+            event, _ = make_quiz_event(self.manager, questions=1)
+            EventParticipation.objects.create(event=event, student=self.student, completed=True)
+        with CaptureQueriesContext(connection) as long_history:
+            self.client.get('/api/completed-events/')
+        self.assertEqual(len(long_history), len(short_history))
+
+    def test_activity_pages_cover_history_in_order(self):
+        items = self.collect('/api/my-activity/?page_size=3')
+        self.assertEqual(len(items), 4 + 1 + 4)
+        keys = [(item['timestamp'], item['type'], item['id']) for item in items]
+        self.assertEqual(len(set(keys)), len(keys))
+        timestamps = [item['timestamp'] for item in items]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_activity_rejects_bad_cursor(self):
+        self.assertEqual(self.client.get('/api/my-activity/', {'cursor': 'broken'}).status_code, 400)
+
+
+class PointsHistoryTests(TestCase):
+    def setUp(self):
+        self.student = make_user('9000000001')
+        self.start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        for day, points in enumerate([10, 20, -5, 40]):
+            if points > 0:
+                transaction = ledger.credit(self.student, points, 'Начисление')
+            else:
+                transaction = ledger.debit(self.student, -points, 'Списание')
+            PointTransaction.objects.filter(id=transaction.id).update(
+                timestamp=self.start + datetime.timedelta(days=day)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def at(self, days):
+        return self.start + datetime.timedelta(days=days, hours=1)
+
+    def test_balance_at_uses_checkpoints(self):
+        self.assertEqual(ledger.balance_at(self.student.id, self.start - datetime.timedelta(days=1)), 0)
+        self.assertEqual(ledger.balance_at(self.student.id, self.at(0)), 10)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ledger.balance_at(self.student.id, self.at(2)), 25)
+        self.assertEqual(len(queries), 2)
+        response = self.client.get('/api/points-history/balance/', {'at': self.at(3).isoformat()})
+        self.assertEqual(response.data['balance'], 65)
+
+    def test_balance_at_adds_transactions_without_checkpoint(self):
+        PointTransaction.objects.filter(student=self.student, points__in=[10, 20]).update(balance_after=None)
+        with self.assertLogs('mini.ledger', 'WARNING'):
+            self.assertEqual(ledger.balance_at(self.student.id, self.at(1)), 30)
+        self.assertEqual(ledger.balance_at(self.student.id, self.at(3)), 65)
+
+    def test_migration_backfills_balance_after(self):
+        migration = importlib.import_module('mini.migrations.0009_backfill_balance_after')
+        PointTransaction.objects.filter(student=self.student, points__in=[10, 20, -5]).update(balance_after=None)
+        migration.backfill_balance_after(apps, None)
+        history = PointTransaction.objects.filter(student=self.student).order_by('timestamp', 'id')
+        self.assertEqual(list(history.values_list('balance_after', flat=True)), [10, 30, 25, 65])
+        with self.assertNoLogs('mini.ledger', 'WARNING'):
+            self.assertEqual(ledger.balance_at(self.student.id, self.at(2)), 25)
+
+    def test_history_is_paginated_newest_first(self):
+        first = self.client.get('/api/points-history/', {'page_size': 3}).data
+        self.assertEqual([item['points'] for item in first['results']], [40, -5, 20])
+        second = self.client.get(first['next']).data
+        self.assertEqual([item['points'] for item in second['results']], [10])
+        self.assertEqual(second['results'][0]['balance_after'], 10)
+
+    def test_balance_requires_valid_moment(self):
+        self.assertEqual(self.client.get('/api/points-history/balance/', {'at': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/points-history/balance/', {'at': '2024-02-30T00:00:00'}).status_code, 400)
+
+
+class ReconcileBalancesTests(TestCase):
+    def setUp(self):
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 6)]
+        for student in self.students:
+            ledger.credit(student, 50, 'Начисление')
+        ledger.debit(self.students[0], 20, 'Списание')
+        # Баланс изменен в обход журнала
+        StudentProfile.objects.filter(user=self.students[3]).update(points=999)
+
+    def reconcile(self, *args):
+        output = io.StringIO()
+        call_command('reconcile_balances', '--chunk-size', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def test_reports_drift_without_fixing(self):
+        with self.assertRaises(CommandError):
+            self.reconcile()
+        self.assertEqual(StudentProfile.objects.get(user=self.students[3]).points, 999)
+
+    def test_fix_restores_ledger_balance(self):
+        output = self.reconcile('--fix')
+        self.assertIn(f'User #{self.students[3].id}: points 999, ledger 50', output)
+        self.assertEqual(StudentProfile.objects.get(user=self.students[3]).points, 50)
+        self.assertEqual(StudentProfile.objects.get(user=self.students[0]).points, 30)
+
+    def test_fix_updates_leaderboard(self):
+        leaderboard.reset()
+        self.addCleanup(leaderboard.reset)
+        drifted = self.students[3].id
+        self.assertEqual(leaderboard.index().rank(drifted), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reconcile('--fix')
+        self.assertEqual(leaderboard.index().points(drifted), 50)
+        self.assertEqual(leaderboard.index().rank(drifted), 1)
+        self.assertEqual(leaderboard.index().rank(self.students[0].id), 5)
+
+    def test_resumes_from_saved_progress(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state = f'{directory}/state.json'
+            with open(state, 'w') as file:
+                json.dump({'after': self.students[3].id, 'checked': 4, 'drifted': 0, 'fixed': 0}, file)
+            output = self.reconcile('--state', state)
+            self.assertIn('5 profiles checked, 0 drifted', output)
+            with open(state) as file:
+                self.assertEqual(json.load(file)['after'], self.students[4].id)
+
+
+class BatchSubmitQuizTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.students = [make_user(f"90000000{index:02d}") for index in range(1, 13)]
+        self.event, self.quiz = make_quiz_event(self.manager, points=10)
+        rollups.get_global_stats()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def submit(self, submissions):
+        return self.client.post('/api/events/submit-quiz/batch/', {'submissions': submissions}, format='json')
+
+    def item(self, student, correct=True, **extra):
+        return {'student_id': student.id, 'event_id': self.event.id, 'answers': answers_for(self.quiz, correct), **extra}
+
+    def test_per_item_results_and_bulk_writes(self):
+        EventParticipation.objects.create(event=self.event, student=self.students[1])
+        response = self.submit([
+            self.item(self.students[0], client_id='a'),
+            {'phone': '+7 ' + self.students[1].phone, 'event_id': self.event.id, 'answers': answers_for(self.quiz, False)},
+            {'student_id': self.students[2].id, 'event_id': 999999, 'answers': []},
+            'garbage',
+        ])
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (2, 2))
+        first, second, third, fourth = response.data['results']
+        self.assertEqual((first['client_id'], first['passed'], first['current_points']), ('a', True, 10))
+        self.assertEqual((second['status'], second['passed'], second['score']), ('ok', False, 0))
+        self.assertEqual(third['error'], 'Quiz not found')
+        self.assertEqual(fourth['status'], 'error')
+
+        self.assertEqual(StudentProfile.objects.get(user=self.students[0]).points, 10)
+        self.assertEqual(PointTransaction.objects.get(student=self.students[0]).balance_after, 10)
+        self.assertFalse(EventParticipation.objects.get(event=self.event, student=self.students[1]).completed)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.completion_count, 1)
+        # Сводная аналитика совпадает с полным пересчетом
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+    def test_rejects_non_object_body(self):
+        response = self.client.post('/api/events/submit-quiz/batch/', [self.item(self.students[0])], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        small_batch = [self.item(student) for student in self.students[:2]]
+        large_batch = [self.item(student) for student in self.students[2:]]
+        get_answer_key(self.quiz.id)
+        with CaptureQueriesContext(connection) as small:
+            self.submit(small_batch)
+        with CaptureQueriesContext(connection) as large:
+            self.submit(large_batch)
+        self.assertEqual(len(large), len(small))
+
+    def test_student_submits_only_own_results(self):
+        self.client.force_authenticate(self.students[0])
+        response = self.submit([
+            {'event_id': self.event.id, 'answers': answers_for(self.quiz)},
+            self.item(self.students[1]),
+        ])
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error'])
+        self.assertEqual(self.submit([]).status_code, 400)
+
+
+class CheckinTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, _ = make_quiz_event(self.manager, questions=1)
+        self.buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=1000, background=False)
+        patcher = mock.patch('mini.views.view_counter', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mint(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        return client.get(f'/api/events/{self.event.id}/checkin-token/', params)
+
+    def test_checkin_is_verified_and_buffered_without_queries(self):
+        token = self.mint(slot='gate-1').data['token']
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.student).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/checkin/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['event_id'], response.data['slot']), (self.event.id, 'gate-1'))
+        self.assertEqual(len(queries), 0)
+
+        client.post('/api/checkin/', {'token': token}, format='json')
+        self.buffer.flush()
+        participation = EventParticipation.objects.get(event=self.event, student=self.student)
+        # Чекин не считается просмотром
+        self.assertEqual(Event.objects.get(id=self.event.id).views_count, 0)
+        self.assertFalse(participation.completed)
+
+    def test_rejects_non_object_body(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(client.post('/api/checkin/', ['token'], format='json').status_code, 400)
+
+    def test_rejects_tampered_and_expired_tokens(self):
+        signer = CheckinSigner(ttl=60)
+        token, _ = signer.mint(self.event.id)
+        with self.assertRaises(CheckinTokenError):
+            signer.verify(token.replace(f'{self.event.id}:', f'{self.event.id + 1}:', 1))
+        with mock.patch('mini.checkin.time.time', return_value=time.time() + 61):
+            with self.assertRaises(CheckinTokenError):
+                signer.verify(token)
+        self.assertEqual(signer.verify(token), (self.event.id, ''))
+
+    def test_minting_is_validated(self):
+        self.assertEqual(self.mint(slot='bad slot').status_code, 400)
+        self.assertEqual(self.mint(ttl='0').status_code, 400)
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(client.get(f'/api/events/{self.event.id}/checkin-token/').status_code, 403)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, self.quiz = make_quiz_event(self.manager, points=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def submit(self, key=None, correct=True):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            f"/api/events/{self.event.id}/submit-quiz/", {'answers': answers_for(self.quiz, correct)},
+            format='json', **headers
+        )
+
+    def test_retried_submit_replays_response(self):
+        first = self.submit('retry-1')
+        replay = self.submit('retry-1')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(json.loads(replay.content), json.loads(first.content))
+        self.assertEqual(PointTransaction.objects.filter(student=self.student).count(), 1)
+
+    def test_migration_backfills_first_award_per_completion(self):
+        migration = importlib.import_module('mini.migrations.0008_idempotency_and_single_award')
+        old = [
+            PointTransaction.objects.create(student=self.student, event=self.event, points=10,
+                                            transaction_type='EARNED', description=f'Completed event: {self.event.title}')
+            for _ in range(2)
+        ]
+        PointTransaction.objects.create(student=self.student, event=self.event, points=5,
+                                        transaction_type='BONUS', description='Bonus')
+        migration.backfill_completed_event(apps, None)
+        awarded = PointTransaction.objects.filter(completed_event__isnull=False)
+        self.assertEqual(list(awarded.values_list('id', flat=True)), [old[0].id])
+        self.assertEqual(self.submit().data['points_earned'], 0)
+
+    def test_completion_is_awarded_once_without_key(self):
+        self.assertEqual(self.submit().data['points_earned'], 10)
+        self.assertEqual(self.submit().data['points_earned'], 0)
+        # Пакетная отправка тоже не начисляет повторно
+        self.client.post('/api/events/submit-quiz/batch/', {'submissions': [
+            {'event_id': self.event.id, 'answers': answers_for(self.quiz)},
+        ]}, format='json')
+        self.assertEqual(StudentProfile.objects.get(user=self.student).points, 10)
+        self.assertEqual(PointTransaction.objects.filter(student=self.student).count(), 1)
+
+    def test_retried_purchase_creates_one_order(self):
+        merch = Merchandise.objects.create(name='Cap', merch_type='CAP', points_cost=30, stock_quantity=5)
+        ledger.credit(self.student, 100, description='bonus', transaction_type='BONUS')
+        url = f"/api/merchandise/{merch.id}/purchase/"
+        first = self.client.post(url, {'quantity': 1}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        replay = self.client.post(url, {'quantity': 1}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((replay.status_code, replay.content), (201, first.content))
+        self.assertEqual(MerchOrder.objects.count(), 1)
+        self.assertEqual(StudentProfile.objects.get(user=self.student).points, 70)
+
+        conflict = self.client.post(url, {'quantity': 2}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(conflict.status_code, 422)
+
+    def test_timed_out_purchase_stores_final_outcome(self):
+        merch = Merchandise.objects.create(name='Cap', merch_type='CAP', points_cost=30, stock_quantity=5)
+        ledger.credit(self.student, 100, description='bonus', transaction_type='BONUS')
+        url = f"/api/merchandise/{merch.id}/purchase/"
+        future = futures.Future()
+        future.set_running_or_notify_cancel()
+        with mock.patch('mini.views.allocator.purchase', side_effect=AllocationTimeout(future)):
+            first = self.client.post(url, {'quantity': 1}, format='json', HTTP_IDEMPOTENCY_KEY='order-2')
+            pending = self.client.post(url, {'quantity': 1}, format='json', HTTP_IDEMPOTENCY_KEY='order-2')
+        self.assertEqual((first.status_code, pending.status_code), (202, 409))
+
+        future.set_result(place_order(self.student, merch, 1))
+        replay = self.client.post(url, {'quantity': 1}, format='json', HTTP_IDEMPOTENCY_KEY='order-2')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(MerchOrder.objects.count(), 1)
+
+    def test_expired_and_abandoned_keys_are_reused(self):
+        store = IdempotencyStore(ttl=60, in_progress_timeout=5)
+        record, _ = store.begin(self.student.id, 'k', 'hash')
+        self.assertEqual(store.begin(self.student.id, 'k', 'hash'), (None, record))
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=10))
+        fresh, existing = store.begin(self.student.id, 'k', 'hash')
+        self.assertIsNone(existing)
+        IdempotencyKey.objects.update(status_code=200, created_at=timezone.now() - datetime.timedelta(seconds=61))
+        self.assertEqual(store.purge(), 1)
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, self.quiz = make_quiz_event(self.manager)
+        self.limiter = TokenBucketLimiter(rates={
+            'login': {'ip': '2/min'},
+            'submit': {'user': '2/min', 'ip': '100/min'},
+        })
+        patcher = mock.patch('mini.throttling.rate_limiter', self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_login_is_limited_per_ip(self):
+        client = APIClient()
+        statuses = [client.post('/api/login/', {'phone': '9005550001'}, format='json').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        other = client.post('/api/login/', {'phone': '9005550001'}, format='json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 200)
+
+    def test_forwarded_for_does_not_change_client_identity(self):
+        client = APIClient()
+        statuses = [
+            client.post('/api/login/', {'phone': '9005550001'}, format='json',
+                        HTTP_X_FORWARDED_FOR=f'10.1.0.{index}').status_code
+            for index in range(5)
+        ]
+        self.assertEqual(statuses, [200, 200, 429, 429, 429])
+
+    def test_login_behind_shared_address_is_limited_per_phone(self):
+        limiter = TokenBucketLimiter(rates={'login': {'phone': '2/min', 'ip': '100/min'}})
+        client = APIClient()
+        with mock.patch('mini.throttling.rate_limiter', limiter):
+            statuses = [client.post('/api/login/', {'phone': '9005550001'}, format='json').status_code
+                        for _ in range(3)]
+            other = client.post('/api/login/', {'phone': '+7 900 555-00-02'}, format='json')
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(other.status_code, 200)
+
+    def test_rejected_request_takes_no_tokens(self):
+        limiter = TokenBucketLimiter()
+        user, ip = parse_rate('2/min'), parse_rate('1/min')
+        self.assertEqual(limiter.hit_all([('user', user), ('ip', ip)]), (0, None))
+        self.assertEqual(limiter.hit_all([('user', user), ('ip', ip)])[1], 1)
+        # Отказ по IP не списал токен из бакета пользователя
+        self.assertEqual(limiter.hit('user', user), 0)
+
+    def test_bucket_table_is_bounded(self):
+        limiter = TokenBucketLimiter(max_keys=3)
+        rate = parse_rate('1/hour')
+        for index in range(10):
+            limiter.hit(f'k{index}', rate)
+        self.assertEqual(limiter.stats()[1], 3)
+        # Недавний ключ сохранил состояние, вытеснены самые старые
+        self.assertGreater(limiter.hit('k9', rate), 0)
+        self.assertEqual(limiter.hit('k0', rate), 0)
+
+    def test_rejection_has_retry_after_and_is_counted(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        url = f"/api/events/{self.event.id}/submit-quiz/"
+        for _ in range(2):
+            client.post(url, {'answers': []}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(url, {'answers': []}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(len(queries), 0)
+        # Бакет другого пользователя не затронут
+        client.force_authenticate(self.manager)
+        self.assertEqual(client.post(url, {'answers': []}, format='json').status_code, 200)
+        self.assertIn('mini_throttled_requests_total{scope="submit",bucket="user"} 1', metrics.render())
+
+    def test_bucket_refills_over_time(self):
+        limiter = TokenBucketLimiter()
+        rate = (2, 30.0)
+        with mock.patch('mini.throttling.time.monotonic', return_value=1000.0):
+            self.assertEqual([limiter.hit('k', rate) for _ in range(2)], [0, 0])
+            self.assertEqual(limiter.hit('k', rate), 30.0)
+        with mock.patch('mini.throttling.time.monotonic', return_value=1030.0):
+            self.assertEqual(limiter.hit('k', rate), 0)
+            self.assertGreater(limiter.hit('k', rate), 0)
+
+
+class CatalogConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        self.event, _ = make_quiz_event(self.manager, questions=1)
+        self.merch = Merchandise.objects.create(name='Cap', merch_type='CAP', points_cost=30, stock_quantity=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_revalidation_and_repeat_fetch_skip_the_database(self):
+        first = self.client.get('/api/merchandise/')
+        etag = first['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get('/api/merchandise/', HTTP_IF_NONE_MATCH=etag)
+            repeat = self.client.get('/api/merchandise/')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, etag))
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual((repeat.content, repeat['ETag']), (first.content, etag))
+        self.assertEqual(repeat['Content-Type'], first['Content-Type'])
+
+    def test_etag_changes_on_writes_without_signals(self):
+        merch_url = f'/api/merchandise/{self.merch.id}/'
+        before = self.client.get(merch_url)['ETag']
+        ledger.credit(self.student, 100, description='bonus', transaction_type='BONUS')
+        place_order(self.student, self.merch, 1)
+        response = self.client.get(merch_url, HTTP_IF_NONE_MATCH=before)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['stock_quantity'], 4)
+
+    def test_view_flush_keeps_event_catalog_cached(self):
+        before = self.client.get('/api/events/')['ETag']
+        buffer = ViewCounterBuffer(flush_interval=3600, flush_threshold=1000, background=False)
+        buffer.record(self.event.id, self.student.id)
+        buffer.flush()
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=before)
+        self.assertEqual(response.status_code, 304)
+
+        cache.clear()
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=before)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'][0]['views_count'], 1)
+
+    @override_settings(ALLOWED_HOSTS=['api.example', 'evil.example'])
+    def test_cached_body_is_not_shared_between_hosts(self):
+        for _ in range(EventCursorPagination.page_size):
+            make_quiz_event(self.manager, questions=0)
+        poisoned = self.client.get('/api/events/', HTTP_HOST='evil.example')
+        self.assertTrue(json.loads(poisoned.content)['next'].startswith('http://evil.example/'))
+        response = self.client.get('/api/events/', HTTP_HOST='api.example')
+        self.assertTrue(json.loads(response.content)['next'].startswith('http://api.example/'))
+
+    def test_filtered_requests_are_not_cached(self):
+        response = self.client.get('/api/events/?page_size=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        self.manager = make_user('9000000000', 'MANAGER')
+        self.student = make_user('9000000001')
+        quiz_event, _ = make_quiz_event(self.manager, questions=2)
+        game_event = Event.objects.create(title='Игра', description='', event_type='MINIGAME', manager=self.manager)
+        Minigame.objects.create(event=game_event, instructions='Собери «пазл»\u2028')
+        quest_event = Event.objects.create(title='Quest', description='Q', event_type='QUEST', manager=self.manager, qr_code='qr')
+        for event in (quiz_event, game_event, quest_event):
+            EventParticipation.objects.create(event=event, student=self.student, completed=True, completed_at=timezone.now())
+        Feedback.objects.create(event=quiz_event, student=self.student, rating=4)
+        Feedback.objects.create(event=game_event, student=self.student, comment='ok')
+        merch = Merchandise.objects.create(name='Cap', merch_type='CAP', points_cost=30, stock_quantity=5)
+        MerchOrder.objects.create(student=self.student, merchandise=merch, points_spent=30, notes='у двери')
+        self.renderer = JSONRenderer()
+
+    def assert_same_bytes(self, fast, serializer_class, queryset):
+        self.assertEqual(fast.render(queryset), self.renderer.render(serializer_class(queryset, many=True).data))
+
+    def test_output_matches_drf_serializers(self):
+        for tz in ('UTC', 'Europe/Moscow'):
+            with timezone.override(tz):
+                self.assert_same_bytes(fast_events, EventSerializer, Event.objects.order_by('id'))
+                self.assert_same_bytes(fast_feedback, FeedbackSerializer, Feedback.objects.order_by('-created_at'))
+                self.assert_same_bytes(fast_merch_orders, MerchOrderSerializer, MerchOrder.objects.all())
+
+    def test_views_match_slow_path(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        urls = ['/api/my-feedbacks/', '/api/completed-events/', '/api/orders/']
+        fast = [client.get(url).content for url in urls]
+        with mock.patch.object(fast_events, 'enabled', False), \
+                mock.patch.object(fast_feedback, 'enabled', False), \
+                mock.patch.object(fast_merch_orders, 'enabled', False):
+            slow = [client.get(url).content for url in urls]
+        self.assertEqual(fast, slow)
+        self.assertEqual(len(json.loads(fast[1])['events']), 1)
@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .accounts import normalize_phone
+from .instrumentation import metrics
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'30/min' -> (емкость бакета, секунд на один токен)"""
+    count, period = rate.split('/')
+    count = int(count)
+    if count <= 0:
+        raise ValueError(f'Некорректный лимит {rate!r}')
+    return count, PERIODS[period] / count
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket по алгоритму GCRA: для ключа хранится одно число - момент,
+    когда бакет снова наполнится (TAT). Запрос проходит, если до этого
+    момента осталось не больше емкости бакета, и сдвигает TAT на время
+    одного токена. Проверка - несколько арифметических операций без БД.
+
+    Хранилище: словарь процесса (alias=None, у каждого воркера свои бакеты,
+    не больше max_keys - давно не использованные вытесняются)
+    или кеш из CACHES для общих лимитов нескольких воркеров. В общем кеше
+    чтение и запись не атомарны, при гонке запрос может пройти сверх лимита.
+    """
+
+    def __init__(self, rates=None, alias=None, max_keys=100_000, enabled=True):
+        self.rates = self._parse_rates(rates)
+        self.alias = alias
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._shed = Counter()
+
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'THROTTLING', {})
+        return cls(
+            rates=options.get('RATES', {}),
+            alias=options.get('ALIAS'),
+            max_keys=options.get('MAX_KEYS', 100_000),
+            enabled=options.get('ENABLED', True)
+        )
+
+    @staticmethod
+    def _parse_rates(rates):
+        return {
+            scope: {bucket: parse_rate(rate) for bucket, rate in buckets.items()}
+            for scope, buckets in (rates or {}).items()
+        }
+
+    def hit(self, key, rate):
+        """Списывает токен; возвращает 0 или сколько секунд ждать следующего"""
+        return self.hit_all([(key, rate)])[0]
+
+    def hit_all(self, hits):
+        """
+        Списывает по токену из каждого бакета hits - [(ключ, лимит)], только
+        если запрос пропускают все. Возвращает (0, None) или (секунд ждать,
+        номер первого отказавшего бакета); при отказе токены не списываются.
+        """
+        now = time.monotonic() if self.alias is None else time.time()
+        if self.alias is not None:
+            return self._hit_shared(hits, now)
+        with self._lock:
+            tats = []
+            for index, (key, (capacity, interval)) in enumerate(hits):
+                tat = max(self._buckets.get(key, now), now)
+                wait = tat - now - (capacity - 1) * interval
+                if wait > 0:
+                    return wait, index
+                tats.append(tat + interval)
+            for (key, _), tat in zip(hits, tats):
+                self._buckets[key] = tat
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0, None
+
+    def _hit_shared(self, hits, now):
+        backend = caches[self.alias]
+        keys = [f'throttle:{key}' for key, _ in hits]
+        stored = backend.get_many(keys)
+        tats = {}
+        for index, (key, (_, (capacity, interval))) in enumerate(zip(keys, hits)):
+            tat = max(stored.get(key, now), now)
+            wait = tat - now - (capacity - 1) * interval
+            if wait > 0:
+                return wait, index
+            tats[key] = tat + interval
+        for key, tat in tats.items():
+            backend.set(key, tat, int(tat - now) + 1)
+        return 0, None
+
+    def record_shed(self, scope, bucket):
+        with self._lock:
+            self._shed[scope, bucket] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._shed), len(self._buckets)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._shed.clear()
+
+    @contextmanager
+    def disabled(self):
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    @contextmanager
+    def overridden(self, rates):
+        """Временно другие лимиты со своими бакетами процесса - для замеров"""
+        with self._lock:
+            previous = self.rates, self._buckets
+            self.rates, self._buckets = self._parse_rates(rates), OrderedDict()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.rates, self._buckets = previous
+
+
+rate_limiter = TokenBucketLimiter.from_settings()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Троттлинг по атрибуту представления throttle_scope и бакетам
+    THROTTLING['RATES'][scope]: 'user' - по пользователю (аноним - по IP),
+    'ip' - по адресу клиента (REMOTE_ADDR; X-Forwarded-For учитывается только
+    при заданном NUM_PROXIES), 'phone' - по телефону из тела запроса вместе с
+    адресом (вход из-за общего NAT не делит один бакет на всех). Токен
+    списывается, только если запрос пропускают все бакеты scope.
+    Представления без throttle_scope не ограничиваются.
+    При отказе DRF отвечает 429 с заголовком Retry-After.
+    """
+
+    def __init__(self):
+        self.wait_time = None
+
+    def allow_request(self, request, view):
+        limiter = rate_limiter
+        buckets = limiter.rates.get(getattr(view, 'throttle_scope', None))
+        if not buckets or not limiter.enabled:
+            return True
+        scope = view.throttle_scope
+        ip = self.get_ident(request)
+        hits = [(self.bucket_key(request, scope, bucket, ip), rate) for bucket, rate in buckets.items()]
+        wait, rejected = limiter.hit_all(hits)
+        if wait:
+            self.wait_time = wait
+            limiter.record_shed(scope, list(buckets)[rejected])
+            return False
+        return True
+
+    def bucket_key(self, request, scope, bucket, ip):
+        if bucket == 'user' and request.user and request.user.is_authenticated:
+            return f'{scope}:user:{request.user.pk}'
+        if bucket == 'phone':
+            phone = request.data.get('phone') if isinstance(request.data, dict) else None
+            phone = normalize_phone(phone) if isinstance(phone, str) else None
+            return f'{scope}:phone:{phone or ""}:{ip}'
+        return f'{scope}:{bucket}:{ip}'
+
+    def wait(self):
+        return self.wait_time
+
+
+def _throttling_metrics():
+    shed, buckets = rate_limiter.stats()
+    samples = [
+        ('throttled_requests_total', 'Requests rejected with 429 by scope and bucket', 'counter',
+         {'scope': scope, 'bucket': bucket}, count)
+        for (scope, bucket), count in sorted(shed.items())
+    ]
+    samples.append(('throttle_buckets', 'Token buckets held in this process', 'gauge', None, buckets))
+    return samples
+
+
+metrics.register_collector(_throttling_metrics)
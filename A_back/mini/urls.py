@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
@@ -9,10 +9,14 @@ urlpatterns = [
     path('events/<int:pk>/', views.EventDetailView.as_view(), name='event-detail'),
     path('events/<int:event_id>/start/', views.StartEventView.as_view(), name='start-event'),
     path('events/<int:event_id>/submit-quiz/', views.SubmitQuizView.as_view(), name='submit-quiz'),
+    path('events/submit-quiz/batch/', views.BatchSubmitQuizView.as_view(), name='submit-quiz-batch'),
+    path('events/<int:event_id>/checkin-token/', views.CheckinTokenView.as_view(), name='checkin-token'),
+    path('checkin/', views.CheckinView.as_view(), name='checkin'),
     path('events/<int:event_id>/feedback/', views.FeedbackView.as_view(), name='submit-feedback'),
     
     path('analytics/', views.ManagerAnalyticsView.as_view(), name='manager-analytics'),
     path('analytics/<int:event_id>/', views.ManagerAnalyticsView.as_view(), name='event-analytics'),
+    path('exports/<slug:dataset>.<slug:fmt>', views.ExportView.as_view(), name='export'),
     
     # Мерч
     path('merchandise/', views.MerchandiseListView.as_view(), name='merchandise-list'),
@@ -24,4 +28,20 @@ urlpatterns = [
     # Обратная связь
     path('completed-events/', views.CompletedEventsView.as_view(), name='completed-events'),
     path('my-feedbacks/', views.MyFeedbacksView.as_view(), name='my-feedbacks'),
+    path('my-activity/', views.ActivityView.as_view(), name='my-activity'),
+    
+    # Баллы и рейтинг
+    path('points-history/', views.PointsHistoryView.as_view(), name='points-history'),
+    path('points-history/balance/', views.BalanceAtView.as_view(), name='balance-at'),
+    path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
+    
+    # Асинхронные версии самых нагруженных эндпоинтов (для запуска под ASGI)
+    path('async/events/', async_views.AsyncEventListView.as_view(), name='async-event-list'),
+    path('async/events/<int:pk>/', async_views.AsyncEventDetailView.as_view(), name='async-event-detail'),
+    path('async/events/<int:event_id>/start/', async_views.AsyncStartEventView.as_view(), name='async-start-event'),
+    path('async/events/<int:event_id>/submit-quiz/', async_views.AsyncSubmitQuizView.as_view(), name='async-submit-quiz'),
+    
+    # Служебное
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
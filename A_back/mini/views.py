@@ -1,16 +1,40 @@
+import datetime
+import hmac
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.utils.urls import replace_query_param
 from django.utils import timezone
-from django.db import models
+from django.utils.dateparse import parse_datetime
+from django.db import models, IntegrityError
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from .models import CustomUser, Event, Quiz, QuizQuestion, QuizAnswer, EventParticipation, Feedback, Minigame, PointTransaction, Merchandise, MerchOrder
-from .serializers import UserSerializer, EventSerializer, QuizSerializer, FeedbackSerializer, MinigameSerializer, MerchandiseSerializer, MerchOrderSerializer
+from .serializers import UserSerializer, EventSerializer, EventListSerializer, QuizSerializer, FeedbackSerializer, MinigameSerializer, MerchandiseSerializer, MerchOrderSerializer, PointTransactionSerializer
+from . import ledger
+from .pagination import EventCursorPagination, HistoryCursorPagination, PointsHistoryPagination
+from .counters import view_counter
+from . import rollups
+from .leaderboard import leaderboard, usernames
+from .stock import allocator, OutOfStock, AllocationTimeout
+from .content_cache import start_payload_cache
+from .instrumentation import metrics
+from .accounts import normalize_phone, get_or_create_student
+from .authentication import ClaimsRefreshToken
+from .db_router import ReplicaReadMixin
+from .catalog_cache import ConditionalCatalogMixin
+from .fast_serializers import fast_events, fast_feedback, fast_merch_orders
+from . import exports
+from . import activity
+from .submissions import grade_and_record, submit_quiz_batch, BatchError
+from .checkin import checkin_signer, CheckinTokenError
+from .idempotency import defer, idempotent
 from rest_framework.permissions import AllowAny
 
 class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'login'
 
     def create(self, request, *args, **kwargs):
         # Для регистрации теперь нужен только телефон
@@ -41,7 +65,7 @@ class RegisterView(generics.CreateAPIView):
         user.save()
         
         # Генерация JWT токена
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
             'access': str(refresh.access_token),
@@ -50,80 +74,25 @@ class RegisterView(generics.CreateAPIView):
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'login'
     
     def post(self, request):
-        phone = request.data.get('phone', '').strip()
-        
-        # Очищаем телефон от всех символов кроме цифр
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        
-        if not phone_clean or len(phone_clean) < 10:
+        # Нормализуем телефон: только цифры, без 7 или 8 в начале
+        phone_clean = normalize_phone(request.data.get('phone', ''))
+        if not phone_clean:
             return Response({'error': 'Неверный номер телефона'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Нормализуем телефон (убираем 7 или 8 в начале, если есть)
-        if phone_clean.startswith('7') or phone_clean.startswith('8'):
-            phone_clean = phone_clean[1:]
-        
-        # Ищем пользователя по телефону (точное совпадение)
-        user = None
+        # Ищем пользователя по телефону, если не найден - создаем нового студента
+        # В реальной системе здесь была бы отправка SMS-кода
         try:
-            user = CustomUser.objects.get(phone=phone_clean)
-        except CustomUser.DoesNotExist:
-            # Если пользователь не найден, создаем нового студента
-            # В реальной системе здесь была бы отправка SMS-кода
-            try:
-                username = f"user_{phone_clean}"
-                # Проверяем, не существует ли уже пользователь с таким username
-                if CustomUser.objects.filter(username=username).exists():
-                    username = f"user_{phone_clean}_{int(timezone.now().timestamp())}"
-                
-                user = CustomUser.objects.create_user(
-                    username=username,
-                    email=f"{username}@x5.ru",
-                    password=None,  # Без пароля
-                    phone=phone_clean,
-                    user_type='STUDENT'
-                )
-                # Устанавливаем unusable password, так как Django требует пароль
-                user.set_unusable_password()
-                user.save()
-            except Exception as e:
-                # Если ошибка из-за дубликата телефона (race condition), пытаемся найти существующего
-                if 'phone' in str(e).lower() or 'unique' in str(e).lower():
-                    try:
-                        user = CustomUser.objects.get(phone=phone_clean)
-                    except CustomUser.DoesNotExist:
-                        # Пробуем найти по окончанию (на случай разных форматов)
-                        users = CustomUser.objects.filter(phone__endswith=phone_clean)
-                        if users.exists():
-                            user = users.first()
-                        else:
-                            # В крайнем случае используем get_or_create
-                            user, created = CustomUser.objects.get_or_create(
-                                phone=phone_clean,
-                                defaults={
-                                    'username': username,
-                                    'email': f"{username}@x5.ru",
-                                    'user_type': 'STUDENT'
-                                }
-                            )
-                            if created:
-                                user.set_unusable_password()
-                                user.save()
-        except CustomUser.MultipleObjectsReturned:
-            # Если найдено несколько пользователей, берем первого
-            user = CustomUser.objects.filter(phone=phone_clean).first()
+            user, _ = get_or_create_student(phone_clean)
         except Exception as e:
             return Response({'error': f'Ошибка при входе: {str(e)}'}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        if not user:
-            return Response({'error': 'Не удалось найти или создать пользователя'}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
         # Генерируем токены
         try:
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             access_token = str(refresh.access_token)
             refresh_token = str(refresh)
             
@@ -152,9 +121,17 @@ class LoginView(APIView):
                 'traceback': traceback.format_exc() if settings.DEBUG else None
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class EventListView(generics.ListCreateAPIView):
+class EventListView(ReplicaReadMixin, ConditionalCatalogMixin, generics.ListCreateAPIView):
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EventCursorPagination
+    catalog_models = (Event,)
+
+    def get_serializer_class(self):
+        # Список отдается в кратком виде, создание - полным сериализатором
+        if self.request.method == 'GET':
+            return EventListSerializer
+        return EventSerializer
 
     def get_queryset(self):
         # Все пользователи видят активные мероприятия
@@ -165,24 +142,18 @@ class EventListView(generics.ListCreateAPIView):
         serializer.save(manager=self.request.user)
 
 class EventDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Event.objects.all()
+    queryset = EventSerializer.setup_eager_loading(Event.objects.all())
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         event = self.get_object()
-        # Увеличиваем счетчик просмотров
-        event.views_count += 1
-        event.save(update_fields=['views_count'])
+        # Просмотр и запись об участии копятся в буфере и пишутся в БД пачкой
+        view_counter.record(event.id, request.user.id)
+        event.views_count += view_counter.pending_views(event.id)
         
-        # Создаем запись о просмотре
-        EventParticipation.objects.get_or_create(
-            event=event,
-            student=request.user,
-            defaults={'first_viewed': timezone.now()}
-        )
-        
-        return super().get(request, *args, **kwargs)
+        serializer = self.get_serializer(event)
+        return Response(serializer.data)
 
 class StartEventView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -200,99 +171,117 @@ class StartEventView(APIView):
             defaults={'first_viewed': timezone.now()}
         )
         
+        # Содержимое одинаково для всех студентов - берем его из версионного кеша
+        payload = start_payload_cache.get_or_build(event.id, lambda: self.build_payload(event))
+        if payload is None:
+            return Response({'error': 'Invalid event type'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload)
+    
+    @staticmethod
+    def build_payload(event):
         # Возвращаем данные в зависимости от типа мероприятия
         if event.event_type == 'QUIZ':
-            quiz = Quiz.objects.get(event=event)
-            return Response({
+            quiz = Quiz.objects.prefetch_related('questions__answers').get(event=event)
+            return {
                 'event_type': 'QUIZ',
                 'quiz': QuizSerializer(quiz).data
-            })
+            }
         elif event.event_type == 'MINIGAME':
             minigame = Minigame.objects.get(event=event)
-            return Response({
+            return {
                 'event_type': 'MINIGAME',
                 'minigame': MinigameSerializer(minigame).data
-            })
-        
-        return Response({'error': 'Invalid event type'}, status=status.HTTP_400_BAD_REQUEST)
+            }
+        return None
 
 class SubmitQuizView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'submit'
     
+    @idempotent
     def post(self, request, event_id):
         try:
-            event = Event.objects.get(id=event_id, event_type='QUIZ')
-            quiz = Quiz.objects.get(event=event)
-        except (Event.DoesNotExist, Quiz.DoesNotExist):
+            quiz = Quiz.objects.select_related('event').get(event_id=event_id, event__event_type='QUIZ')
+        except Quiz.DoesNotExist:
             return Response({'error': 'Quiz not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        answers = request.data.get('answers', [])
-        correct_count = 0
-        total_questions = quiz.questions.count()
-        
-        # Проверяем ответы
-        for answer_data in answers:
-            question_id = answer_data.get('question_id')
-            answer_id = answer_data.get('answer_id')
-            
-            try:
-                question = QuizQuestion.objects.get(id=question_id, quiz=quiz)
-                answer = QuizAnswer.objects.get(id=answer_id, question=question)
-                
-                if answer.is_correct:
-                    correct_count += 1
-            except (QuizQuestion.DoesNotExist, QuizAnswer.DoesNotExist):
-                continue
-        
-        # Рассчитываем процент
-        score_percent = (correct_count / total_questions) * 100 if total_questions > 0 else 0
-        score = int(score_percent)
-        
-        # Сохраняем результат
-        participation, created = EventParticipation.objects.update_or_create(
-            event=event,
-            student=request.user,
-            defaults={
-                'completed': score_percent >= quiz.passing_score,
-                'score': score,
-                'completed_at': timezone.now() if score_percent >= quiz.passing_score else None
-            }
-        )
-        
-        # Начисляем баллы, если прошел
-        if participation.completed:
-            student_profile = request.user.student_profile
-            student_profile.points += event.points
-            student_profile.save()
-            
-            # Создаем запись о транзакции
-            PointTransaction.objects.create(
-                student=request.user,
-                event=event,
-                points=event.points,
-                transaction_type='EARNED',
-                description=f"Completed event: {event.title}"
-            )
-            
-            # Обновляем счетчик завершений
-            event.completion_count += 1
-            event.save(update_fields=['completion_count'])
-        
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Тело запроса должно быть объектом'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(grade_and_record(request.user, quiz.event, request.data.get('answers', [])))
+
+class BatchSubmitQuizView(APIView):
+    """
+    Пакетная отправка накопленных офлайн результатов квизов. Менеджер (киоск)
+    отправляет за любых студентов по student_id или phone, студент - только
+    за себя. Ответ содержит результат по каждому элементу.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'submit-batch'
+    
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Тело запроса должно быть объектом'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results = submit_quiz_batch(request.data.get('submissions'), request.user)
+        except BatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # Параллельный запрос успел записать те же участия - пакет можно повторить целиком
+            return Response({'error': 'Конфликт с параллельной отправкой, повторите пакет', 'retry': True},
+                           status=status.HTTP_409_CONFLICT)
+        failed = sum(1 for result in results if result['status'] == 'error')
+        return Response({'succeeded': len(results) - failed, 'failed': failed, 'results': results})
+
+class CheckinTokenView(APIView):
+    """Выпуск подписанного токена для QR-кода мероприятия (для менеджеров)"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, event_id):
+        if request.user.user_type != 'MANAGER':
+            return Response({'error': 'Доступно только менеджерам'}, status=status.HTTP_403_FORBIDDEN)
+        if not Event.objects.filter(id=event_id).exists():
+            return Response({'error': 'Event not found'}, status=status.HTTP_404_NOT_FOUND)
+        slot = request.query_params.get('slot', '')
+        try:
+            ttl = int(request.query_params['ttl']) if 'ttl' in request.query_params else None
+            token, expires = checkin_signer.mint(event_id, slot=slot, ttl=ttl)
+        except (ValueError, CheckinTokenError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({
-            'score': score,
-            'total_questions': total_questions,
-            'correct_count': correct_count,
-            'passed': participation.completed,
-            'points_earned': event.points if participation.completed else 0,
-            'current_points': request.user.student_profile.points
+            'event_id': event_id,
+            'slot': slot,
+            'token': token,
+            'expires_at': datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc)
         })
 
+class CheckinView(APIView):
+    """
+    Чекин по отсканированному QR-коду. Токен проверяется по подписи, а
+    участие ставится в буфер и записывается пачкой, поэтому запрос не
+    обращается к БД (кроме периодического сброса буфера).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        if request.user.user_type != 'STUDENT':
+            return Response({'error': 'Чекин доступен только студентам'}, status=status.HTTP_403_FORBIDDEN)
+        token = request.data.get('token') if isinstance(request.data, dict) else None
+        if not isinstance(token, str):
+            return Response({'error': 'Не передан token'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            event_id, slot = checkin_signer.verify(token)
+        except CheckinTokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        view_counter.record_participant(event_id, request.user.id)
+        return Response({'status': 'accepted', 'event_id': event_id, 'slot': slot},
+                        status=status.HTTP_202_ACCEPTED)
+
 class FeedbackView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request, event_id):
         try:
-            event = Event.objects.get(id=event_id)
+            # Мероприятие вложено в ответ, поэтому грузим его сразу с квизом
+            event = EventSerializer.setup_eager_loading(Event.objects.all()).get(id=event_id)
         except Event.DoesNotExist:
             return Response({'error': 'Event not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -320,126 +309,172 @@ class FeedbackView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class CompletedEventsView(APIView):
-    """Получить список завершенных мероприятий студента"""
+    """Получить список завершенных мероприятий студента, на которые еще нет отзыва"""
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = HistoryCursorPagination
     
     def get(self, request):
-        # Получаем все завершенные мероприятия пользователя
+        # Отзывы отсекаются в том же запросе (анти-join), страница - по индексу
         participations = EventParticipation.objects.filter(
             student=request.user,
             completed=True
-        ).select_related('event')
-        
-        events = [participation.event for participation in participations]
-        
-        # Исключаем мероприятия, на которые уже оставлен отзыв
-        events_with_feedback = Feedback.objects.filter(
-            student=request.user
-        ).values_list('event_id', flat=True)
-        
-        events = [event for event in events if event.id not in events_with_feedback]
-        
+        ).filter(
+            ~models.Exists(Feedback.objects.filter(
+                student_id=models.OuterRef('student_id'), event_id=models.OuterRef('event_id')
+            ))
+        )
+        paginator = self.pagination_class()
+        if fast_events.enabled:
+            # Строки страницы - сразу колонки мероприятия из того же запроса
+            page = paginator.paginate_queryset(
+                participations.values('id', *fast_events.columns('event__')), request, view=self
+            )
+            events = fast_events.serialize(page, prefix='event__')
+        else:
+            participations = EventSerializer.setup_eager_loading(participations.select_related('event'), prefix='event__')
+            page = paginator.paginate_queryset(participations, request, view=self)
+            events = EventSerializer([participation.event for participation in page], many=True).data
         return Response({
-            'events': EventSerializer(events, many=True).data
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'events': events
         })
 
+class ActivityView(APIView):
+    """Лента активности студента: участия, отзывы и операции с баллами, новые сначала"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        paginator = HistoryCursorPagination()
+        limit = paginator.get_page_size(request)
+        try:
+            items, next_cursor = activity.get_page(
+                request.user.id, cursor=request.query_params.get('cursor'), limit=limit
+            )
+        except activity.InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        next_link = None
+        if next_cursor is not None:
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_link, 'results': items})
+
 class MyFeedbacksView(APIView):
     """Получить все отзывы студента"""
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
         feedbacks = Feedback.objects.filter(student=request.user).order_by('-created_at')
+        if fast_feedback.enabled:
+            return Response({'feedbacks': fast_feedback.data(feedbacks)})
+        feedbacks = EventSerializer.setup_eager_loading(feedbacks.select_related('event'), prefix='event__')
         return Response({
             'feedbacks': FeedbackSerializer(feedbacks, many=True).data
         })
 
-class ManagerAnalyticsView(APIView):
+class ManagerAnalyticsView(ReplicaReadMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, event_id=None):
         if event_id:
             # Аналитика по конкретному мероприятию
             try:
-                event = Event.objects.get(id=event_id)
+                event = EventSerializer.setup_eager_loading(Event.objects.all()).get(id=event_id)
             except Event.DoesNotExist:
                 return Response({'error': 'Event not found'}, 
                                status=status.HTTP_404_NOT_FOUND)
             
-            participants = EventParticipation.objects.filter(event=event)
-            completed = participants.filter(completed=True)
+            # Счетчики берутся из инкрементально поддерживаемой сводки
+            stats = rollups.get_event_stats(event.id)
+            participants_count = stats.participants_count
+            completed_count = stats.completed_count
             
             return Response({
                 'event': EventSerializer(event).data,
                 'total_views': event.views_count,
-                'total_participants': participants.count(),
-                'completed_count': completed.count(),
-                'completion_rate': f"{(completed.count() / participants.count() * 100):.1f}%" if participants.count() > 0 else "0%",
-                'average_score': completed.aggregate(models.Avg('score'))['score__avg'] or 0,
-                'feedback_count': Feedback.objects.filter(event=event).count(),
+                'total_participants': participants_count,
+                'completed_count': completed_count,
+                'completion_rate': f"{(completed_count / participants_count * 100):.1f}%" if participants_count > 0 else "0%",
+                'average_score': stats.score_total / completed_count if completed_count > 0 else 0,
+                'feedback_count': stats.feedback_count,
                 'recent_feedbacks': FeedbackSerializer(
-                    Feedback.objects.filter(event=event).order_by('-created_at')[:5], 
+                    EventSerializer.setup_eager_loading(
+                        Feedback.objects.filter(event=event).select_related('event'), prefix='event__'
+                    ).order_by('-created_at')[:5], 
                     many=True
                 ).data
             })
         
-        # Аналитика по всем мероприятиям
-        events = Event.objects.all()
-        total_events = events.count()
-        total_views = events.aggregate(models.Sum('views_count'))['views_count__sum'] or 0
-        total_completions = events.aggregate(models.Sum('completion_count'))['completion_count__sum'] or 0
-        
-        # Метрики по квизам
-        quiz_events = events.filter(event_type='QUIZ')
-        quiz_participations = EventParticipation.objects.filter(
-            event__in=quiz_events
-        )
-        
-        total_quiz_attempts = quiz_participations.count()
-        successful_quiz_attempts = quiz_participations.filter(completed=True).count()
-        failed_quiz_attempts = quiz_participations.filter(completed=False).count()
-        
-        # Количество новых пользователей (студентов, зарегистрированных впервые)
-        # Можно считать всех студентов или только тех, кто участвовал в мероприятиях менеджера
-        students_participated = CustomUser.objects.filter(
-            participations__event__in=events
-        ).distinct().count()
-        
-        # Общее количество пользователей в системе
-        total_students = CustomUser.objects.count()
+        # Аналитика по всем мероприятиям (из глобальной сводки)
+        stats = rollups.get_global_stats()
+        total_views = stats.total_views
+        total_completions = stats.total_completions
         
         return Response({
-            'total_events': total_events,
+            'total_events': stats.total_events,
             'total_views': total_views,
             'total_completions': total_completions,
             'average_completion_rate': f"{(total_completions / total_views * 100):.1f}%" if total_views > 0 else "0%",
-            'recent_events': EventSerializer(events.order_by('-created_at')[:5], many=True).data,
+            'recent_events': EventSerializer(
+                EventSerializer.setup_eager_loading(Event.objects.order_by('-created_at')[:5]), many=True
+            ).data,
             # Метрики по квизам
-            'total_quiz_attempts': total_quiz_attempts,
-            'successful_quiz_attempts': successful_quiz_attempts,
-            'failed_quiz_attempts': failed_quiz_attempts,
+            'total_quiz_attempts': stats.quiz_attempts,
+            'successful_quiz_attempts': stats.successful_quiz_attempts,
+            'failed_quiz_attempts': stats.quiz_attempts - stats.successful_quiz_attempts,
             # Метрики по пользователям
-            'total_students': total_students,
-            'students_participated': students_participated
+            'total_students': stats.total_users,
+            'students_participated': stats.students_participated
         })
 
-class MerchandiseListView(generics.ListAPIView):
+class PointsHistoryView(generics.ListAPIView):
+    """История начислений и списаний баллов студента"""
+    serializer_class = PointTransactionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PointsHistoryPagination
+    
+    def get_queryset(self):
+        return PointTransaction.objects.filter(student=self.request.user).select_related('event')
+
+class BalanceAtView(APIView):
+    """Баланс студента на заданный момент (?at=ISO 8601)"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            # parse_datetime возвращает None для другого формата и бросает
+            # ValueError для несуществующей даты (2024-02-30)
+            moment = parse_datetime(request.query_params.get('at', ''))
+        except ValueError:
+            moment = None
+        if moment is None:
+            return Response({'error': 'Параметр at должен быть датой-временем в формате ISO 8601'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return Response({'at': moment, 'balance': ledger.balance_at(request.user.id, moment)})
+
+class MerchandiseListView(ReplicaReadMixin, ConditionalCatalogMixin, generics.ListAPIView):
     """Список доступного мерча"""
     serializer_class = MerchandiseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    catalog_models = (Merchandise,)
     
     def get_queryset(self):
         return Merchandise.objects.filter(is_available=True)
 
-class MerchandiseDetailView(generics.RetrieveAPIView):
+class MerchandiseDetailView(ReplicaReadMixin, ConditionalCatalogMixin, generics.RetrieveAPIView):
     """Детали конкретного мерча"""
     queryset = Merchandise.objects.filter(is_available=True)
     serializer_class = MerchandiseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    catalog_models = (Merchandise,)
 
 class PurchaseMerchView(APIView):
     """Покупка мерча за баллы"""
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'purchase'
     
+    @idempotent
     def post(self, request, merch_id):
         if request.user.user_type != 'STUDENT':
             return Response({'error': 'Только студенты могут покупать мерч'}, 
@@ -456,52 +491,45 @@ class PurchaseMerchView(APIView):
             return Response({'error': 'Количество должно быть больше 0'}, 
                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Проверяем наличие на складе
-        if merchandise.stock_quantity < quantity:
-            return Response({'error': f'Недостаточно товара на складе. Доступно: {merchandise.stock_quantity}'}, 
+        # Остаток проверяется и списывается атомарно вместе с баллами и заказом
+        try:
+            return self.purchase_response(lambda: allocator.purchase(
+                request.user,
+                merchandise,
+                quantity,
+                delivery_address=request.data.get('delivery_address', ''),
+                phone=request.data.get('phone', request.user.phone),
+                notes=request.data.get('notes', '')
+            ))
+        except AllocationTimeout as e:
+            if e.started:
+                # Заказ может быть оформлен - не 5xx, чтобы повтор с тем же
+                # Idempotency-Key не создал второй заказ. Итог заказа
+                # сохраняется под ключом, когда очередь его выполнит
+                response = Response({'error': 'Заказ еще обрабатывается, проверьте список заказов'},
+                                    status=status.HTTP_202_ACCEPTED)
+                return defer(response, e.future, lambda future: self.purchase_response(future.result))
+            return Response({'error': 'Сервис перегружен, попробуйте позже'}, 
+                           status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @staticmethod
+    def purchase_response(purchase):
+        """Ответ по результату purchase() - (заказ, транзакция) или ошибка покупки"""
+        try:
+            order, point_transaction = purchase()
+        except OutOfStock as e:
+            return Response({'error': f'Недостаточно товара на складе. Доступно: {e.available}'}, 
                            status=status.HTTP_400_BAD_REQUEST)
-        
-        student_profile = request.user.student_profile
-        total_cost = merchandise.points_cost * quantity
-        
-        # Проверяем, достаточно ли баллов
-        if student_profile.points < total_cost:
+        except ledger.InsufficientPoints as e:
             return Response({
                 'error': 'Недостаточно баллов',
-                'required': total_cost,
-                'available': student_profile.points
+                'required': e.required,
+                'available': e.available
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Создаем заказ
-        order = MerchOrder.objects.create(
-            student=request.user,
-            merchandise=merchandise,
-            quantity=quantity,
-            points_spent=total_cost,
-            delivery_address=request.data.get('delivery_address', ''),
-            phone=request.data.get('phone', request.user.phone),
-            notes=request.data.get('notes', '')
-        )
-        
-        # Списываем баллы
-        student_profile.points -= total_cost
-        student_profile.save()
-        
-        # Уменьшаем количество на складе
-        merchandise.stock_quantity -= quantity
-        merchandise.save()
-        
-        # Создаем запись о транзакции
-        PointTransaction.objects.create(
-            student=request.user,
-            points=-total_cost,
-            transaction_type='SPENT',
-            description=f"Покупка мерча: {merchandise.name} x{quantity}"
-        )
-        
         return Response({
             'order': MerchOrderSerializer(order).data,
-            'remaining_points': student_profile.points,
+            'remaining_points': point_transaction.balance_after,
             'message': 'Заказ успешно создан'
         }, status=status.HTTP_201_CREATED)
 
@@ -512,7 +540,12 @@ class MerchOrderListView(generics.ListAPIView):
     
     def get_queryset(self):
         # Все пользователи видят свои заказы
-        return MerchOrder.objects.filter(student=self.request.user)
+        return MerchOrder.objects.filter(student=self.request.user).select_related('student', 'merchandise')
+
+    def list(self, request, *args, **kwargs):
+        if fast_merch_orders.enabled:
+            return Response(fast_merch_orders.data(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
 
 class MerchOrderDetailView(generics.RetrieveAPIView):
     """Детали заказа"""
@@ -521,4 +554,95 @@ class MerchOrderDetailView(generics.RetrieveAPIView):
     
     def get_queryset(self):
         # Все пользователи видят свои заказы
-        return MerchOrder.objects.filter(student=self.request.user)
+        return MerchOrder.objects.filter(student=self.request.user).select_related('student', 'merchandise')
+
+class LeaderboardView(APIView):
+    """Рейтинг студентов: топ и место текущего пользователя"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        window = request.query_params.get('window')
+        event_id = request.query_params.get('event')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            event_id = int(event_id) if event_id else None
+        except ValueError:
+            return Response({'error': 'Неверные параметры запроса'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if window and window not in leaderboard.WINDOWS:
+            return Response({'error': f'Неизвестное окно: {window}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if window or event_id:
+            index = leaderboard.window_index(window, event_id)
+        else:
+            index = leaderboard.index()
+        
+        page = index.top(limit, offset)
+        names = usernames([user_id for _, user_id, _ in page])
+        rank = index.rank(request.user.id)
+        
+        return Response({
+            'window': window or 'all',
+            'event': event_id,
+            'total': len(index),
+            'results': [
+                {'rank': place, 'user_id': user_id, 'username': names.get(user_id), 'points': points}
+                for place, user_id, points in page
+            ],
+            'me': {'rank': rank, 'points': index.points(request.user.id)} if rank else None
+        })
+
+class CacheStatsView(APIView):
+    """Счетчики попаданий кеша содержимого мероприятий (для менеджеров)"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        if request.user.user_type != 'MANAGER':
+            return Response({'error': 'Доступно только менеджерам'}, status=status.HTTP_403_FORBIDDEN)
+        return Response({'start_payload': start_payload_cache.stats()})
+
+class ExportView(APIView):
+    """
+    Потоковая выгрузка сырых данных для менеджеров (CSV или NDJSON): менеджер
+    получает только записи своих мероприятий, все данные - персонал (is_staff)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, dataset, fmt):
+        if request.user.user_type != 'MANAGER':
+            return Response({'error': 'Доступно только менеджерам'}, status=status.HTTP_403_FORBIDDEN)
+        params = request.query_params
+        try:
+            rows = exports.build_rows(
+                dataset,
+                event=params.get('event'),
+                manager=params.get('manager'),
+                date_from=params.get('date_from'),
+                date_to=params.get('date_to'),
+                owner=None if request.user.is_staff else request.user.pk
+            )
+            content = exports.stream(dataset, fmt, rows)
+        except exports.ExportForbidden as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except exports.ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(content, content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
+class MetricsView(APIView):
+    """
+    Гистограммы запросов по имени URL в текстовом формате Prometheus. Доступ -
+    по токену INSTRUMENTATION['METRICS_TOKEN'], без токена эндпоинт выключен (404).
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        token = getattr(settings, 'INSTRUMENTATION', {}).get('METRICS_TOKEN')
+        if not token:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -51,10 +51,12 @@ api.interceptors.response.use(
 );
 
 // Новые методы для работы с мероприятиями
-export const getEvents = async () => {
+export const getEvents = async (cursor) => {
   try {
-    const response = await api.get("/api/events/");
-    return response.data;
+    // Список мероприятий отдается курсорными страницами: одна страница и ссылка
+    // на следующую (next), следующую страницу список запрашивает по кнопке
+    const response = await api.get(cursor || "/api/events/");
+    return { events: response.data.results, next: response.data.next };
   } catch (error) {
     console.error('Error fetching events:', error);
     throw error;
@@ -91,10 +93,12 @@ export const submitFeedback = async (eventId, feedback) => {
   }
 };
 
-export const getCompletedEvents = async () => {
+export const getCompletedEvents = async (cursor) => {
   try {
-    const response = await api.get('/api/completed-events/');
-    return response.data;
+    // Пройденные мероприятия отдаются курсорными страницами: { events, next },
+    // следующую страницу вызывающий запрашивает по ссылке next
+    const response = await api.get(cursor || "/api/completed-events/");
+    return { events: response.data.events, next: response.data.next };
   } catch (error) {
     console.error('Error fetching completed events:', error);
     throw error;
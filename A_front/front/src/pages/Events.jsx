@@ -7,7 +7,9 @@ import '../styles/Events.css';
 function Events() {
   const [events, setEvents] = useState([]);
   const [filteredEvents, setFilteredEvents] = useState([]);
+  const [next, setNext] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
   const [searchParams] = useSearchParams();
@@ -17,7 +19,8 @@ function Events() {
     const fetchEvents = async () => {
       try {
         const data = await getEvents();
-        setEvents(data);
+        setEvents(data.events);
+        setNext(data.next);
       } catch (err) {
         console.error('Error fetching events:', err);
         if (err.response?.status === 401) {
@@ -35,6 +38,19 @@ function Events() {
     fetchEvents();
   }, []);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await getEvents(next);
+      setEvents(prev => [...prev, ...data.events]);
+      setNext(data.next);
+    } catch (err) {
+      console.error('Error fetching events:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Фильтрация событий по типу
   useEffect(() => {
     if (filterType) {
@@ -102,7 +118,7 @@ function Events() {
         </p>
       </div>
       
-      {(filterType ? filteredEvents : events).length === 0 ? (
+      {(filterType ? filteredEvents : events).length === 0 && !next ? (
         <div className="events-empty">
           <div className="events-empty-icon">📅</div>
           <h3>Нет доступных мероприятий</h3>
@@ -146,6 +162,14 @@ function Events() {
           ))}
         </div>
       )}
+
+      {next && (
+        <div className="events-load-more">
+          <button onClick={loadMore} className="btn btn-secondary" disabled={loadingMore}>
+            {loadingMore ? 'Загрузка...' : 'Показать еще'}
+          </button>
+        </div>
+      )}
       </div>
     </div>
   );
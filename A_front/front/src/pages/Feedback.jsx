@@ -5,6 +5,8 @@ import '../styles/Feedback.css';
 
 function Feedback() {
   const [completedEvents, setCompletedEvents] = useState([]);
+  const [nextEvents, setNextEvents] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [myFeedbacks, setMyFeedbacks] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -24,6 +26,7 @@ function Feedback() {
           getMyFeedbacks()
         ]);
         setCompletedEvents(eventsData.events || []);
+        setNextEvents(eventsData.next);
         setMyFeedbacks(feedbacksData.feedbacks || []);
       } catch (err) {
         console.error('Error fetching data:', err);
@@ -36,6 +39,19 @@ function Feedback() {
     fetchData();
   }, []);
 
+  const loadMoreEvents = async () => {
+    setLoadingMore(true);
+    try {
+      const eventsData = await getCompletedEvents(nextEvents);
+      setCompletedEvents(prev => [...prev, ...(eventsData.events || [])]);
+      setNextEvents(eventsData.next);
+    } catch (err) {
+      console.error('Error fetching completed events:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleEventSelect = (event) => {
     setSelectedEvent(event);
     setFeedbackData({ rating: 5, comment: '' });
@@ -59,6 +75,7 @@ function Feedback() {
         getMyFeedbacks()
       ]);
       setCompletedEvents(eventsData.events || []);
+      setNextEvents(eventsData.next);
       setMyFeedbacks(feedbacksData.feedbacks || []);
       
       setTimeout(() => setSuccess(false), 3000);
@@ -145,6 +162,18 @@ function Feedback() {
                       </div>
                     ))}
                   </div>
+                  {nextEvents && (
+                    <div className="form-actions">
+                      <button
+                        type="button"
+                        className="btn btn-secondary"
+                        onClick={loadMoreEvents}
+                        disabled={loadingMore}
+                      >
+                        {loadingMore ? 'Загрузка...' : 'Показать еще'}
+                      </button>
+                    </div>
+                  )}
                 </div>
 
                 {selectedEvent && (